@@ -0,0 +1,25 @@
+"""
+Acceso a los endpoints que modifican los datos del servidor.
+
+Estan desactivados por defecto (responden 403). Con ADMIN_TOKEN definido se
+habilitan y cada request debe enviar ese valor en el header X-Admin-Token
+(401 si falta o no coincide).
+"""
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+ADMIN_TOKEN_HEADER = 'X-Admin-Token'
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None, alias=ADMIN_TOKEN_HEADER)):
+    """Dependencia de FastAPI para las rutas de administracion"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403,
+                            detail="Endpoint deshabilitado: definir ADMIN_TOKEN en el servidor para habilitarlo")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        raise HTTPException(status_code=401, detail=f"{ADMIN_TOKEN_HEADER} ausente o invalido")
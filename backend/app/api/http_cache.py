@@ -0,0 +1,84 @@
+"""
+Cache HTTP de las respuestas de analitica (ETag + requests condicionales).
+
+Una respuesta GET de analitica depende solo de la version de datos y de sus
+parametros, asi que su ETag se deriva de ambos sin calcular nada: la version
+cargada + la ruta + los filtros en forma canonica (la misma que usa el cache
+de resultados). Si el cliente manda If-None-Match con ese ETag se responde 304
+sin calcular ni serializar. El ETag es debil (W/): identifica el contenido,
+que es el mismo con o sin compresion.
+
+Cache-Control se configura por variables de entorno:
+- CACHE_CONTROL: valor para todas las rutas (default "no-cache", es decir,
+  el navegador guarda la respuesta pero la revalida con el ETag)
+- CACHE_CONTROL_<RUTA>: valor para una ruta, p.ej. CACHE_CONTROL_DEVELOPMENTS
+  (rutas: METRICS, FUNNEL, FUNNEL_TRENDS, COHORTS_HEATMAP, DEVELOPMENTS,
+  FILTER_OPTIONS)
+"""
+
+import hashlib
+import inspect
+import os
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Union
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.api.responses import json_response
+from app.models.schemas import FilterParams
+from app.services.compression import EncodedBody
+from app.services.data_loader import data_loader
+from app.services.result_cache import canonical_filters
+
+ROUTES = ('metrics', 'funnel', 'funnel_trends', 'cohorts_heatmap', 'developments', 'filter_options')
+
+DEFAULT_CACHE_CONTROL = os.environ.get('CACHE_CONTROL', 'no-cache')
+
+CACHE_CONTROL: Dict[str, str] = {
+    route: os.environ.get(f'CACHE_CONTROL_{route.upper()}', DEFAULT_CACHE_CONTROL)
+    for route in ROUTES
+}
+
+
+def make_etag(version: str, route: str, filters: Optional[FilterParams], *extra: Hashable) -> str:
+    params = repr((route, canonical_filters(filters)) + extra)
+    digest = hashlib.sha256(f"{version}:{params}".encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparacion debil de If-None-Match (lista de ETags o "*") contra un ETag W/"..." """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if not candidate.startswith('W/'):
+            candidate = f"W/{candidate}"
+        if candidate == etag:
+            return True
+    return False
+
+
+async def conditional_json(request: Request, route: str, filters: Optional[FilterParams],
+                           compute: Callable[[], Union[EncodedBody, Awaitable[EncodedBody]]],
+                           *extra: Hashable, media_type: str = "application/json") -> Response:
+    """
+    Respuesta JSON con ETag y Cache-Control de la ruta, comprimida segun
+    Accept-Encoding. compute() retorna el cuerpo ya codificado (o un
+    awaitable) y solo se llama si el ETag del cliente no coincide.
+    """
+    headers = {'Cache-Control': CACHE_CONTROL.get(route, DEFAULT_CACHE_CONTROL)}
+    version = data_loader.data_version
+    if version is not None:
+        # Version leida antes de calcular: si cambia mientras tanto, el
+        # cliente recibe un ETag viejo y en la siguiente visita descarga de nuevo
+        headers['ETag'] = make_etag(version, route, filters, *extra)
+        if etag_matches(request.headers.get('if-none-match'), headers['ETag']):
+            return Response(status_code=304, headers=headers)
+
+    body = compute()
+    if inspect.isawaitable(body):
+        body = await body
+    return await json_response(request, body, headers, media_type)
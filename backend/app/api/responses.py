@@ -0,0 +1,90 @@
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.services.compression import COMPRESS_MIN_BYTES, EncodedBody, compress_chunks, compression_stats, negotiate
+from app.services.compute_executor import compute_executor
+from app.services.json_encoding import dumps
+
+# Bytes de NDJSON acumulados antes de enviar un bloque
+NDJSON_CHUNK_BYTES = int(os.environ.get('NDJSON_CHUNK_BYTES', str(16 * 1024)))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class EncodedJSONResponse(Response):
+    """
+    Respuesta con un cuerpo JSON ya codificado (ver json_encoding). Las rutas
+    conservan su response_model para el esquema OpenAPI; al devolver esta
+    respuesta FastAPI no vuelve a validar ni a serializar el resultado.
+    """
+    media_type = "application/json"
+
+
+async def json_response(request: Request, body: EncodedBody, headers: Optional[Dict[str, str]] = None,
+                        media_type: str = "application/json") -> Response:
+    """
+    Respuesta para un cuerpo ya codificado (JSON, o binario con otro
+    media_type), comprimida segun Accept-Encoding: los cuerpos en cache usan
+    su version precomprimida, los demas se comprimen en streaming.
+    """
+    headers = dict(headers or {})
+    headers['Vary'] = 'Accept-Encoding'
+
+    encoding = None
+    if COMPRESS_MIN_BYTES and len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate(request.headers.get('accept-encoding'))
+    if encoding is None:
+        compression_stats.record_response('identity', len(body), len(body))
+        return EncodedJSONResponse(body.raw, headers=headers, media_type=media_type)
+
+    headers['Content-Encoding'] = encoding
+
+    if not body.cached:
+        return StreamingResponse(body.stream(encoding), media_type=media_type, headers=headers)
+
+    if body.has_compressed(encoding):
+        data = body.compressed(encoding)
+    else:
+        # Primera vez para esta version de datos: comprimir fuera del event loop
+        data = await compute_executor.submit(lambda: body.compressed(encoding))
+    compression_stats.record_response(encoding, len(body), len(data))
+    return EncodedJSONResponse(data, headers=headers, media_type=media_type)
+
+
+def _ndjson_chunks(items: Iterable[Any], encoding: Optional[str]) -> Iterator[bytes]:
+    buffer, size, total = [], 0, 0
+    for item in items:
+        line = dumps(item) + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= NDJSON_CHUNK_BYTES:
+            yield b"".join(buffer)
+            total += size
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+        total += size
+    if encoding is None:
+        compression_stats.record_response('identity', total, total, streamed=True)
+
+
+def ndjson_response(request: Request, items: Iterable[Any], headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Respuesta NDJSON (un valor JSON por linea) que codifica los elementos a
+    medida que se iteran y los envia por bloques de NDJSON_CHUNK_BYTES: el
+    cuerpo completo nunca esta en memoria. Starlette itera el generador en su
+    pool de threads, fuera del event loop.
+    """
+    headers = dict(headers or {})
+    headers['Vary'] = 'Accept-Encoding'
+
+    encoding = negotiate(request.headers.get('accept-encoding')) if COMPRESS_MIN_BYTES else None
+    chunks = _ndjson_chunks(items, encoding)
+    if encoding is not None:
+        # El largo total no se conoce de antemano: se comprime siempre
+        headers['Content-Encoding'] = encoding
+        chunks = compress_chunks(chunks, encoding)
+    return StreamingResponse(chunks, media_type=NDJSON_MEDIA_TYPE, headers=headers)
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from app.api.admin_auth import require_admin_token
+from app.models.schemas import DataStatus
+from app.services.data_loader import data_loader
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+
+@router.post("/reload", response_model=DataStatus, status_code=202, dependencies=[Depends(require_admin_token)])
+async def reload_data():
+    """
+    Recarga el Excel fuente en segundo plano. Mientras se construye el nuevo
+    snapshot se sigue respondiendo con el actual; al terminar se reemplaza
+    de forma atomica. Si ya hay una recarga en curso responde 409.
+
+    Requiere ADMIN_TOKEN en el servidor y el header X-Admin-Token (ver README).
+    """
+    if not data_loader.reload():
+        return JSONResponse(status_code=409, content=data_loader.status())
+    return data_loader.status()
+
+
+@router.get("/status", response_model=DataStatus)
+async def get_data_status():
+    """Version de datos cargada y estado de la ultima recarga"""
+    return data_loader.status()
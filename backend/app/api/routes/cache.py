@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+from app.models.schemas import CacheStats, CompressionStats
+from app.services.compression import compression_stats
+from app.services.result_cache import result_cache
+
+router = APIRouter(prefix="/cache", tags=["Cache"])
+
+
+@router.get("/stats", response_model=CacheStats)
+async def get_cache_stats():
+    """
+    Retorna el estado del cache de resultados: entradas, hits/misses,
+    evicciones y la version de datos a la que corresponde.
+    """
+    return result_cache.stats()
+
+
+@router.get("/compression", response_model=CompressionStats)
+async def get_compression_stats():
+    """
+    Bytes servidos sin comprimir y en el cable, y CPU de compresion, por
+    codificacion (identity, gzip, br). `precompressed` cuenta las versiones
+    comprimidas generadas para cuerpos en cache; `streamed` las respuestas
+    comprimidas al vuelo.
+    """
+    return compression_stats.snapshot()
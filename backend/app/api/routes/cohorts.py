@@ -1,35 +1,102 @@
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Request
+from typing import List, Optional
+from app.api.http_cache import conditional_json
+from app.api.responses import NDJSON_MEDIA_TYPE, json_response, ndjson_response
 from app.models.schemas import FilterParams, CohortData, CohortHeatmapData
+from app.services import columnar
 from app.services.cohort_analysis import cohort_service
+from app.services.cohort_pool import cohort_pool
+from app.services.compression import EncodedBody
+from app.services.compute_executor import compute_executor
+from app.services.result_cache import result_cache
 
 router = APIRouter(prefix="/cohorts", tags=["Cohorts"])
 
+# format=columnar|arrow: matriz binaria (ver app/services/columnar.py); el esquema JSON no cambia
+BINARY_RESPONSES = {200: {"content": {
+    media_type: {"schema": {"type": "string", "format": "binary"}} for media_type in columnar.MEDIA_TYPES.values()
+}}}
+# /cohorts acepta ademas format=ndjson: un CohortData por linea, en streaming
+COHORTS_RESPONSES = {200: {"content": {
+    **BINARY_RESPONSES[200]["content"],
+    NDJSON_MEDIA_TYPE: {"schema": {"type": "string"}},
+}}}
 
-@router.post("/", response_model=List[CohortData])
-async def get_cohort_analysis(filters: FilterParams = None):
+
+def _format_query(description: str = "json, columnar o arrow (binario, ver README)"):
+    return Query("json", alias="format", description=description)
+
+
+def _media_type(fmt: str) -> str:
+    if fmt == "json":
+        return "application/json"
+    if fmt not in columnar.available_formats():
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {fmt}")
+    return columnar.MEDIA_TYPES[fmt]
+
+
+async def _cohort_body(kind: str, filters: Optional[FilterParams], stage: Optional[str], fmt: str) -> EncodedBody:
+    """Cuerpo codificado de cohorts o heatmap, desde el cache, el pool de procesos o el pool de threads"""
+    namespace = 'cohorts_heatmap' if kind == 'heatmap' else 'cohorts'
+    extra = (stage,) if kind == 'heatmap' else ()
+    if fmt == 'json':
+        pool_kind = kind
+        if kind == 'heatmap':
+            compute = lambda: cohort_service.get_heatmap_data(filters, stage)
+        else:
+            compute = lambda: cohort_service.calculate_cohorts(filters)
+    else:
+        namespace, pool_kind = f'{namespace}_{fmt}', f'{kind}:{fmt}'
+        compute = lambda: cohort_service.encode_binary(kind, fmt, filters, stage)
+
+    if cohort_pool.handles(filters):
+        # Filtros por mes/fechas: calcular en el pool de procesos
+        return await result_cache.get_or_await(namespace, filters, lambda: cohort_pool.calculate(
+            pool_kind, filters, fallback=compute, stage=stage if kind == 'heatmap' else None
+        ), *extra, encoded=True)
+    return await result_cache.get_or_compute_async(namespace, filters, compute, *extra, encoded=True)
+
+
+@router.post("/", response_model=List[CohortData], responses=COHORTS_RESPONSES)
+async def get_cohort_analysis(request: Request, filters: FilterParams = None,
+                              fmt: str = _format_query("json, ndjson (un cohort por linea, en streaming), "
+                                                       "columnar o arrow (binario, ver README)")):
     """
     Retorna análisis de cohorts semanales.
     Cada cohort representa una "cosecha" semanal de leads
     y su progresión a través del funnel en semanas subsiguientes.
+
+    Con `format=ndjson` los cohorts se envían uno por línea a medida que se
+    generan, sin armar la lista completa.
     """
-    return cohort_service.calculate_cohorts(filters)
+    if fmt == "ndjson":
+        # El tensor filtrado se resuelve en el pool de threads; los cohorts se generan al enviarse
+        cohorts = await compute_executor.submit(lambda: cohort_service.iter_cohorts(filters))
+        return ndjson_response(request, cohorts)
+
+    media_type = _media_type(fmt)
+    return await json_response(request, await _cohort_body('cohorts', filters, None, fmt), media_type=media_type)
 
 
-@router.post("/heatmap", response_model=CohortHeatmapData)
-async def get_cohort_heatmap(filters: FilterParams = None, stage: str = "contacto"):
+@router.post("/heatmap", response_model=CohortHeatmapData, responses=BINARY_RESPONSES)
+async def get_cohort_heatmap(request: Request, filters: FilterParams = None, stage: str = "contacto",
+                             fmt: str = _format_query()):
     """
     Retorna datos formateados para heatmap de una etapa específica.
 
     - **filters**: Filtros opcionales (desarrollo, región, año, mes, semana)
     - **stage**: Etapa del funnel (contacto, cita, venta_bruta, escrituracion)
+    - **format**: json (default), o columnar/arrow para la matriz en binario
     """
-    return cohort_service.get_heatmap_data(filters, stage)
+    media_type = _media_type(fmt)
+    return await json_response(request, await _cohort_body('heatmap', filters, stage, fmt), media_type=media_type)
 
 
-@router.get("/heatmap", response_model=CohortHeatmapData)
-async def get_cohort_heatmap_get(stage: str = "contacto"):
+@router.get("/heatmap", response_model=CohortHeatmapData, responses=BINARY_RESPONSES)
+async def get_cohort_heatmap_get(request: Request, stage: str = "contacto", fmt: str = _format_query()):
     """
     GET endpoint para heatmap (sin filtros).
     """
-    return cohort_service.get_heatmap_data(None, stage)
+    media_type = _media_type(fmt)
+    return await conditional_json(request, 'cohorts_heatmap', None, lambda: _cohort_body('heatmap', None, stage, fmt),
+                                  stage, fmt, media_type=media_type)
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Request
+from app.api.responses import json_response
+from app.models.schemas import DashboardRequest, DashboardResponse
+from app.services.compression import EncodedBody
+from app.services.compute_executor import compute_executor
+from app.services.dashboard import dashboard_service
+from app.services.data_loader import data_loader
+from app.services.json_encoding import dumps
+from app.services.result_cache import canonical_filters
+
+router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
+
+
+@router.post("/", response_model=DashboardResponse)
+async def get_dashboard(http_request: Request, request: DashboardRequest = None):
+    """
+    Retorna las secciones del dashboard (metricas, funnel, tendencias, cohorts,
+    heatmap, desarrollos) en una sola respuesta, resolviendo los filtros una vez.
+
+    - **filters**: Filtros opcionales (desarrollo, región, año, mes, semana, fechas)
+    - **sections**: Secciones a incluir (default: todas)
+    - **stage**: Etapa del heatmap (contacto, cita, venta_bruta, escrituracion)
+
+    `timings_ms` reporta el tiempo de cada seccion (casi 0 si vino del cache de resultados).
+    """
+    request = request or DashboardRequest()
+    sections = tuple(sorted({s.value for s in request.sections or ()}))
+    key = ('dashboard', canonical_filters(request.filters), sections, request.stage, data_loader.data_version)
+    body = await compute_executor.run(key, lambda: EncodedBody(dumps(dashboard_service.build(
+        request.filters, request.sections, request.stage
+    ))))
+    return await json_response(http_request, body)
@@ -1,16 +1,26 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from typing import List
+from app.api.http_cache import conditional_json
 from app.models.schemas import DevelopmentLocation
+from app.services.compression import EncodedBody
 from app.services.data_loader import data_loader
+from app.services.json_encoding import dumps
 
 router = APIRouter(prefix="/developments", tags=["Developments"])
 
 
 @router.get("/", response_model=List[DevelopmentLocation])
-async def get_developments():
+async def get_developments(request: Request):
     """
     Retorna lista de desarrollos pre-calculada con ubicación y métricas.
-    Datos cacheados al inicio para respuesta instantánea.
+    Datos cacheados al inicio para respuesta instantánea; el JSON se
+    codifica una vez por versión de datos.
     """
-    cached = data_loader.get_cached_developments()
-    return [DevelopmentLocation(**dev) for dev in cached]
+    return await conditional_json(request, 'developments', None, _encoded_developments)
+
+
+def _encoded_developments() -> EncodedBody:
+    snapshot = data_loader.snapshot
+    return snapshot.encoded('developments', lambda: EncodedBody(dumps(
+        [DevelopmentLocation(**dev) for dev in snapshot.get_cached_developments()]
+    ), cached=True))
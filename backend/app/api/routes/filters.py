@@ -1,17 +1,31 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
+from app.api.http_cache import conditional_json
 from app.models.schemas import FilterOptions
-from app.services.data_loader import data_loader
+from app.services.compact_layout import year_week_values
+from app.services.compression import EncodedBody
+from app.services.data_loader import DataSnapshot, data_loader
+from app.services.json_encoding import dumps
 
 router = APIRouter(prefix="/filters", tags=["Filters"])
 
 
 @router.get("/options", response_model=FilterOptions)
-async def get_filter_options():
+async def get_filter_options(request: Request):
     """
     Retorna las opciones disponibles para los filtros del dashboard.
+    Se calculan una vez por versión de datos.
     """
-    leads_df = data_loader.leads
-    developments_df = data_loader.developments
+    return await conditional_json(request, 'filter_options', None, _encoded_filter_options)
+
+
+def _encoded_filter_options() -> EncodedBody:
+    snapshot = data_loader.snapshot
+    return snapshot.encoded('filter_options', lambda: EncodedBody(dumps(_filter_options(snapshot)), cached=True))
+
+
+def _filter_options(snapshot: DataSnapshot) -> FilterOptions:
+    leads_df = snapshot.leads
+    developments_df = snapshot.developments
 
     # Obtener desarrollos únicos
     desarrollos = []
@@ -39,7 +53,7 @@ async def get_filter_options():
     # Obtener años únicos
     years = []
     if 'year_iso' in leads_df.columns:
-        years = sorted([int(y) for y in leads_df['year_iso'].dropna().unique()])
+        years = sorted([int(y) for y in year_week_values(leads_df['year_iso']).unique()])
 
     # Obtener meses únicos
     months = list(range(1, 13))
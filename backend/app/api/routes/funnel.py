@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from app.api.http_cache import conditional_json
 from typing import Optional, List
 from app.models.schemas import FunnelResponse, FunnelStageData, FilterParams, ConversionTrendResponse
-from app.services.funnel_analysis import FunnelAnalysisService
+from app.services.funnel_analysis import funnel_service
+from app.services.result_cache import result_cache
 
 router = APIRouter(prefix="/funnel", tags=["Funnel"])
 
 
 @router.get("/", response_model=FunnelResponse)
 async def get_funnel(
+    request: Request,
     desarrollos: Optional[str] = Query(None, description="Desarrollos separados por coma"),
     regiones: Optional[str] = Query(None, description="Regiones separadas por coma"),
     year: Optional[int] = Query(None, description="Año"),
@@ -32,13 +35,14 @@ async def get_funnel(
             date_to=date_to
         )
 
-    # Create fresh instance to ensure filters work
-    service = FunnelAnalysisService()
-    return service.calculate_funnel(filters)
+    return await conditional_json(request, 'funnel', filters, lambda: result_cache.get_or_compute_async(
+        'funnel', filters, lambda: funnel_service.calculate_funnel(filters), encoded=True
+    ))
 
 
 @router.get("/trends", response_model=ConversionTrendResponse)
 async def get_funnel_trends(
+    request: Request,
     desarrollos: Optional[str] = Query(None, description="Desarrollos separados por coma"),
     regiones: Optional[str] = Query(None, description="Regiones separadas por coma"),
     year: Optional[int] = Query(None, description="Año"),
@@ -63,5 +67,6 @@ async def get_funnel_trends(
             date_to=date_to
         )
 
-    service = FunnelAnalysisService()
-    return service.calculate_trends(filters)
+    return await conditional_json(request, 'funnel_trends', filters, lambda: result_cache.get_or_compute_async(
+        'funnel_trends', filters, lambda: funnel_service.calculate_trends(filters), encoded=True
+    ))
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.api.admin_auth import require_admin_token
+from app.models.schemas import IngestionResult
+from app.services.data_loader import BuildInProgress, data_loader
+from app.services.lead_ingestion import DELTA_FORMATS, ingestion_service
+
+router = APIRouter(prefix="/ingest", tags=["Ingest"])
+
+
+@router.post("/leads", response_model=IngestionResult, dependencies=[Depends(require_admin_token)])
+async def ingest_leads(request: Request, format: str = "xlsx"):
+    """
+    Aplica un archivo delta de leads nuevos o actualizados (cuerpo crudo del
+    request, Excel o CSV) sin reiniciar el servidor. Si hay una carga,
+    recarga u otra ingesta en curso responde 409.
+
+    Requiere ADMIN_TOKEN en el servidor y el header X-Admin-Token (ver README).
+
+    - **format**: xlsx o csv
+    """
+    if format not in DELTA_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de: {', '.join(DELTA_FORMATS)}")
+
+    content = await request.body()
+    if not content:
+        raise HTTPException(status_code=400, detail="El cuerpo del request esta vacio")
+
+    try:
+        # Leer el delta y reconstruir el snapshot bloquea: se hace fuera del event loop
+        return await run_in_threadpool(ingestion_service.ingest, content, format)
+    except BuildInProgress:
+        return JSONResponse(status_code=409, content=data_loader.status())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
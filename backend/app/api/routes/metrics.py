@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Request
+from app.api.http_cache import conditional_json
 from typing import Optional
 from app.models.schemas import MetricsResponse, FilterParams
-from app.services.metrics_calculator import MetricsCalculatorService
+from app.services.metrics_calculator import metrics_service
+from app.services.result_cache import result_cache
 
 router = APIRouter(prefix="/metrics", tags=["Metrics"])
 
 
 @router.get("/", response_model=MetricsResponse)
 async def get_metrics(
+    request: Request,
     desarrollos: Optional[str] = Query(None, description="Desarrollos separados por coma"),
     regiones: Optional[str] = Query(None, description="Regiones separadas por coma"),
     year: Optional[int] = Query(None, description="Año"),
@@ -31,5 +34,6 @@ async def get_metrics(
             date_to=date_to
         )
 
-    service = MetricsCalculatorService()
-    return service.calculate_metrics(filters)
+    return await conditional_json(request, 'metrics', filters, lambda: result_cache.get_or_compute_async(
+        'metrics', filters, lambda: metrics_service.calculate_metrics(filters), encoded=True
+    ))
@@ -114,3 +114,89 @@ class ConversionTrendPoint(BaseModel):
 class ConversionTrendResponse(BaseModel):
     data: List[ConversionTrendPoint]
     period_type: str  # "monthly" or "weekly"
+
+
+class CacheStats(BaseModel):
+    entries: int
+    max_entries: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+    data_version: Optional[str] = None
+
+
+class IngestionResult(BaseModel):
+    inserted: int
+    updated: int
+    total_leads: int
+    data_version: Optional[str] = None
+    elapsed_ms: float
+
+
+class DataStatus(BaseModel):
+    ready: bool
+    data_version: Optional[str] = None
+    loaded_at: Optional[float] = None
+    total_leads: int
+    reloading: bool
+    load_step: Optional[str] = None
+    last_reload_error: Optional[str] = None
+    watching: bool
+
+
+class ReadinessStatus(BaseModel):
+    status: str  # "ready", "loading" o "error"
+    step: Optional[str] = None
+    steps_done: int
+    steps_total: int
+    elapsed_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class DashboardSection(str, Enum):
+    METRICS = "metrics"
+    FUNNEL = "funnel"
+    TRENDS = "trends"
+    COHORTS = "cohorts"
+    HEATMAP = "heatmap"
+    DEVELOPMENTS = "developments"
+
+
+class DashboardRequest(BaseModel):
+    filters: Optional[FilterParams] = None
+    sections: Optional[List[DashboardSection]] = None  # None = todas
+    stage: str = "contacto"  # etapa del heatmap
+
+
+class DashboardResponse(BaseModel):
+    metrics: Optional[MetricsResponse] = None
+    funnel: Optional[FunnelResponse] = None
+    trends: Optional[ConversionTrendResponse] = None
+    cohorts: Optional[List[CohortData]] = None
+    heatmap: Optional[CohortHeatmapData] = None
+    developments: Optional[List[DevelopmentLocation]] = None
+    data_version: Optional[str] = None
+    timings_ms: Dict[str, float]
+    total_ms: float
+
+
+class EncodingStats(BaseModel):
+    responses: int
+    raw_bytes: int
+    wire_bytes: int
+    precompressed: int
+    streamed: int
+    compress_cpu_ms: float
+    ratio: float
+    cpu_ms_per_response: float
+
+
+class CompressionStats(BaseModel):
+    min_bytes: int
+    encodings: List[str]
+    responses: int
+    raw_bytes: int
+    wire_bytes: int
+    by_encoding: Dict[str, EncodingStats]
@@ -0,0 +1,283 @@
+"""
+Pool de procesos para cohorts filtrados pesados.
+
+Los cohorts filtrados por mes o rango de fechas no salen del tensor por
+desarrollo: se construyen desde las filas y pueden tomar el GIL por varios
+segundos. Con COHORT_PROCESSES=N esos calculos se despachan a N procesos que
+cargan el snapshot de datos al arrancar (con SHARED_DATA=1 lo comparten via
+memory-map), de modo que no compiten por el GIL con el resto del dashboard.
+
+- Cada request tiene un presupuesto de tiempo (COHORT_TIMEOUT). Si se vence
+  mientras el calculo corre, el proceso se termina y se reemplaza por uno
+  nuevo (cancelacion real, no solo dejar de esperar) y se responde 504.
+- Si todos los procesos estan ocupados y ya hay COHORT_QUEUE requests
+  esperando, o la espera agota el presupuesto, se responde 503 con
+  Retry-After.
+- Cada proceso se pone al dia con la version de datos del proceso principal
+  antes de su siguiente calculo: tras una ingesta recibe y aplica los deltas
+  que le faltan, y tras una recarga vuelve a cargar el Excel. Si no puede
+  (p.ej. el Excel en disco ya cambio otra vez) el calculo se hace en el
+  proceso principal.
+
+Configuracion por variables de entorno:
+- COHORT_PROCESSES: procesos del pool (default 0 = desactivado)
+- COHORT_TIMEOUT: segundos por request, incluida la espera (default 30)
+- COHORT_QUEUE: requests que pueden esperar un proceso libre (default 2 x procesos)
+"""
+
+import asyncio
+import math
+import multiprocessing
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from app.models.schemas import FilterParams
+from app.services.cohort_tensor import DevelopmentCohortTensor
+from app.services.compute_executor import compute_executor
+from app.services.data_loader import data_loader
+
+
+class CohortPoolSaturated(Exception):
+    """No hay procesos libres para el calculo"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Pool de cohorts saturado")
+        self.retry_after = retry_after
+
+
+class CohortPoolTimeout(Exception):
+    """El calculo excedio el presupuesto de tiempo del request"""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"El calculo de cohorts excedio {timeout:g}s")
+        self.timeout = timeout
+
+
+# Hash del Excel por (ruta, mtime, tamaño): no se vuelve a leer el archivo si no cambio
+_workbook_hashes: Dict[Tuple[str, int, int], str] = {}
+
+
+def _workbook_hash(path: Path) -> str:
+    from app.services.snapshot_store import file_content_hash
+
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _workbook_hashes:
+        _workbook_hashes.clear()
+        _workbook_hashes[key] = file_content_hash(path)
+    return _workbook_hashes[key]
+
+
+def _sync(base_version: Optional[str], deltas: List[Tuple[pd.DataFrame, str]]):
+    """
+    Pone al dia los datos del proceso: con base_version recarga antes el Excel
+    (si es el que cargo el proceso principal) y luego aplica los deltas en orden.
+    """
+    if base_version is not None and data_loader.data_version != base_version:
+        if _workbook_hash(data_loader.data_path) != base_version:
+            # El Excel en disco no es el que cargo el proceso principal
+            return
+        data_loader.reload(wait=True)
+        if data_loader.data_version != base_version:
+            return
+    for delta_df, source_hash in deltas:
+        data_loader.apply_lead_delta(delta_df, source_hash)
+
+
+def _worker_main(conn):
+    """Loop de un proceso del pool: carga los datos y atiende calculos por el pipe"""
+    from app.services.cohort_analysis import cohort_service
+
+    data_loader.load()
+    conn.send(('ready', None, data_loader.data_version))
+
+    while True:
+        try:
+            kind, filters, stage, version, sync = conn.recv()
+        except EOFError:
+            break
+
+        if sync is not None:
+            try:
+                _sync(*sync)
+            except Exception as e:
+                print(f"Cohort worker could not sync data: {type(e).__name__}: {e}")
+        if version != data_loader.data_version:
+            conn.send(('stale', None, data_loader.data_version))
+            continue
+
+        try:
+            # 'heatmap:columnar', 'cohorts:arrow': resultado ya en formato binario
+            kind, _, fmt = kind.partition(':')
+            if fmt:
+                result = cohort_service.encode_binary(kind, fmt, filters, stage)
+            elif kind == 'heatmap':
+                result = cohort_service.get_heatmap_data(filters, stage)
+            else:
+                result = cohort_service.calculate_cohorts(filters)
+            conn.send(('ok', result, data_loader.data_version))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}", data_loader.data_version))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,),
+                                       name="cohort-worker", daemon=True)
+        self.process.start()
+        child_conn.close()
+        # Version de datos del proceso (la reporta en cada respuesta)
+        self.version: Optional[str] = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class CohortProcessPool:
+    def __init__(self, processes: int = 0, timeout: float = 30, max_queue: Optional[int] = None):
+        self.processes = processes
+        self.timeout = timeout
+        self.max_queue = 2 * processes if max_queue is None else max_queue
+        self._context = None
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers = set()
+        self._waiting = 0
+        # Duracion promedio de un calculo, para sugerir Retry-After
+        self._avg_seconds = 1.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._idle is not None
+
+    def start(self):
+        """Lanza los procesos (llamar desde el event loop, al arrancar la app)"""
+        if self.processes <= 0 or self.enabled:
+            return
+        # spawn: el proceso principal ya tiene threads (carga, pool de calculo)
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = asyncio.Queue()
+        for _ in range(self.processes):
+            self._spawn()
+
+    def stop(self):
+        for worker in list(self._workers):
+            worker.kill()
+        self._workers.clear()
+        self._idle = None
+
+    def _spawn(self):
+        worker = _Worker(self._context)
+        self._workers.add(worker)
+        asyncio.ensure_future(self._wait_ready(worker))
+
+    async def _wait_ready(self, worker: _Worker):
+        loop = asyncio.get_running_loop()
+        try:
+            _, _, worker.version = await loop.run_in_executor(None, worker.conn.recv)
+        except (EOFError, OSError):
+            print("Cohort worker exited while loading data")
+            self._workers.discard(worker)
+            return
+        if self._idle is not None:
+            self._idle.put_nowait(worker)
+
+    def _replace(self, worker: _Worker):
+        worker.kill()
+        self._workers.discard(worker)
+        if self._idle is not None:
+            self._spawn()
+
+    def _retry_after(self) -> int:
+        # Tiempo aproximado hasta que se libere un proceso
+        queued = self._waiting / max(self.processes, 1)
+        return max(1, math.ceil(self._avg_seconds * (1 + queued)))
+
+    def handles(self, filters: Optional[FilterParams]) -> bool:
+        """True si el calculo con estos filtros se despacha al pool"""
+        # Sin procesos vivos (p.ej. fallaron al cargar los datos) se calcula en este proceso
+        return self.enabled and bool(self._workers) and not DevelopmentCohortTensor.supports(filters)
+
+    @staticmethod
+    def _sync_message(snapshot, worker: _Worker):
+        """
+        Lo que le falta al proceso para tener la version del snapshot: None si ya
+        la tiene, (None, deltas) si basta aplicar deltas, o (version del Excel,
+        deltas) si antes debe recargar el Excel.
+        """
+        if worker.version == snapshot.data_version:
+            return None
+        deltas = snapshot.deltas_since(worker.version)
+        if deltas is not None:
+            return None, deltas
+        return snapshot.base_version, snapshot.deltas_since(snapshot.base_version)
+
+    async def _dispatch(self, kind: str, filters: FilterParams, stage: Optional[str]) -> Any:
+        snapshot = data_loader.snapshot
+        version = snapshot.data_version
+        start = time.monotonic()
+
+        if self._idle.empty() and self._waiting >= self.max_queue:
+            raise CohortPoolSaturated(self._retry_after())
+        self._waiting += 1
+        try:
+            worker = await asyncio.wait_for(self._idle.get(), self.timeout)
+        except asyncio.TimeoutError:
+            raise CohortPoolSaturated(self._retry_after())
+        finally:
+            self._waiting -= 1
+
+        loop = asyncio.get_running_loop()
+        remaining = self.timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            # La espera agoto el presupuesto: no enviar el calculo (el proceso sigue sano)
+            self._idle.put_nowait(worker)
+            raise CohortPoolTimeout(self.timeout)
+        try:
+            worker.conn.send((kind, filters, stage, version, self._sync_message(snapshot, worker)))
+            status, value, worker.version = await asyncio.wait_for(
+                loop.run_in_executor(None, worker.conn.recv), remaining
+            )
+        except asyncio.TimeoutError:
+            # El calculo no se puede interrumpir dentro del proceso: reemplazarlo
+            self._replace(worker)
+            raise CohortPoolTimeout(self.timeout)
+        except BaseException:
+            # Proceso caido o request cancelado con el calculo a medias
+            self._replace(worker)
+            raise
+
+        self._idle.put_nowait(worker)
+        elapsed = time.monotonic() - start
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
+
+        if status == 'error':
+            raise RuntimeError(value)
+        if status == 'stale':
+            return None
+        return value
+
+    async def calculate(self, kind: str, filters: FilterParams, fallback: Callable[[], Any],
+                        stage: Optional[str] = None) -> Any:
+        """
+        Calcula `kind` ('cohorts' o 'heatmap', con ':formato' para el resultado
+        en formato binario) en el pool. Si el proceso no pudo ponerse al dia
+        con la version de datos, usa fallback() en el pool de threads.
+        """
+        result = await self._dispatch(kind, filters, stage)
+        if result is None:
+            return await compute_executor.submit(fallback)
+        return result
+
+
+cohort_pool = CohortProcessPool(
+    processes=int(os.environ.get('COHORT_PROCESSES', '0')),
+    timeout=float(os.environ.get('COHORT_TIMEOUT', '30')),
+    max_queue=int(os.environ['COHORT_QUEUE']) if os.environ.get('COHORT_QUEUE') else None
+)
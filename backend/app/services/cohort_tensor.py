@@ -0,0 +1,419 @@
+"""
+Tensor denso de conversiones por cohort.
+
+CohortTensor guarda, para cada cohort (semana de registro), etapa del funnel y
+semana transcurrida desde el inicio del cohort, cuantos leads alcanzaron la
+etapa en esa semana: counts[cohort, etapa, semana]. Se construye en una sola
+pasada codificando (cohort, etapa, semana) como un entero y usando
+np.bincount. Los porcentajes acumulados salen de un cumsum sobre el eje de
+semanas, y CohortData/CohortHeatmapData se derivan del tensor.
+
+DevelopmentCohortTensor agrega un eje por desarrollo para responder filtros
+de desarrollo/region/año/semana sumando rebanadas en lugar de filas.
+CohortPrecalc agrupa los tensores y los cohorts/heatmaps sin filtros de una
+version de datos.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.models.schemas import CohortData, CohortHeatmapData, FilterParams
+from app.services.compact_layout import stage_dates_ns
+
+COHORT_STAGES = ['contacto', 'cita', 'venta_bruta', 'escrituracion']
+
+_DAY_NS = 86_400 * 10**9
+
+# Cohorts por bloque al generar CohortData uno a uno (acota los porcentajes en memoria)
+COHORT_BLOCK_SIZE = 64
+
+
+def cohort_week_start(week_str: str) -> pd.Timestamp:
+    """Lunes de inicio de un cohort 'YYYY-Www'."""
+    try:
+        year, week = week_str.split('-W')
+        dt = datetime.strptime(f'{year}-W{week}-1', '%Y-W%W-%w')
+        return pd.Timestamp(dt)
+    except:
+        return pd.Timestamp.now()
+
+
+def stage_dates(leads_df: pd.DataFrame, stage_columns: Dict[str, Optional[str]]) -> Dict[str, Optional[np.ndarray]]:
+    """Fechas datetime64[ns] por etapa (None si la etapa no tiene columna)."""
+    dates = {}
+    for stage in COHORT_STAGES:
+        col = stage_columns.get(stage)
+        if col and col in leads_df.columns:
+            dates[stage] = stage_dates_ns(leads_df[col])
+        else:
+            dates[stage] = None
+    return dates
+
+
+def _count_tensor(group_codes: np.ndarray, n_groups: int, cohort_weeks: pd.Series,
+                  stage_dates: Dict[str, Optional[np.ndarray]], rows: Optional[np.ndarray]):
+    """
+    Cuenta leads por [grupo, cohort, etapa, semana] en una sola pasada.
+    Retorna (cohort_labels, initial_leads[grupo, cohort], counts, etapas presentes).
+    """
+    codes, labels = pd.factorize(cohort_weeks, sort=True, use_na_sentinel=True)
+    if rows is not None:
+        codes = codes[rows]
+        group_codes = group_codes[rows]
+
+    valid = codes >= 0
+    labels = [str(label) for label in labels]
+    n_cohorts = len(labels)
+    group_codes = group_codes.astype(np.int64)
+    # (grupo, cohort) como un solo indice
+    cell = group_codes * n_cohorts + codes
+    initial_leads = np.bincount(cell[valid], minlength=n_groups * n_cohorts).reshape(n_groups, n_cohorts)
+
+    starts = np.array(
+        [cohort_week_start(label).to_datetime64() for label in labels],
+        dtype='datetime64[ns]'
+    ).view(np.int64)
+
+    cell_idx, stage_idx, week_idx = [], [], []
+    present = []
+    for s, stage in enumerate(COHORT_STAGES):
+        dates = stage_dates.get(stage)
+        if dates is None:
+            continue
+        present.append(stage)
+        if rows is not None:
+            dates = dates[rows]
+
+        reached = valid & ~np.isnat(dates)
+        # Dias completos (floor) desde el inicio del cohort, en semanas
+        days = (dates[reached].view(np.int64) - starts[codes[reached]]) // _DAY_NS
+        weeks = np.clip(days // 7, 0, None)
+
+        cell_idx.append(cell[reached])
+        stage_idx.append(np.full(len(weeks), s, dtype=np.int64))
+        week_idx.append(weeks)
+
+    n_stages = len(COHORT_STAGES)
+    n_cells = n_groups * n_cohorts
+    if cell_idx:
+        cell_idx = np.concatenate(cell_idx)
+        stage_idx = np.concatenate(stage_idx)
+        week_idx = np.concatenate(week_idx)
+    n_weeks = int(week_idx.max()) + 1 if len(cell_idx) else 0
+
+    if n_weeks:
+        flat = (cell_idx * n_stages + stage_idx) * n_weeks + week_idx
+        counts = np.bincount(flat, minlength=n_cells * n_stages * n_weeks)
+    else:
+        counts = np.zeros(0, dtype=np.int64)
+    counts = counts.reshape(n_groups, n_cohorts, n_stages, n_weeks)
+
+    return labels, initial_leads, counts, present
+
+
+def _parse_cohort_label(label: str):
+    """'2024-W05' -> (2024, 5)"""
+    year, week = label.split('-W')
+    return int(year), int(week)
+
+
+class CohortTensor:
+    def __init__(self, cohort_labels: List[str], initial_leads: np.ndarray,
+                 counts: np.ndarray, stages: List[str]):
+        self.cohort_labels = cohort_labels
+        self.initial_leads = initial_leads
+        # counts[cohort, etapa, semana] con etapas en el orden de COHORT_STAGES
+        self.counts = counts
+        # Etapas con columna en los datos
+        self.stages = stages
+
+    @classmethod
+    def empty(cls) -> 'CohortTensor':
+        return cls([], np.zeros(0, dtype=np.int64),
+                   np.zeros((0, len(COHORT_STAGES), 0), dtype=np.int64), [])
+
+    @classmethod
+    def from_counts(cls, cohort_labels: List[str], initial_leads: np.ndarray,
+                    counts: np.ndarray, stages: List[str]) -> 'CohortTensor':
+        """Descarta los cohorts sin leads en la seleccion."""
+        keep = np.flatnonzero(initial_leads)
+        return cls([cohort_labels[i] for i in keep], initial_leads[keep], counts[keep], stages)
+
+    @classmethod
+    def build(cls, cohort_weeks: pd.Series, stage_dates: Dict[str, Optional[np.ndarray]],
+              rows: Optional[np.ndarray] = None) -> 'CohortTensor':
+        """
+        cohort_weeks: columna cohort_week de leads ('YYYY-Www' o nulo)
+        stage_dates: etapa -> fechas datetime64[ns] por lead (None si no hay columna)
+        rows: posiciones de los leads a incluir (None = todos)
+        """
+        groups = np.zeros(len(cohort_weeks), dtype=np.int64)
+        labels, initial_leads, counts, present = _count_tensor(groups, 1, cohort_weeks, stage_dates, rows)
+        return cls.from_counts(labels, initial_leads[0], counts[0], present)
+
+    def percentages(self, rows: slice = slice(None)) -> np.ndarray:
+        """Porcentaje acumulado por [cohort, etapa, semana], redondeado a 2 decimales."""
+        cumulative = np.cumsum(self.counts[rows], axis=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct = cumulative / self.initial_leads[rows][:, None, None] * 100
+        return np.round(pct, 2)
+
+    def iter_cohorts(self, only: Optional[set] = None) -> Iterator[CohortData]:
+        """
+        CohortData por cohort, uno a la vez; `only` limita la salida a esas
+        etiquetas. Los porcentajes se calculan por bloques de cohorts.
+        """
+        stage_indexes = [(stage, COHORT_STAGES.index(stage)) for stage in self.stages]
+        for start in range(0, len(self.cohort_labels), COHORT_BLOCK_SIZE):
+            block = slice(start, start + COHORT_BLOCK_SIZE)
+            pct = None
+            for offset, label in enumerate(self.cohort_labels[block]):
+                if only is not None and label not in only:
+                    continue
+                if pct is None:
+                    pct = self.percentages(block)
+                c = start + offset
+                conversions = {}
+                for stage, s in stage_indexes:
+                    # Solo semanas donde hubo conversiones (como value_counts)
+                    weeks = np.flatnonzero(self.counts[c, s])
+                    if len(weeks) == 0:
+                        continue
+                    conversions[stage] = dict(zip(weeks.tolist(), pct[offset, s, weeks].tolist()))
+
+                # Valores ya con los tipos del esquema (tolist): construir sin validar
+                yield CohortData.model_construct(
+                    cohort_week=label,
+                    initial_leads=int(self.initial_leads[c]),
+                    conversions=conversions
+                )
+
+    def to_cohorts(self, only: Optional[set] = None) -> List[CohortData]:
+        """CohortData por cohort; `only` limita la salida a esas etiquetas."""
+        return list(self.iter_cohorts(only))
+
+    def heatmap_arrays(self, stage: str):
+        """
+        Matriz del heatmap de una etapa como arreglos densos:
+        (n_semanas, pct[cohort, semana], valid[cohort, semana]). Las celdas sin
+        conversiones en esa semana no son validas (None en el JSON).
+        """
+        n_cohorts = len(self.cohort_labels)
+        if not n_cohorts:
+            return 0, np.zeros((0, 0)), np.zeros((0, 0), dtype=bool)
+
+        if stage not in self.stages:
+            # Etapa desconocida o sin columna: una semana sin valores
+            return 1, np.zeros((n_cohorts, 1)), np.zeros((n_cohorts, 1), dtype=bool)
+
+        s = COHORT_STAGES.index(stage)
+        stage_counts = self.counts[:, s, :]
+        active_weeks = np.flatnonzero(stage_counts.any(axis=0))
+        max_weeks = int(active_weeks[-1]) if len(active_weeks) else 0
+
+        stage_counts = stage_counts[:, :max_weeks + 1]
+        pct = self.percentages()[:, s, :max_weeks + 1]
+        if pct.shape[1] < max_weeks + 1:
+            # Tensor sin semanas: una sola columna vacia
+            pct = np.zeros((n_cohorts, 1))
+            stage_counts = np.zeros((n_cohorts, 1), dtype=np.int64)
+
+        return max_weeks + 1, pct, stage_counts > 0
+
+    def heatmap(self, stage: str) -> CohortHeatmapData:
+        n_weeks, pct, valid = self.heatmap_arrays(stage)
+        matrix = np.where(valid, pct, None).tolist()
+
+        # Validar la matriz celda por celda cuesta mas que calcularla: los
+        # valores ya son str/int/float/None de Python
+        return CohortHeatmapData.model_construct(
+            cohort_labels=list(self.cohort_labels),
+            week_labels=list(range(n_weeks)),
+            matrix=matrix,
+            stage=stage
+        )
+
+
+class DevelopmentCohortTensor:
+    """
+    Tensor por desarrollo: counts[desarrollo, cohort, etapa, semana].
+
+    Los leads sin desarrollo se guardan en un grupo extra al final, de modo
+    que la suma sobre todos los grupos es el tensor sin filtros. Filtros de
+    desarrollo, region, año y semana ISO se responden sumando rebanadas.
+    """
+
+    def __init__(self, desarrollos: List[str], region_by_desarrollo: Optional[Dict[str, str]],
+                 cohort_labels: List[str], initial_leads: np.ndarray, counts: np.ndarray,
+                 stages: List[str], has_desarrollo: bool):
+        self.desarrollos = desarrollos
+        self.region_by_desarrollo = region_by_desarrollo
+        self.cohort_labels = cohort_labels
+        self.initial_leads = initial_leads
+        self.counts = counts
+        self.stages = stages
+        self.has_desarrollo = has_desarrollo
+        parsed = [_parse_cohort_label(label) for label in cohort_labels]
+        self._cohort_years = np.array([y for y, _ in parsed], dtype=np.int64)
+        self._cohort_weeks = np.array([w for _, w in parsed], dtype=np.int64)
+
+    @classmethod
+    def build(cls, desarrollo_values: Optional[pd.Series], cohort_weeks: pd.Series,
+              stage_dates: Dict[str, Optional[np.ndarray]],
+              region_by_desarrollo: Optional[Dict[str, str]]) -> 'DevelopmentCohortTensor':
+        if desarrollo_values is not None:
+            dev_codes, desarrollos = pd.factorize(desarrollo_values, use_na_sentinel=True)
+            desarrollos = list(desarrollos)
+        else:
+            dev_codes, desarrollos = np.full(len(cohort_weeks), -1), []
+
+        # Grupo extra (ultimo) para leads sin desarrollo
+        n_groups = len(desarrollos) + 1
+        groups = np.where(dev_codes >= 0, dev_codes, n_groups - 1)
+
+        labels, initial_leads, counts, present = _count_tensor(groups, n_groups, cohort_weeks, stage_dates, None)
+        return cls(desarrollos, region_by_desarrollo, labels, initial_leads.astype(np.int32),
+                   counts.astype(np.int32), present, has_desarrollo=desarrollo_values is not None)
+
+    @staticmethod
+    def supports(filters: Optional[FilterParams]) -> bool:
+        """Mes y rango de fechas dependen de la fecha de registro, no del cohort."""
+        return filters is None or not (filters.month or filters.date_from or filters.date_to)
+
+    def _group_selection(self, filters: Optional[FilterParams]) -> Optional[np.ndarray]:
+        """Indices de grupos seleccionados (None = todos los grupos)"""
+        if filters is None or not self.has_desarrollo:
+            return None
+
+        selected = None
+        if filters.desarrollos:
+            selected = set(filters.desarrollos)
+        if filters.regiones and self.region_by_desarrollo is not None:
+            regiones = set(filters.regiones)
+            in_region = {d for d, r in self.region_by_desarrollo.items() if r in regiones}
+            selected = in_region if selected is None else selected & in_region
+
+        if selected is None:
+            return None
+        return np.array([i for i, d in enumerate(self.desarrollos) if d in selected], dtype=np.int64)
+
+    def select(self, filters: Optional[FilterParams]) -> CohortTensor:
+        groups = self._group_selection(filters)
+        if groups is None:
+            initial_leads = self.initial_leads.sum(axis=0, dtype=np.int64)
+            counts = self.counts.sum(axis=0, dtype=np.int64)
+        else:
+            initial_leads = self.initial_leads[groups].sum(axis=0, dtype=np.int64)
+            counts = self.counts[groups].sum(axis=0, dtype=np.int64)
+
+        # year_iso / week_iso son los del cohort
+        cohorts = np.ones(len(self.cohort_labels), dtype=bool)
+        if filters is not None:
+            if filters.year:
+                cohorts &= self._cohort_years == filters.year
+            if filters.week_iso:
+                cohorts &= self._cohort_weeks == filters.week_iso
+        initial_leads = np.where(cohorts, initial_leads, 0)
+
+        return CohortTensor.from_counts(self.cohort_labels, initial_leads, counts, self.stages)
+
+    def merged(self, other: 'DevelopmentCohortTensor', sign: int = 1) -> 'DevelopmentCohortTensor':
+        """
+        Nuevo tensor con `other` sumado (sign=1) o restado (sign=-1).
+        Los ejes crecen si other trae desarrollos, cohorts o semanas nuevas.
+        """
+        known = set(self.desarrollos)
+        desarrollos = list(self.desarrollos) + [d for d in other.desarrollos if d not in known]
+        labels = sorted(set(self.cohort_labels) | set(other.cohort_labels))
+        stages = [stage for stage in COHORT_STAGES if stage in self.stages or stage in other.stages]
+        n_groups = len(desarrollos) + 1
+        n_weeks = max(self.counts.shape[3], other.counts.shape[3])
+
+        initial_leads = np.zeros((n_groups, len(labels)), dtype=np.int32)
+        counts = np.zeros((n_groups, len(labels), len(COHORT_STAGES), n_weeks), dtype=np.int32)
+        group_of = {d: g for g, d in enumerate(desarrollos)}
+        for tensor, factor in ((self, 1), (other, sign)):
+            # El ultimo grupo de cada tensor es "sin desarrollo"
+            groups = np.array([group_of[d] for d in tensor.desarrollos] + [n_groups - 1], dtype=np.int64)
+            cohorts = np.searchsorted(labels, tensor.cohort_labels)
+            weeks = tensor.counts.shape[3]
+            initial_leads[np.ix_(groups, cohorts)] += factor * tensor.initial_leads
+            counts[np.ix_(groups, cohorts, np.arange(len(COHORT_STAGES)), np.arange(weeks))] += factor * tensor.counts
+
+        return DevelopmentCohortTensor(desarrollos, self.region_by_desarrollo, labels, initial_leads,
+                                       counts, stages, self.has_desarrollo)
+
+
+class CohortPrecalc:
+    """Cohorts pre-calculados de una version de datos (sin filtros) y sus tensores."""
+
+    def __init__(self, dev_tensor: Optional[DevelopmentCohortTensor], tensor: CohortTensor,
+                 cohorts: List[CohortData], heatmaps: Dict[str, CohortHeatmapData]):
+        # dev_tensor es None si los leads no tienen cohort_week
+        self.dev_tensor = dev_tensor
+        self.tensor = tensor
+        self.cohorts = cohorts
+        self.heatmaps = heatmaps
+
+    @staticmethod
+    def _build_dev_tensor(leads_df: pd.DataFrame, desarrollo_col: Optional[str],
+                          stage_columns: Dict[str, Optional[str]],
+                          region_by_desarrollo: Optional[Dict[str, str]]) -> DevelopmentCohortTensor:
+        return DevelopmentCohortTensor.build(
+            leads_df[desarrollo_col] if desarrollo_col else None,
+            leads_df['cohort_week'],
+            stage_dates(leads_df, stage_columns),
+            region_by_desarrollo
+        )
+
+    @classmethod
+    def build(cls, leads_df: pd.DataFrame, desarrollo_col: Optional[str],
+              stage_columns: Dict[str, Optional[str]],
+              region_by_desarrollo: Optional[Dict[str, str]]) -> 'CohortPrecalc':
+        """Pre-calcula todos los cohorts como un tensor cohorts x etapas x semanas"""
+        print("Pre-calculating cohorts (fast mode)...")
+
+        if leads_df.empty or 'cohort_week' not in leads_df.columns:
+            print("No data to calculate")
+            return cls(None, CohortTensor.empty(), [], {})
+
+        dev_tensor = cls._build_dev_tensor(leads_df, desarrollo_col, stage_columns, region_by_desarrollo)
+        # El tensor sin filtros es la suma de todos los desarrollos
+        tensor = dev_tensor.select(None)
+        cohorts = tensor.to_cohorts()
+        heatmaps = {stage: tensor.heatmap(stage) for stage in COHORT_STAGES}
+
+        print(f"Pre-calculation complete! {len(cohorts)} cohorts cached.")
+        return cls(dev_tensor, tensor, cohorts, heatmaps)
+
+    def with_delta(self, leads_df: pd.DataFrame, removed_df: pd.DataFrame, added_df: pd.DataFrame,
+                   desarrollo_col: Optional[str], stage_columns: Dict[str, Optional[str]],
+                   region_by_desarrollo: Optional[Dict[str, str]]) -> 'CohortPrecalc':
+        """
+        Cohorts tras una ingesta: resta las filas reemplazadas, suma las nuevas
+        y recalcula solo los cohorts afectados. leads_df es la tabla ya actualizada.
+        """
+        if self.dev_tensor is None:
+            # Sin tensor previo (p.ej. no habia datos): calcular todo
+            return CohortPrecalc.build(leads_df, desarrollo_col, stage_columns, region_by_desarrollo)
+
+        dev_tensor = self.dev_tensor
+        if len(removed_df):
+            removed = self._build_dev_tensor(removed_df, desarrollo_col, stage_columns, region_by_desarrollo)
+            dev_tensor = dev_tensor.merged(removed, sign=-1)
+        added = self._build_dev_tensor(added_df, desarrollo_col, stage_columns, region_by_desarrollo)
+        dev_tensor = dev_tensor.merged(added, sign=1)
+        tensor = dev_tensor.select(None)
+
+        affected = set(removed_df['cohort_week'].dropna()) | set(added_df['cohort_week'].dropna())
+        updated = {cohort.cohort_week: cohort for cohort in tensor.to_cohorts(only=affected)}
+        previous = {cohort.cohort_week: cohort for cohort in self.cohorts}
+        cohorts = [updated.get(label) or previous[label] for label in tensor.cohort_labels]
+
+        # El ancho del heatmap depende de todos los cohorts, se recalcula desde el tensor
+        heatmaps = {stage: tensor.heatmap(stage) for stage in COHORT_STAGES}
+
+        return CohortPrecalc(dev_tensor, tensor, cohorts, heatmaps)
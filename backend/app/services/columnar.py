@@ -0,0 +1,188 @@
+"""
+Formatos binarios columnares para heatmaps y cohorts (`format=columnar` o
+`format=arrow`).
+
+En JSON la matriz del heatmap es una lista de listas con muchos null y las
+conversiones de cada cohort son diccionarios anidados con llaves numericas
+como string. Aqui la matriz se envia como un buffer denso float32 con un
+bitmap de validez, y las etiquetas como arreglos, directo desde el tensor de
+cohorts (sin pasar por los modelos de pydantic).
+
+Formato `columnar` (application/vnd.cohorts.columnar), little-endian:
+
+    bytes 0-3    magic b"CCF1"
+    bytes 4-7    uint32: largo H del encabezado
+    bytes 8..    encabezado JSON UTF-8 (H bytes, con espacios al final para
+                 que los buffers queden alineados a 8 bytes)
+    luego        buffers, cada uno alineado a 8 bytes desde el inicio
+
+El encabezado tiene:
+- kind: "heatmap" o "cohorts"
+- cohort_labels: etiquetas de los cohorts (filas)
+- week_labels: semanas desde el inicio del cohort (ultimo eje)
+- stage (heatmap) o stages (cohorts, etapas con datos en el orden del eje)
+- buffers: lista de {name, dtype, shape, offset, length}, offset en bytes
+  desde el inicio del mensaje
+
+Buffers:
+- heatmap: values float32 [cohorts, semanas], validity
+- cohorts: initial_leads int32 [cohorts], values float32 [cohorts, etapas,
+  semanas], validity
+- validity: bitmap uint8 de las celdas de values en orden row-major, bit i en
+  el byte i // 8, posicion i % 8 (LSB primero, como Arrow). Una celda no
+  valida es null en el heatmap JSON, o una semana ausente en
+  CohortData.conversions; su valor en values es 0.
+
+Formato `arrow` (application/vnd.apache.arrow.stream): un record batch en
+formato Arrow IPC stream, con una fila por cohort:
+- heatmap: cohort_week (utf8), values (fixed_size_list<float32>[semanas],
+  null en las celdas no validas); metadata stage y week_labels (JSON)
+- cohorts: cohort_week, initial_leads (int32) y una columna
+  fixed_size_list<float32>[semanas] por etapa; metadata week_labels
+- sin semanas (etapa desconocida o sin datos) las columnas son list<float32>
+  vacias
+Requiere pyarrow (opcional).
+"""
+
+import json
+import struct
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.services.cohort_tensor import COHORT_STAGES, CohortTensor
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow es opcional
+    pa = None
+
+MAGIC = b"CCF1"
+ALIGNMENT = 8
+
+MEDIA_TYPES = {
+    'columnar': 'application/vnd.cohorts.columnar',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def available_formats() -> List[str]:
+    return ['columnar', 'arrow'] if pa is not None else ['columnar']
+
+
+def _aligned(size: int) -> int:
+    return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def _pack(header: dict, buffers: List[Tuple[str, np.ndarray]]) -> bytes:
+    specs = [{'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape),
+              'offset': 0, 'length': array.nbytes} for name, array in buffers]
+    header = dict(header, buffers=specs)
+
+    # Los offsets dependen del largo del encabezado y viceversa: repetir hasta
+    # que el encabezado quepa antes del primer buffer
+    data_start = 0
+    while True:
+        offset = data_start
+        for spec in specs:
+            spec['offset'] = offset
+            offset += _aligned(spec['length'])
+        encoded = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+        if 8 + len(encoded) <= data_start:
+            break
+        data_start = _aligned(8 + len(encoded))
+    encoded = encoded.ljust(data_start - 8, b' ')
+
+    out = bytearray(offset)
+    out[0:4] = MAGIC
+    out[4:8] = struct.pack('<I', len(encoded))
+    out[8:data_start] = encoded
+    for spec, (_, array) in zip(specs, buffers):
+        out[spec['offset']:spec['offset'] + spec['length']] = array.tobytes()
+    return bytes(out)
+
+
+def _validity_bitmap(valid: np.ndarray) -> np.ndarray:
+    return np.packbits(valid.ravel(), bitorder='little')
+
+
+def _cohort_arrays(tensor: CohortTensor) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """(etapas con datos, pct[cohort, etapa, semana], valid) como en CohortTensor.to_cohorts"""
+    stages = [stage for stage in COHORT_STAGES if stage in tensor.stages]
+    indexes = [COHORT_STAGES.index(stage) for stage in stages]
+    pct = tensor.percentages()[:, indexes, :]
+    valid = tensor.counts[:, indexes, :] > 0
+    return stages, pct, valid
+
+
+def encode_heatmap(tensor: CohortTensor, stage: str, fmt: str) -> bytes:
+    n_weeks, pct, valid = tensor.heatmap_arrays(stage)
+    values = np.where(valid, pct, 0).astype('<f4')
+    week_labels = list(range(n_weeks))
+
+    if fmt == 'arrow':
+        metadata = {'stage': stage, 'week_labels': json.dumps(week_labels)}
+        return _arrow_stream(tensor.cohort_labels, {'values': (values, valid)}, {}, metadata)
+
+    header = {'kind': 'heatmap', 'stage': stage, 'cohort_labels': list(tensor.cohort_labels),
+              'week_labels': week_labels}
+    return _pack(header, [('values', values), ('validity', _validity_bitmap(valid))])
+
+
+def encode_cohorts(tensor: CohortTensor, fmt: str) -> bytes:
+    stages, pct, valid = _cohort_arrays(tensor)
+    values = np.where(valid, pct, 0).astype('<f4')
+    initial_leads = np.asarray(tensor.initial_leads).astype('<i4')
+    week_labels = list(range(values.shape[2]))
+
+    if fmt == 'arrow':
+        columns = {stage: (values[:, s, :], valid[:, s, :]) for s, stage in enumerate(stages)}
+        return _arrow_stream(tensor.cohort_labels, columns, {'initial_leads': initial_leads},
+                             {'week_labels': json.dumps(week_labels)})
+
+    header = {'kind': 'cohorts', 'stages': stages, 'cohort_labels': list(tensor.cohort_labels),
+              'week_labels': week_labels}
+    return _pack(header, [('initial_leads', initial_leads), ('values', values),
+                          ('validity', _validity_bitmap(valid))])
+
+
+def _arrow_stream(cohort_labels: List[str], matrices: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                  scalars: Dict[str, np.ndarray], metadata: Dict[str, str]) -> bytes:
+    names = ['cohort_week']
+    arrays = [pa.array(list(cohort_labels), type=pa.utf8())]
+    for name, values in scalars.items():
+        names.append(name)
+        arrays.append(pa.array(values))
+    for name, (values, valid) in matrices.items():
+        n_weeks = values.shape[1]
+        flat = pa.array(values.ravel(), type=pa.float32(), mask=~valid.ravel())
+        names.append(name)
+        if n_weeks:
+            arrays.append(pa.FixedSizeListArray.from_arrays(flat, n_weeks))
+        else:
+            # Arrow no admite fixed_size_list de largo 0: listas vacias
+            arrays.append(pa.array([[]] * len(cohort_labels), type=pa.list_(pa.float32())))
+
+    batch = pa.RecordBatch.from_arrays(arrays, names=names)
+    batch = batch.replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def decode(data: bytes) -> Tuple[dict, Dict[str, np.ndarray]]:
+    """Lee un mensaje `columnar`: (encabezado, buffers por nombre; validity ya como bool con la forma de values)"""
+    if data[:4] != MAGIC:
+        raise ValueError("No es un mensaje columnar")
+    (header_len,) = struct.unpack('<I', data[4:8])
+    header = json.loads(data[8:8 + header_len])
+    arrays = {}
+    for spec in header['buffers']:
+        arrays[spec['name']] = np.frombuffer(data, dtype=spec['dtype'], count=int(np.prod(spec['shape'])),
+                                             offset=spec['offset']).reshape(spec['shape'])
+    if 'validity' in arrays:
+        values = arrays['values']
+        arrays['validity'] = np.unpackbits(arrays['validity'], count=values.size,
+                                           bitorder='little').astype(bool).reshape(values.shape)
+    return header, arrays
@@ -0,0 +1,125 @@
+"""
+Representacion compacta (opcional) de la tabla de leads.
+
+Con COMPACT_LEADS=1 el DataLoader convierte los leads a tipos mas chicos:
+- desarrollo y cohort_week: categoricos (codigos + categorias ordenadas)
+- year_iso / week_iso: int16 con -1 como faltante
+- fechas de etapas: int32 con dias desde 1970-01-01 y DAY_SENTINEL como NaT
+
+Las fechas de etapa solo se usan para saber si el lead alcanzo la etapa y en
+que semana del cohort, asi que basta con el dia. Quien lea esas columnas debe
+usar stage_present(), stage_dates_ns() y year_week_values(), que funcionan
+con ambas representaciones.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+YEAR_WEEK_SENTINEL = -1
+DAY_SENTINEL = np.iinfo(np.int32).min
+
+_DAY_NS = 86_400 * 10**9
+
+
+def is_compact_dates(series: pd.Series) -> bool:
+    return series.dtype == np.int32
+
+
+def stage_present(series: pd.Series) -> np.ndarray:
+    """Mascara booleana de leads con fecha en la columna."""
+    if is_compact_dates(series):
+        return series.to_numpy() != DAY_SENTINEL
+    return series.notna().to_numpy()
+
+
+def stage_dates_ns(series: pd.Series) -> np.ndarray:
+    """Fechas como datetime64[ns] (NaT si faltan), sin importar la representacion."""
+    if is_compact_dates(series):
+        days = series.to_numpy()
+        ns = days.astype(np.int64) * _DAY_NS
+        ns[days == DAY_SENTINEL] = np.iinfo(np.int64).min  # NaT
+        return ns.view('datetime64[ns]')
+    return pd.to_datetime(series).to_numpy(dtype='datetime64[ns]')
+
+
+def year_week_values(series: pd.Series) -> pd.Series:
+    """year_iso/week_iso sin faltantes (NaN o YEAR_WEEK_SENTINEL)."""
+    series = series.dropna()
+    if series.dtype == np.int16:
+        series = series[series != YEAR_WEEK_SENTINEL]
+    return series
+
+
+def _compact_dates(series: pd.Series) -> np.ndarray:
+    dates = pd.to_datetime(series).to_numpy(dtype='datetime64[ns]')
+    missing = np.isnat(dates)
+    days = dates.view(np.int64) // _DAY_NS
+    days[missing] = DAY_SENTINEL
+    return days.astype(np.int32)
+
+
+def _compact_year_week(series: pd.Series) -> np.ndarray:
+    numeric = pd.to_numeric(series, errors='coerce')
+    return numeric.fillna(YEAR_WEEK_SENTINEL).to_numpy(dtype=np.int16)
+
+
+def _categorical(series: pd.Series) -> pd.Categorical:
+    categories = sorted(series.dropna().unique().tolist())
+    return pd.Categorical(series, categories=categories)
+
+
+def compact_leads(leads_df: pd.DataFrame, desarrollo_col: Optional[str],
+                  stage_columns: Dict[str, Optional[str]]) -> pd.DataFrame:
+    """Retorna una copia de leads con la representacion compacta."""
+    columns = {}
+    stage_cols = {col for col in stage_columns.values() if col}
+    for col in leads_df.columns:
+        series = leads_df[col]
+        if col == 'fecha_registro_normalized':
+            # Copia de la fecha de registro, solo se usa al calcular year_iso/week_iso
+            continue
+        if col == desarrollo_col or col == 'cohort_week':
+            columns[col] = _categorical(series)
+        elif col in ('year_iso', 'week_iso'):
+            columns[col] = _compact_year_week(series)
+        elif col in stage_cols:
+            columns[col] = _compact_dates(series)
+        else:
+            columns[col] = series
+    return pd.DataFrame(columns, index=leads_df.index)
+
+
+def column_bytes(df: pd.DataFrame) -> Dict[str, int]:
+    usage = df.memory_usage(deep=True, index=False)
+    return {col: int(usage[col]) for col in df.columns}
+
+
+def memory_report(before: Optional[pd.DataFrame], after: pd.DataFrame) -> List[dict]:
+    """Bytes por columna antes y despues de compactar (before=None si no se conoce)."""
+    before_bytes = column_bytes(before) if before is not None else {}
+    after_bytes = column_bytes(after)
+    report = []
+    for col in list(before.columns if before is not None else after.columns):
+        report.append({
+            'column': col,
+            'dtype_before': str(before[col].dtype) if before is not None else None,
+            'bytes_before': before_bytes.get(col),
+            'dtype_after': str(after[col].dtype) if col in after.columns else None,
+            'bytes_after': after_bytes.get(col, 0),
+        })
+    return report
+
+
+def print_memory_report(report: List[dict]):
+    print(f"{'column':<28} {'before':>14} {'after':>14}  dtype")
+    total_before = total_after = 0
+    for row in report:
+        before = row['bytes_before']
+        total_before += before or 0
+        total_after += row['bytes_after']
+        before_str = f"{before:,}" if before is not None else "-"
+        print(f"{row['column']:<28} {before_str:>14} {row['bytes_after']:>14,}  "
+              f"{row['dtype_before'] or ''} -> {row['dtype_after']}")
+    print(f"{'total':<28} {total_before:>14,} {total_after:>14,}")
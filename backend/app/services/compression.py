@@ -0,0 +1,216 @@
+"""
+Compresion de las respuestas JSON de analitica.
+
+Las listas de cohorts, heatmaps y tendencias son cientos de KB de JSON muy
+repetitivo. Un EncodedBody guarda el JSON codificado y, para los cuerpos que
+quedan en cache (cache de resultados o snapshot de datos), sus versiones
+comprimidas: cada una se genera la primera vez que un cliente la pide y se
+reutiliza hasta que cambia la version de datos. Los cuerpos que no quedan en
+cache se comprimen en streaming, por bloques, mientras se envian.
+
+Brotli se usa solo si el paquete `brotli` esta instalado.
+
+Configuracion por variables de entorno:
+- COMPRESS_MIN_BYTES: tamaño minimo para comprimir (default 1024, 0 = nunca)
+- GZIP_LEVEL: nivel de gzip en streaming (default 6; las versiones en cache usan 9)
+"""
+
+import gzip
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+
+# Las versiones en cache se comprimen una vez: vale la pena el nivel alto
+CACHED_GZIP_LEVEL = 9
+CACHED_BROTLI_QUALITY = 9
+STREAM_BROTLI_QUALITY = 4
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# En orden de preferencia ante empate de q
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Codificacion a usar segun Accept-Encoding (None = sin comprimir)"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.lower().split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionStats:
+    """Bytes servidos (sin comprimir y en el cable) y CPU de compresion por codificacion"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_encoding: Dict[str, Dict[str, float]] = {}
+
+    def _bucket(self, encoding: str) -> Dict[str, float]:
+        return self._by_encoding.setdefault(encoding, {
+            'responses': 0, 'raw_bytes': 0, 'wire_bytes': 0,
+            'precompressed': 0, 'streamed': 0, 'compress_cpu_ms': 0.0
+        })
+
+    def record_response(self, encoding: str, raw_bytes: int, wire_bytes: int, streamed: bool = False):
+        with self._lock:
+            bucket = self._bucket(encoding)
+            bucket['responses'] += 1
+            bucket['raw_bytes'] += raw_bytes
+            bucket['wire_bytes'] += wire_bytes
+            if streamed:
+                bucket['streamed'] += 1
+
+    def record_compression(self, encoding: str, cpu_seconds: float, precompressed: bool = False):
+        with self._lock:
+            bucket = self._bucket(encoding)
+            bucket['compress_cpu_ms'] += cpu_seconds * 1000
+            if precompressed:
+                bucket['precompressed'] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            by_encoding = {}
+            for encoding, bucket in self._by_encoding.items():
+                responses = bucket['responses']
+                by_encoding[encoding] = {
+                    **bucket,
+                    'compress_cpu_ms': round(bucket['compress_cpu_ms'], 3),
+                    'ratio': round(bucket['wire_bytes'] / bucket['raw_bytes'], 4) if bucket['raw_bytes'] else 1.0,
+                    'cpu_ms_per_response': round(bucket['compress_cpu_ms'] / responses, 3) if responses else 0.0,
+                }
+            return {
+                'min_bytes': COMPRESS_MIN_BYTES,
+                'encodings': list(ENCODINGS),
+                'responses': sum(b['responses'] for b in self._by_encoding.values()),
+                'raw_bytes': sum(b['raw_bytes'] for b in self._by_encoding.values()),
+                'wire_bytes': sum(b['wire_bytes'] for b in self._by_encoding.values()),
+                'by_encoding': by_encoding,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._by_encoding.clear()
+
+
+compression_stats = CompressionStats()
+
+
+def _compress(raw: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(raw, quality=CACHED_BROTLI_QUALITY)
+    return gzip.compress(raw, compresslevel=CACHED_GZIP_LEVEL, mtime=0)
+
+
+class EncodedBody:
+    """
+    Cuerpo JSON ya codificado. `cached` indica que el cuerpo quedo guardado
+    (cache de resultados o snapshot): solo entonces vale la pena guardar sus
+    versiones comprimidas.
+    """
+
+    def __init__(self, raw: bytes, cached: bool = False):
+        self.raw = raw
+        self.cached = cached
+        self._compressed: Dict[str, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def has_compressed(self, encoding: str) -> bool:
+        return encoding in self._compressed
+
+    def compressed(self, encoding: str) -> bytes:
+        """Version comprimida, generada una sola vez (dos requests simultaneos pueden generarla ambos)"""
+        data = self._compressed.get(encoding)
+        if data is None:
+            start = time.thread_time()
+            data = self._compressed[encoding] = _compress(self.raw, encoding)
+            compression_stats.record_compression(encoding, time.thread_time() - start, precompressed=True)
+        return data
+
+    def stream(self, encoding: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Comprime por bloques mientras se envia (cuerpos que no quedan en cache)"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=STREAM_BROTLI_QUALITY)
+            compress, finish = compressor.process, compressor.finish
+        else:
+            # wbits 16+: formato gzip
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compress, finish = compressor.compress, compressor.flush
+
+        cpu_seconds, wire_bytes = 0.0, 0
+        for offset in range(0, len(self.raw), chunk_size):
+            start = time.thread_time()
+            chunk = compress(self.raw[offset:offset + chunk_size])
+            cpu_seconds += time.thread_time() - start
+            if chunk:
+                wire_bytes += len(chunk)
+                yield chunk
+        start = time.thread_time()
+        chunk = finish()
+        cpu_seconds += time.thread_time() - start
+        wire_bytes += len(chunk)
+        yield chunk
+
+        compression_stats.record_compression(encoding, cpu_seconds)
+        compression_stats.record_response(encoding, len(self.raw), wire_bytes, streamed=True)
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Comprime un cuerpo que se genera por bloques (p.ej. NDJSON). Cada bloque
+    se vacia del compresor al enviarse, asi el cliente puede descomprimir y
+    procesar lo recibido sin esperar al final.
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=STREAM_BROTLI_QUALITY)
+        compress = lambda chunk: compressor.process(chunk) + compressor.flush()
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress = lambda chunk: compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    cpu_seconds, raw_bytes, wire_bytes = 0.0, 0, 0
+    for chunk in chunks:
+        raw_bytes += len(chunk)
+        start = time.thread_time()
+        data = compress(chunk)
+        cpu_seconds += time.thread_time() - start
+        wire_bytes += len(data)
+        yield data
+    start = time.thread_time()
+    data = finish()
+    cpu_seconds += time.thread_time() - start
+    wire_bytes += len(data)
+    yield data
+
+    compression_stats.record_compression(encoding, cpu_seconds)
+    compression_stats.record_response(encoding, raw_bytes, wire_bytes, streamed=True)
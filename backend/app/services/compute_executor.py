@@ -0,0 +1,92 @@
+"""
+Ejecucion de calculos de analitica fuera del event loop.
+
+Las rutas son `async def`, pero los calculos (pandas/numpy) son sincronos:
+llamarlos directamente bloquea el event loop del worker y con el todos los
+demas requests, incluido /health. ComputeExecutor los corre en un pool de
+threads acotado y agrupa requests identicos en vuelo (single-flight): si
+llega un request con la misma llave mientras otro igual se esta calculando,
+espera ese mismo resultado en lugar de lanzar otro calculo.
+
+Configuracion por variables de entorno:
+- COMPUTE_THREADS: threads del pool (default min(4, CPUs); 0 = calcular en
+  el event loop, como antes)
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class ComputeExecutor:
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        if max_workers > 0:
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="compute")
+        self._in_flight: Dict[Hashable, Future] = {}
+        # Calculos asincronos en vuelo (p.ej. despachados al pool de procesos)
+        self._in_flight_async: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def _submit(self, key: Hashable, compute: Callable[[], Any]) -> Future:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._pool.submit(compute)
+            self._in_flight[key] = future
+            self.executed += 1
+
+        def release(done: Future):
+            with self._lock:
+                if self._in_flight.get(key) is done:
+                    del self._in_flight[key]
+
+        future.add_done_callback(release)
+        return future
+
+    async def run(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Resultado de compute(), calculado en el pool y compartido entre llamadas con la misma llave"""
+        if self._pool is None:
+            self.executed += 1
+            return compute()
+        return await asyncio.wrap_future(self._submit(key, compute))
+
+    async def submit(self, compute: Callable[[], Any]) -> Any:
+        """compute() en el pool, sin agrupar con otras llamadas"""
+        if self._pool is None:
+            return compute()
+        return await asyncio.wrap_future(self._pool.submit(compute))
+
+    async def run_async(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Como run(), para calculos asincronos: las llamadas con la misma llave esperan la misma tarea"""
+        task = self._in_flight_async.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(compute())
+            self._in_flight_async[key] = task
+            self.executed += 1
+            task.add_done_callback(lambda done: self._in_flight_async.pop(key, None))
+        # shield: si un request se cancela, la tarea compartida sigue para los demas
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'in_flight': len(self._in_flight) + len(self._in_flight_async),
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+            }
+
+
+compute_executor = ComputeExecutor(
+    max_workers=int(os.environ.get('COMPUTE_THREADS', str(min(4, os.cpu_count() or 1))))
+)
@@ -0,0 +1,71 @@
+"""
+Dashboard combinado: todas las secciones de la vista principal en un request.
+
+El frontend pedia metricas, funnel, tendencias y cohorts por separado, y cada
+endpoint volvia a resolver los mismos filtros contra el indice de leads. Aqui
+las secciones se calculan sobre un mismo snapshot de datos y una misma
+LeadSelection, de modo que las filas se resuelven una sola vez, y cada seccion
+comparte las entradas del cache de resultados con su endpoint individual.
+"""
+
+import time
+from typing import Iterable, Optional
+
+from app.models.schemas import (
+    DashboardResponse, DashboardSection, DevelopmentLocation, FilterParams
+)
+from app.services.cohort_analysis import cohort_service
+from app.services.data_loader import data_loader
+from app.services.funnel_analysis import funnel_service
+from app.services.metrics_calculator import metrics_service
+from app.services.result_cache import result_cache
+
+
+class DashboardService:
+    def build(self, filters: Optional[FilterParams] = None,
+              sections: Optional[Iterable[DashboardSection]] = None,
+              stage: str = 'contacto') -> DashboardResponse:
+        start = time.perf_counter()
+        requested = set(DashboardSection) if not sections else set(sections)
+
+        # Un solo snapshot y una sola seleccion de filas para todas las secciones
+        snapshot = data_loader.snapshot
+        selection = snapshot.selection(filters)
+
+        # Mismos namespaces/llaves que los endpoints individuales
+        calculations = {
+            DashboardSection.METRICS: lambda: result_cache.get_or_compute(
+                'metrics', filters, lambda: metrics_service.calculate_metrics(filters, selection)),
+            DashboardSection.FUNNEL: lambda: result_cache.get_or_compute(
+                'funnel', filters, lambda: funnel_service.calculate_funnel(filters, selection)),
+            DashboardSection.TRENDS: lambda: result_cache.get_or_compute(
+                'funnel_trends', filters, lambda: funnel_service.calculate_trends(filters, selection)),
+            DashboardSection.COHORTS: lambda: result_cache.get_or_compute(
+                'cohorts', filters, lambda: cohort_service.calculate_cohorts(filters, selection)),
+            DashboardSection.HEATMAP: lambda: result_cache.get_or_compute(
+                'cohorts_heatmap', filters,
+                lambda: cohort_service.get_heatmap_data(filters, stage, selection), stage),
+            DashboardSection.DEVELOPMENTS: lambda: [
+                DevelopmentLocation(**dev) for dev in snapshot.get_cached_developments()],
+        }
+
+        results = {}
+        timings = {}
+        for section in DashboardSection:
+            if section not in requested:
+                continue
+            # La primera seccion que necesita las filas paga la resolucion de filtros
+            section_start = time.perf_counter()
+            results[section.value] = calculations[section]()
+            timings[section.value] = round((time.perf_counter() - section_start) * 1000, 3)
+
+        return DashboardResponse(
+            **results,
+            data_version=snapshot.data_version,
+            timings_ms=timings,
+            total_ms=round((time.perf_counter() - start) * 1000, 3)
+        )
+
+
+# Singleton instance
+dashboard_service = DashboardService()
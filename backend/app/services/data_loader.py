@@ -1,8 +1,27 @@
+import copy
+import contextlib
+import hashlib
+import os
+import threading
+import time
 import pandas as pd
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
 import numpy as np
 
+from app.services.cohort_tensor import CohortPrecalc
+from app.services.compact_layout import (
+    compact_leads, memory_report, print_memory_report, stage_present
+)
+from app.services.lead_index import LeadIndex
+from app.services.olap_cube import (
+    N_MASKS, InvestmentCube, LeadCube, mask_counts_from_bits, stage_bitmask
+)
+from app.services.snapshot_store import (
+    build_lock, file_content_hash, prune_snapshots, read_arrays, read_snapshot, write_arrays,
+    write_snapshot
+)
+
 # Coordenadas aproximadas de ciudades mexicanas
 CITY_COORDINATES = {
     "Monterrey": (25.6866, -100.3161),
@@ -27,51 +46,192 @@ CITY_COORDINATES = {
     "Veracruz": (19.1738, -96.1342),
 }
 
+# Candidate column names for each funnel stage date, in priority order
+STAGE_COLUMNS = {
+    'contacto': ['fecha_contacto', 'fecha_de_contacto', 'contacto'],
+    'cita': ['fecha_cita', 'fecha_de_cita', 'cita'],
+    'venta_bruta': ['fecha_venta_bruta', 'fecha_de_venta_bruta', 'venta_bruta', 'venta'],
+    'escrituracion': ['fecha_escrituracion', 'fecha_de_escrituración', 'escrituracion', 'escrituración']
+}
 
-class DataLoader:
-    _instance = None
-    _data_loaded = False
 
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-        return cls._instance
+def find_column(df: pd.DataFrame, possible_names) -> Optional[str]:
+    for name in possible_names:
+        for col in df.columns:
+            if name in col.lower():
+                return col
+    return None
 
-    def __init__(self):
-        if not DataLoader._data_loaded:
-            self._leads_df: Optional[pd.DataFrame] = None
-            self._investment_df: Optional[pd.DataFrame] = None
-            self._developments_df: Optional[pd.DataFrame] = None
-            # Pre-calculated metrics cache
-            self._cached_metrics = None
-            self._cached_funnel = None
-            self._cached_developments_list = None
-            self._load_data()
-            self._precalculate_all()
-            DataLoader._data_loaded = True
 
-    def _get_data_path(self) -> Path:
-        current_dir = Path(__file__).parent.parent.parent
-        data_path = current_dir / "data" / "Datos_prueba_v3.xlsx"
-        if not data_path.exists():
-            raise FileNotFoundError(f"Excel file not found at {data_path}")
-        return data_path
+def _merge_column(current: pd.Series, values: pd.Series, positions: np.ndarray, n_rows: int) -> pd.Series:
+    """Column with `values` written at `positions` (positions >= len(current) are appended)"""
+    if isinstance(current.dtype, pd.CategoricalDtype):
+        categories = current.cat.categories
+        extra = pd.Index(values.dropna().astype(object).unique()).difference(categories)
+        if len(extra):
+            categories = categories.append(extra).sort_values()
+        codes = np.full(n_rows, -1, dtype=np.int32)
+        codes[:len(current)] = categories.get_indexer(current.cat.categories)[current.cat.codes.to_numpy()]
+        codes[:len(current)][current.isna().to_numpy()] = -1
+        codes[positions] = categories.get_indexer(values.astype(object))
+        return pd.Series(pd.Categorical.from_codes(codes, categories))
+
+    if not pd.api.types.is_extension_array_dtype(current.dtype):
+        try:
+            incoming = values.to_numpy(dtype=current.dtype)
+        except (TypeError, ValueError):
+            incoming = None
+        if incoming is not None:
+            merged = np.empty(n_rows, dtype=current.dtype)
+            merged[:len(current)] = current.to_numpy()
+            merged[positions] = incoming
+            return pd.Series(merged)
+
+    # Incompatible types (e.g. NaN in an integer column): let pandas infer the result
+    merged = np.empty(n_rows, dtype=object)
+    merged[:len(current)] = current.to_numpy(dtype=object)
+    merged[positions] = values.to_numpy(dtype=object)
+    return pd.Series(merged).infer_objects()
+
+
+class LeadSelection:
+    """
+    Filtered view of one snapshot. The matching rows are resolved with the lead
+    index on first use and shared by every calculation given this selection,
+    as is anything derived from them through derived().
+    """
+
+    def __init__(self, snapshot: 'DataSnapshot', filters):
+        self.snapshot = snapshot
+        self.filters = filters
+        self._rows: Optional[np.ndarray] = None
+        self._resolved = False
+        self._derived: Dict[str, Any] = {}
+
+    @property
+    def rows(self) -> Optional[np.ndarray]:
+        """Positions of the matching leads, or None for all of them"""
+        if not self._resolved:
+            self._rows = self.snapshot.lead_index.select(self.filters)
+            self._resolved = True
+        return self._rows
+
+    def derived(self, name: str, build: Callable[[], Any]) -> Any:
+        """Value of build() computed once per selection (e.g. the filtered cohort tensor)"""
+        if name not in self._derived:
+            self._derived[name] = build()
+        return self._derived[name]
+
+
+class LeadDelta(NamedTuple):
+    """Rows touched by an ingestion: previous values of replaced rows and the delta as stored"""
+    removed: pd.DataFrame
+    added: pd.DataFrame
+    inserted: int
+    updated: int
+
+
+class DataSnapshot:
+    """
+    One immutable version of the loaded data: frames, resolved columns, per-lead
+    arrays, index, cubes and pre-calculated results (funnel, metrics,
+    developments, cohorts). A new version (reload or ingestion) is a new
+    DataSnapshot; requests keep using the one they started with.
+
+    Not to be confused with the on-disk columnar snapshot (snapshot_store),
+    which only caches the parsed workbook to speed up loading.
+    """
+
+    # Bump when the cleaning/derived columns change so old snapshots are ignored
+    SNAPSHOT_SCHEMA_VERSION = 1
+
+    # Build steps, reported through `progress` while loading
+    LOAD_STEPS = ('workbook', 'columns', 'index', 'cubes', 'aggregates', 'cohorts')
+
+    # Per-lead arrays stored next to the columnar snapshot in shared mode
+    SHARED_ARRAYS_DIR = "derived"
+
+    def __init__(self, data_path: Path, compact: bool = False, shared: bool = False,
+                 progress: Optional[Callable[[str], None]] = None):
+        self._data_path = data_path
+        self.loaded_at = time.time()
+        self._leads_df: Optional[pd.DataFrame] = None
+        self._investment_df: Optional[pd.DataFrame] = None
+        self._developments_df: Optional[pd.DataFrame] = None
+        self._data_version: Optional[str] = None
+        # Workbook hash and deltas ingested on top of it: (version after, raw delta, source hash)
+        self._base_version: Optional[str] = None
+        self._applied_deltas: Tuple[Tuple[str, pd.DataFrame, str], ...] = ()
+        # COMPACT_LEADS=1 keeps leads in the compact dtype layout (see compact_layout)
+        self._compact = compact
+        # shared=True maps per-lead arrays from the snapshot so worker processes share them
+        self._shared = shared
+        self._shared_arrays: Optional[Tuple[Dict[str, np.ndarray], dict]] = None
+        self._snapshot_dir: Optional[Path] = None
+        self._memory_report: Optional[List[dict]] = None
+        # Column names and per-lead arrays resolved once at load time
+        self._lead_columns: Dict[str, Optional[str]] = {}
+        self._investment_columns: Dict[str, Optional[str]] = {}
+        self._stage_columns: Dict[str, Optional[str]] = {}
+        # desarrollo -> region from the developments sheet (None if it has no such columns)
+        self._region_map: Optional[Dict[Any, Any]] = None
+        self._stage_bits: Optional[np.ndarray] = None
+        self._present_stages: List[str] = []
+        self._period_codes: Optional[np.ndarray] = None
+        self._period_labels: List[str] = []
+        self._lead_index: Optional[LeadIndex] = None
+        self._lead_cube: Optional[LeadCube] = None
+        self._investment_cube: Optional[InvestmentCube] = None
+        # Pre-calculated metrics cache
+        self._cached_metrics = None
+        self._cached_funnel = None
+        self._cached_developments_list = None
+        self._cohorts: Optional[CohortPrecalc] = None
+        # Responses encoded to JSON once per version (see encoded())
+        self._encoded: Dict[str, Any] = {}
+
+        steps = list(zip(self.LOAD_STEPS, (
+            self._load_data, self._resolve_columns, self._build_lead_index,
+            self._build_cubes, self._precalculate_all, self._precalculate_cohorts
+        )))
+        # In shared mode the per-lead steps run under a cross-process lock: the
+        # first worker builds them and stores them with the columnar snapshot,
+        # the others wait and then map them read-only
+        with self._shared_build_lock():
+            self._run_steps(steps[:3], progress)
+        self._run_steps(steps[3:], progress)
+
+    @staticmethod
+    def _run_steps(steps, progress: Optional[Callable[[str], None]]):
+        for name, step in steps:
+            if progress is not None:
+                progress(name)
+            step()
+
+    def _shared_build_lock(self):
+        if not self._shared:
+            return contextlib.nullcontext()
+        return build_lock(self._get_snapshot_base_dir(self._data_path))
+
+    def _get_snapshot_base_dir(self, data_path: Path) -> Path:
+        return data_path.parent / ".snapshots"
 
     def _load_data(self):
         try:
-            data_path = self._get_data_path()
+            data_path = self._data_path
             print(f"Loading data from: {data_path}")
 
-            excel_file = pd.ExcelFile(data_path)
-            print(f"Available sheets: {excel_file.sheet_names}")
-
-            self._investment_df = pd.read_excel(data_path, sheet_name=0)
-            self._developments_df = pd.read_excel(data_path, sheet_name=1)
-            self._leads_df = pd.read_excel(data_path, sheet_name=2)
+            self._data_version = self._base_version = file_content_hash(data_path)
+            # The compact layout is stored as its own snapshot
+            layout = '-compact' if self._compact else ''
+            snapshot_dir = self._get_snapshot_base_dir(data_path) / f"{self._data_version}{layout}"
+            self._snapshot_dir = snapshot_dir
 
-            self._clean_data()
-            self._add_geolocation()
-            self._calculate_cohort_weeks()
+            if not self._load_snapshot(snapshot_dir):
+                self._load_excel(data_path)
+                if self._compact:
+                    self._compact_leads()
+                self._save_snapshot(snapshot_dir)
 
             print(f"Loaded {len(self._leads_df)} leads")
             print(f"Loaded {len(self._investment_df)} investment records")
@@ -81,6 +241,87 @@ class DataLoader:
             print(f"Error loading data: {e}")
             raise
 
+    def _load_excel(self, data_path: Path):
+        # Parse the workbook once and read every sheet from the same handle
+        with pd.ExcelFile(data_path) as excel_file:
+            print(f"Available sheets: {excel_file.sheet_names}")
+            self._investment_df = excel_file.parse(sheet_name=0)
+            self._developments_df = excel_file.parse(sheet_name=1)
+            self._leads_df = excel_file.parse(sheet_name=2)
+
+        self._clean_data()
+        self._add_geolocation()
+        self._calculate_cohort_weeks()
+
+    def _load_snapshot(self, snapshot_dir: Path) -> bool:
+        frames = read_snapshot(snapshot_dir, self._data_version, self.SNAPSHOT_SCHEMA_VERSION)
+        if frames is None:
+            return False
+
+        print(f"Using columnar snapshot: {snapshot_dir}")
+        self._leads_df = frames['leads']
+        self._investment_df = frames['investment']
+        self._developments_df = frames['developments']
+        if self._shared:
+            self._shared_arrays = read_arrays(snapshot_dir / self.SHARED_ARRAYS_DIR)
+        return True
+
+    def _save_shared_arrays(self):
+        """Store stage bits, month codes and the lead index with the snapshot, then map them back"""
+        arrays, meta = {}, {'present_stages': self._present_stages, 'period_labels': self._period_labels}
+        arrays['stage_bits'] = self._stage_bits
+        if self._period_codes is not None:
+            arrays['period_codes'] = self._period_codes
+        index_arrays, meta['lead_index'] = self._lead_index.to_arrays()
+        arrays.update({f"lead_index.{name}": values for name, values in index_arrays.items()})
+
+        directory = self._snapshot_dir / self.SHARED_ARRAYS_DIR
+        try:
+            write_arrays(directory, arrays, meta)
+        except (OSError, TypeError) as e:
+            # Keep this worker's private copies; the next worker will try again
+            print(f"Could not save shared arrays: {e}")
+            return
+        print(f"Saved shared arrays: {directory}")
+        self._shared_arrays = read_arrays(directory)
+        self._attach_shared_arrays()
+
+    def _attach_shared_arrays(self):
+        arrays, meta = self._shared_arrays
+        self._stage_bits = arrays['stage_bits']
+        self._present_stages = meta['present_stages']
+        self._period_codes = arrays.get('period_codes')
+        self._period_labels = meta['period_labels']
+        prefix = 'lead_index.'
+        self._lead_index = LeadIndex.from_arrays(
+            {name[len(prefix):]: values for name, values in arrays.items() if name.startswith(prefix)},
+            meta['lead_index']
+        )
+
+    def _save_snapshot(self, snapshot_dir: Path):
+        # A failed write only costs the next start an Excel parse
+        try:
+            write_snapshot(snapshot_dir, {
+                'leads': self._leads_df,
+                'investment': self._investment_df,
+                'developments': self._developments_df,
+            }, self._data_version, self.SNAPSHOT_SCHEMA_VERSION)
+            # Keep every layout of this workbook, so switching COMPACT_LEADS does not re-parse it
+            prune_snapshots(snapshot_dir.parent, keep=self._base_version)
+            print(f"Saved columnar snapshot: {snapshot_dir}")
+        except OSError as e:
+            print(f"Could not save snapshot: {e}")
+
+    def _compact_leads(self):
+        """Convert leads to the compact dtype layout and report bytes per column"""
+        leads = self._leads_df
+        stage_columns = {stage: find_column(leads, names) for stage, names in STAGE_COLUMNS.items()}
+        compact = compact_leads(leads, find_column(leads, ['desarrollo', 'project', 'proyecto']), stage_columns)
+        self._memory_report = memory_report(leads, compact)
+        print("Compact leads layout:")
+        print_memory_report(self._memory_report)
+        self._leads_df = compact
+
     def _clean_data(self):
         for df in [self._leads_df, self._investment_df, self._developments_df]:
             if df is not None:
@@ -114,44 +355,303 @@ class DataLoader:
             self._developments_df['latitude'] = 23.6345
             self._developments_df['longitude'] = -102.5528
 
-    def _calculate_cohort_weeks(self):
-        if self._leads_df is None:
+    def _calculate_cohort_weeks(self, leads_df: Optional[pd.DataFrame] = None):
+        leads_df = self._leads_df if leads_df is None else leads_df
+        if leads_df is None:
             return
 
         date_col = None
-        for col in self._leads_df.columns:
+        for col in leads_df.columns:
             if 'registro' in col:
                 date_col = col
                 break
 
         if date_col is None:
-            for col in self._leads_df.columns:
-                if pd.api.types.is_datetime64_any_dtype(self._leads_df[col]):
+            for col in leads_df.columns:
+                if pd.api.types.is_datetime64_any_dtype(leads_df[col]):
                     date_col = col
                     break
 
         if date_col:
-            self._leads_df['fecha_registro_normalized'] = self._leads_df[date_col]
-            valid_dates = self._leads_df['fecha_registro_normalized'].notna()
+            leads_df['fecha_registro_normalized'] = leads_df[date_col]
+            valid_dates = leads_df['fecha_registro_normalized'].notna()
 
             # Vectorized ISO calendar calculation
-            dates = self._leads_df.loc[valid_dates, 'fecha_registro_normalized']
+            dates = leads_df.loc[valid_dates, 'fecha_registro_normalized']
             iso_cal = dates.dt.isocalendar()
 
-            self._leads_df['year_iso'] = np.nan
-            self._leads_df['week_iso'] = np.nan
-            self._leads_df.loc[valid_dates, 'year_iso'] = iso_cal.year.values
-            self._leads_df.loc[valid_dates, 'week_iso'] = iso_cal.week.values
+            leads_df['year_iso'] = np.nan
+            leads_df['week_iso'] = np.nan
+            leads_df.loc[valid_dates, 'year_iso'] = iso_cal.year.values
+            leads_df.loc[valid_dates, 'week_iso'] = iso_cal.week.values
 
             # Vectorized cohort_week creation
-            mask = self._leads_df['year_iso'].notna()
-            self._leads_df['cohort_week'] = None
-            self._leads_df.loc[mask, 'cohort_week'] = (
-                self._leads_df.loc[mask, 'year_iso'].astype(int).astype(str) +
+            mask = leads_df['year_iso'].notna()
+            leads_df['cohort_week'] = None
+            leads_df.loc[mask, 'cohort_week'] = (
+                leads_df.loc[mask, 'year_iso'].astype(int).astype(str) +
                 '-W' +
-                self._leads_df.loc[mask, 'week_iso'].astype(int).astype(str).str.zfill(2)
+                leads_df.loc[mask, 'week_iso'].astype(int).astype(str).str.zfill(2)
             )
 
+    def _build_region_map(self) -> Optional[dict]:
+        """Maps each desarrollo name to its region using the developments sheet"""
+        developments_df = self._developments_df
+        region_col = None
+        for col in developments_df.columns:
+            # Handle encoding issues: check for various forms of "region"
+            col_clean = col.lower().replace('ó', 'o').replace('ö', 'o')
+            if 'region' in col_clean or 'regi' in col_clean:
+                region_col = col
+                break
+        dev_name_col = find_column(developments_df, ['desarrollo'])
+
+        if not region_col or not dev_name_col:
+            return None
+
+        mapping = developments_df[[dev_name_col, region_col]].dropna()
+        return dict(zip(mapping[dev_name_col], mapping[region_col]))
+
+    def _resolve_columns(self):
+        """Resolve column names and per-lead arrays so request paths never search for them"""
+        leads = self._leads_df
+        self._lead_columns = {
+            'desarrollo': find_column(leads, ['desarrollo', 'project', 'proyecto']),
+            'registro': find_column(leads, ['fecha_registro', 'fecha_de_registro']),
+        }
+        investment = self._investment_df
+        self._investment_columns = {
+            'desarrollo': find_column(investment, ['desarrollo', 'project', 'proyecto']),
+            'fecha': find_column(investment, ['fecha', 'date']),
+            'amount': find_column(investment, ['inversion', 'inversión', 'monto', 'amount']),
+        }
+        self._stage_columns = {stage: find_column(leads, names) for stage, names in STAGE_COLUMNS.items()}
+        # Resolved once: the index, cubes and cohort tensors (also after ingestion) reuse it
+        self._region_map = self._build_region_map()
+        if self._shared_arrays is not None:
+            # Per-lead arrays and index come from the shared snapshot
+            self._attach_shared_arrays()
+            return
+
+        self._stage_bits, self._present_stages = stage_bitmask(leads, self._stage_columns)
+
+        # Registration month ("2024-01") per lead, as codes into sorted labels
+        date_col = self._lead_columns['registro']
+        if date_col:
+            periods = pd.to_datetime(leads[date_col]).dt.to_period('M').astype(str)
+            codes, labels = pd.factorize(periods, sort=True)
+            self._period_codes = codes
+            self._period_labels = list(labels)
+
+    def _build_lead_index(self):
+        """Build the bitmap index used to resolve FilterParams without scanning leads"""
+        if self._shared_arrays is not None:
+            return
+        self._lead_index = LeadIndex.build(
+            self._leads_df,
+            desarrollo_col=self._lead_columns['desarrollo'],
+            date_col=self._lead_columns['registro'],
+            region_by_desarrollo=self._region_map
+        )
+        if self._shared:
+            self._save_shared_arrays()
+
+    def _build_cubes(self):
+        """Pre-aggregate lead and investment counts so funnel/metrics skip raw rows"""
+        leads = self._leads_df
+        investment = self._investment_df
+        self._lead_cube = LeadCube.build(
+            leads,
+            desarrollo_col=self._lead_columns['desarrollo'],
+            date_col=self._lead_columns['registro'],
+            stage_bits=self._stage_bits,
+            present_stages=self._present_stages,
+            region_by_desarrollo=self._region_map
+        )
+        self._investment_cube = InvestmentCube.build(
+            investment,
+            desarrollo_col=self._investment_columns['desarrollo'],
+            date_col=self._investment_columns['fecha'],
+            amount_col=self._investment_columns['amount'],
+            region_by_desarrollo=self._region_map
+        )
+        print(f"Built lead cube with {self._lead_cube.n_cells} cells")
+
+    def _precalculate_cohorts(self):
+        self._cohorts = CohortPrecalc.build(
+            self._leads_df,
+            desarrollo_col=self._lead_columns['desarrollo'],
+            stage_columns=self._stage_columns,
+            region_by_desarrollo=self._region_map
+        )
+
+    # ---- Incremental ingestion ----
+
+    def _prepare_lead_delta(self, delta_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Clean a raw delta sheet the same way as the leads sheet and align it to the leads columns.
+        Raises ValueError if a required column is missing or no row has lead data.
+        """
+        delta = delta_df.copy()
+        delta.columns = delta.columns.astype(str).str.strip().str.lower().str.replace(' ', '_')
+
+        # The id, registration date and desarrollo columns found on the leads sheet are required
+        required = [find_column(self._leads_df, ['id_lead', 'lead_id']),
+                    self._lead_columns['registro'], self._lead_columns['desarrollo']]
+        missing = [col for col in required if col and col not in delta.columns]
+        if missing:
+            raise ValueError(f"Delta is missing required lead columns: {', '.join(missing)}")
+        # Rows without any value in the leads columns are not leads
+        known = [col for col in delta.columns if col in self._leads_df.columns]
+        delta = delta[delta[known].notna().any(axis=1)]
+        if delta.empty:
+            raise ValueError("Delta has no rows with lead data")
+
+        for col in delta.columns:
+            if any(dc in col for dc in ['fecha', 'date']):
+                delta[col] = pd.to_datetime(delta[col], errors='coerce')
+        self._calculate_cohort_weeks(delta)
+
+        delta = delta.reindex(columns=self._leads_df.columns).reset_index(drop=True)
+        if self._compact:
+            delta = compact_leads(delta, self._lead_columns['desarrollo'], self._stage_columns)
+        return delta
+
+    @staticmethod
+    def _funnel_counts(bits: np.ndarray) -> Dict[str, int]:
+        """Sequential stage counts with the same semantics as _calculate_funnel_internal"""
+        mask_counts = mask_counts_from_bits(bits)
+        masks = np.arange(N_MASKS)
+        counts = {}
+        required = 0
+        for bit, key in enumerate(['contacts', 'appointments', 'sales', 'closings']):
+            required |= 1 << bit
+            counts[key] = int(mask_counts[(masks & required) == required].sum())
+        return counts
+
+    def _developments_with_delta(self, removed: pd.DataFrame, added: pd.DataFrame) -> Optional[list]:
+        """Adjust total_leads/total_sales of the developments touched by the delta"""
+        developments = self._cached_developments_list
+        dev_col = find_column(self._leads_df, ['desarrollo'])
+        if developments is None or not dev_col:
+            return developments
+
+        venta_col = find_column(self._leads_df, ['venta'])
+
+        def per_desarrollo(rows: pd.DataFrame):
+            leads = rows[dev_col].astype(object).value_counts()
+            sales = rows.loc[stage_present(rows[venta_col]), dev_col].astype(object).value_counts() if venta_col else None
+            return leads, sales
+
+        added_leads, added_sales = per_desarrollo(added)
+        removed_leads, removed_sales = per_desarrollo(removed)
+
+        updated = []
+        for entry in developments:
+            name = entry['name']
+            entry = dict(entry)
+            entry['total_leads'] += int(added_leads.get(name, 0)) - int(removed_leads.get(name, 0))
+            if venta_col:
+                entry['total_sales'] += int(added_sales.get(name, 0)) - int(removed_sales.get(name, 0))
+            updated.append(entry)
+        return updated
+
+    def with_lead_delta(self, delta_df: pd.DataFrame, source_hash: str) -> Tuple['DataSnapshot', LeadDelta]:
+        """
+        New snapshot with new or updated leads applied, without reloading the workbook.
+        Rows whose lead id already exists replace the previous row; the rest are appended.
+        The index, cubes, stage/period arrays and cached funnel, metrics, developments and
+        cohorts are updated from the touched rows only, and data_version changes.
+        This snapshot is left untouched.
+        """
+        leads = self._leads_df
+        n_old = len(leads)
+        delta = self._prepare_lead_delta(delta_df)
+
+        id_col = find_column(leads, ['id_lead', 'lead_id'])
+        existing = np.full(len(delta), np.nan)
+        if id_col:
+            ids = delta[id_col]
+            # Repeated ids in the delta: the last row wins
+            delta = delta[~(ids.duplicated(keep='last') & ids.notna())].reset_index(drop=True)
+            lookup = pd.Series(np.arange(n_old), index=leads[id_col].to_numpy())
+            lookup = lookup[~lookup.index.duplicated(keep='last')]
+            existing = lookup.reindex(delta[id_col].to_numpy()).to_numpy(dtype=float)
+            existing[delta[id_col].isna().to_numpy()] = np.nan
+
+        is_update = ~np.isnan(existing)
+        n_inserted = int((~is_update).sum())
+        n_rows = n_old + n_inserted
+        positions = np.where(is_update, existing, 0).astype(np.int64)
+        positions[~is_update] = n_old + np.arange(n_inserted)
+        replaced = positions[is_update]
+        removed = leads.iloc[replaced].reset_index(drop=True)
+
+        new_leads = pd.DataFrame({
+            col: _merge_column(leads[col], delta[col], positions, n_rows) for col in leads.columns
+        })
+
+        # Per-lead stage bits and registration month codes
+        delta_bits, _ = stage_bitmask(delta, self._stage_columns)
+        removed_bits = self._stage_bits[replaced]
+        stage_bits = np.empty(n_rows, dtype=self._stage_bits.dtype)
+        stage_bits[:n_old] = self._stage_bits
+        stage_bits[positions] = delta_bits
+
+        period_codes, period_labels = self._period_codes, self._period_labels
+        date_col = self._lead_columns['registro']
+        if date_col:
+            delta_periods = pd.to_datetime(delta[date_col]).dt.to_period('M').astype(str).to_numpy()
+            labels = sorted(set(period_labels) | set(delta_periods))
+            codes = np.empty(n_rows, dtype=np.int64)
+            codes[:n_old] = np.searchsorted(labels, period_labels)[period_codes]
+            codes[positions] = np.searchsorted(labels, delta_periods)
+            # Drop months left without leads, as a full load would
+            used = np.bincount(codes, minlength=len(labels)) > 0
+            if not used.all():
+                codes = (np.cumsum(used) - 1)[codes]
+                labels = [label for label, keep in zip(labels, used) if keep]
+            period_codes, period_labels = codes, labels
+
+        desarrollo_col = self._lead_columns['desarrollo']
+        lead_index = self._lead_index.with_rows(
+            positions, delta, n_rows, desarrollo_col=desarrollo_col, date_col=date_col,
+            region_by_desarrollo=self._region_map
+        )
+        lead_cube = self._lead_cube.with_delta(
+            removed, removed_bits, delta, delta_bits, desarrollo_col=desarrollo_col, date_col=date_col
+        )
+
+        funnel = dict(self._cached_funnel)
+        added_counts, removed_counts = self._funnel_counts(delta_bits), self._funnel_counts(removed_bits)
+        for key in added_counts:
+            funnel[key] += added_counts[key] - removed_counts[key]
+        funnel['total_leads'] = n_rows
+        developments = self._developments_with_delta(removed, delta)
+
+        cohorts = self._cohorts.with_delta(
+            new_leads, removed, delta, desarrollo_col=desarrollo_col,
+            stage_columns=self._stage_columns, region_by_desarrollo=self._region_map
+        )
+
+        snapshot = copy.copy(self)
+        snapshot.loaded_at = time.time()
+        snapshot._leads_df = new_leads
+        snapshot._stage_bits = stage_bits
+        snapshot._period_codes, snapshot._period_labels = period_codes, period_labels
+        snapshot._lead_index, snapshot._lead_cube = lead_index, lead_cube
+        snapshot._cached_funnel = funnel
+        snapshot._cached_metrics = snapshot._calculate_metrics_internal()
+        snapshot._cached_developments_list = developments
+        snapshot._cohorts = cohorts
+        snapshot._encoded = {}
+        snapshot._data_version = hashlib.sha256(f"{self._data_version}+{source_hash}".encode()).hexdigest()
+        # Raw deltas are kept so other processes (cohort pool) can replay them
+        snapshot._applied_deltas = self._applied_deltas + ((snapshot._data_version, delta_df, source_hash),)
+
+        print(f"Ingested {len(delta)} leads ({n_inserted} new, {len(replaced)} updated)")
+        return snapshot, LeadDelta(removed=removed, added=delta, inserted=n_inserted, updated=len(replaced))
+
     def _precalculate_all(self):
         """Pre-calculate all metrics at startup for fast responses"""
         print("Pre-calculating metrics...")
@@ -189,19 +689,19 @@ class DataLoader:
         # Each stage requires having passed the previous stage
 
         # Contacto: must have fecha_contacto
-        has_contacto = leads[contacto_col].notna() if contacto_col else pd.Series([False] * total)
+        has_contacto = stage_present(leads[contacto_col]) if contacto_col else pd.Series([False] * total)
         contacts = int(has_contacto.sum())
 
         # Cita: must have fecha_cita AND fecha_contacto (can't have appointment without contact)
-        has_cita = leads[cita_col].notna() if cita_col else pd.Series([False] * total)
+        has_cita = stage_present(leads[cita_col]) if cita_col else pd.Series([False] * total)
         appointments = int((has_cita & has_contacto).sum())
 
         # Venta: must have fecha_venta AND fecha_cita AND fecha_contacto
-        has_venta = leads[venta_col].notna() if venta_col else pd.Series([False] * total)
+        has_venta = stage_present(leads[venta_col]) if venta_col else pd.Series([False] * total)
         sales = int((has_venta & has_cita & has_contacto).sum())
 
         # Escrituración: must have all previous stages
-        has_escritura = leads[escritura_col].notna() if escritura_col else pd.Series([False] * total)
+        has_escritura = stage_present(leads[escritura_col]) if escritura_col else pd.Series([False] * total)
         closings = int((has_escritura & has_venta & has_cita & has_contacto).sum())
 
         return {
@@ -302,7 +802,7 @@ class DataLoader:
                 dev_mask = leads_df[leads_dev_col] == name
                 total_leads = int(dev_mask.sum())
                 if venta_col:
-                    total_sales = int(leads_df.loc[dev_mask, venta_col].notna().sum())
+                    total_sales = int(stage_present(leads_df.loc[dev_mask, venta_col]).sum())
 
             total_investment = 0.0
             if inv_dev_col and inv_col:
@@ -335,6 +835,108 @@ class DataLoader:
     def developments(self) -> pd.DataFrame:
         return self._developments_df if self._developments_df is not None else pd.DataFrame()
 
+    @property
+    def lead_columns(self) -> Dict[str, Optional[str]]:
+        """Resolved leads columns: 'desarrollo' and 'registro' (registration date)"""
+        return self._lead_columns
+
+    @property
+    def investment_columns(self) -> Dict[str, Optional[str]]:
+        """Resolved investment columns: 'desarrollo', 'fecha' and 'amount'"""
+        return self._investment_columns
+
+    @property
+    def stage_columns(self) -> Dict[str, Optional[str]]:
+        return self._stage_columns
+
+    @property
+    def stage_bits(self) -> np.ndarray:
+        """Per-lead bitmask of funnel stages with a date (see olap_cube.CUBE_STAGES)"""
+        return self._stage_bits
+
+    @property
+    def present_stages(self) -> List[str]:
+        return self._present_stages
+
+    @property
+    def period_codes(self) -> Optional[np.ndarray]:
+        return self._period_codes
+
+    @property
+    def period_labels(self) -> List[str]:
+        return self._period_labels
+
+    @property
+    def compact(self) -> bool:
+        return self._compact
+
+    def memory_report(self) -> List[dict]:
+        """Bytes per leads column; includes the pre-compaction layout when it was converted in this process"""
+        if self._memory_report is not None:
+            return self._memory_report
+        return memory_report(None, self._leads_df)
+
+    @property
+    def region_by_desarrollo(self) -> Optional[dict]:
+        return self._region_map
+
+    @property
+    def lead_index(self) -> LeadIndex:
+        return self._lead_index
+
+    @property
+    def lead_cube(self) -> LeadCube:
+        return self._lead_cube
+
+    @property
+    def investment_cube(self) -> InvestmentCube:
+        return self._investment_cube
+
+    @property
+    def cohorts(self) -> CohortPrecalc:
+        return self._cohorts
+
+    @property
+    def data_path(self) -> Path:
+        return self._data_path
+
+    @property
+    def data_version(self) -> Optional[str]:
+        """Content hash of the loaded workbook (chained with the hash of each ingested delta)"""
+        return self._data_version
+
+    @property
+    def base_version(self) -> Optional[str]:
+        """Content hash of the loaded workbook, without ingested deltas"""
+        return self._base_version
+
+    def deltas_since(self, version: Optional[str]) -> Optional[List[Tuple[pd.DataFrame, str]]]:
+        """
+        Deltas (raw delta, source hash) that turn the snapshot with `version` into this one
+        when applied in order with with_lead_delta; None if `version` is not an ancestor
+        (another workbook, or a delta chain that diverged).
+        """
+        if version == self._base_version:
+            return [(delta_df, source_hash) for _, delta_df, source_hash in self._applied_deltas]
+        versions = [applied_version for applied_version, _, _ in self._applied_deltas]
+        if version not in versions:
+            return None
+        return [(delta_df, source_hash) for _, delta_df, source_hash in self._applied_deltas[versions.index(version) + 1:]]
+
+    def selection(self, filters) -> LeadSelection:
+        """Leads of this snapshot matching `filters`, resolved once and shared across calculations"""
+        return LeadSelection(self, filters)
+
+    def encoded(self, name: str, build: Callable[[], Any]) -> Any:
+        """
+        JSON body built once for this version (e.g. the developments list). Two
+        requests racing on the first call may both build it; the result is the same.
+        """
+        body = self._encoded.get(name)
+        if body is None:
+            body = self._encoded[name] = build()
+        return body
+
     # Fast cached getters
     def get_cached_metrics(self):
         return self._cached_metrics
@@ -353,5 +955,234 @@ class DataLoader:
         }
 
 
+class DataNotReady(RuntimeError):
+    """Data was requested before the first snapshot finished loading"""
+
+
+class BuildInProgress(RuntimeError):
+    """An ingestion was requested while another build (load, reload or ingestion) holds the build lock"""
+
+
+class DataLoader:
+    """
+    Holds the current DataSnapshot and replaces it atomically.
+
+    Creating the loader is cheap: nothing is read until start() (app startup,
+    loads in a background thread) or load() (scripts, loads synchronously).
+    Until the first snapshot is ready, data access raises DataNotReady.
+
+    A reload (admin endpoint or file watch) builds the new snapshot in a
+    background thread while requests keep being served from the current one;
+    the swap is a single reference assignment. Code that reads several
+    attributes for one request should take `data_loader.snapshot` once and use
+    it throughout. Other attributes are delegated to the current snapshot.
+    """
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not DataLoader._initialized:
+            # Builds (reload, ingestion) are serialized; readers never take the lock
+            self._build_lock = threading.Lock()
+            self._snapshot: Optional[DataSnapshot] = None
+            self._reload_thread: Optional[threading.Thread] = None
+            self._reload_error: Optional[str] = None
+            self._watch_thread: Optional[threading.Thread] = None
+            # Progress of the build in flight (first load or reload)
+            self._load_step: Optional[str] = None
+            self._load_started: Optional[float] = None
+            DataLoader._initialized = True
+
+    def __getattr__(self, name):
+        # Only called for attributes DataLoader itself does not define
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.snapshot, name)
+
+    def _get_data_path(self) -> Path:
+        # DATA_FILE points the loader at another workbook (e.g. benchmarks)
+        if os.environ.get('DATA_FILE'):
+            data_path = Path(os.environ['DATA_FILE'])
+        else:
+            current_dir = Path(__file__).parent.parent.parent
+            data_path = current_dir / "data" / "Datos_prueba_v3.xlsx"
+        if not data_path.exists():
+            raise FileNotFoundError(f"Excel file not found at {data_path}")
+        return data_path
+
+    def _set_load_step(self, step: str):
+        self._load_step = step
+
+    def _build_snapshot(self) -> DataSnapshot:
+        # SHARED_DATA=1: workers (uvicorn --workers N) map one copy of the data;
+        # it implies the compact layout, whose columns are all fixed-width arrays
+        shared = os.environ.get('SHARED_DATA', '0') == '1'
+        compact = shared or os.environ.get('COMPACT_LEADS', '0') == '1'
+        self._load_started = time.time()
+        try:
+            return DataSnapshot(self._get_data_path(), compact=compact, shared=shared,
+                                progress=self._set_load_step)
+        finally:
+            self._load_step = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def snapshot(self) -> DataSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise DataNotReady("Data is still loading")
+        return snapshot
+
+    @property
+    def data_version(self) -> Optional[str]:
+        """Version of the current snapshot (None while the first load runs)"""
+        snapshot = self._snapshot
+        return snapshot.data_version if snapshot is not None else None
+
+    def _swap(self, snapshot: DataSnapshot):
+        previous = self._snapshot
+        self._snapshot = snapshot
+        if previous is None:
+            print(f"Data snapshot ready: {snapshot.data_version[:12]}")
+        else:
+            print(f"Data snapshot swapped: {previous.data_version[:12]} -> {snapshot.data_version[:12]}")
+
+    def start(self):
+        """
+        Load the first snapshot in a background thread (called at app startup,
+        so the server accepts connections while the workbook is parsed) and
+        start the file watch if DATA_WATCH_INTERVAL is set.
+        """
+        if self._snapshot is None:
+            self.reload()
+
+        # DATA_WATCH_INTERVAL=N reloads when the workbook changes (checked every N seconds)
+        interval = float(os.environ.get('DATA_WATCH_INTERVAL', '0'))
+        if interval > 0:
+            self.watch(interval)
+
+    def load(self) -> DataSnapshot:
+        """Load the first snapshot in the calling thread (scripts, benchmarks)"""
+        with self._build_lock:
+            if self._snapshot is None:
+                self._swap(self._build_snapshot())
+        return self._snapshot
+
+    def apply_lead_delta(self, delta_df: pd.DataFrame, source_hash: str) -> Tuple[DataSnapshot, LeadDelta]:
+        """
+        Apply a leads delta on top of the current snapshot and swap in the result.
+        Raises BuildInProgress instead of waiting if a load, reload or another
+        ingestion is running (a reload can hold the lock for the whole workbook build).
+        """
+        if not self._build_lock.acquire(blocking=False):
+            raise BuildInProgress("A data load, reload or ingestion is already running")
+        try:
+            snapshot, delta = self.snapshot.with_lead_delta(delta_df, source_hash)
+            self._swap(snapshot)
+        finally:
+            self._build_lock.release()
+        return snapshot, delta
+
+    def _reload_worker(self):
+        try:
+            with self._build_lock:
+                snapshot = self._build_snapshot()
+                self._swap(snapshot)
+            self._reload_error = None
+        except Exception as e:
+            # Keep serving the current snapshot (if any)
+            self._reload_error = str(e)
+            print(f"Reload failed: {e}")
+
+    def reload(self, wait: bool = False) -> bool:
+        """
+        Rebuild the snapshot from the source workbook in a background thread.
+        Deltas ingested since the last load are discarded. Returns False if a
+        load or reload is already running.
+        """
+        thread = self._reload_thread
+        if thread is not None and thread.is_alive():
+            return False
+        thread = threading.Thread(target=self._reload_worker, name="data-reload", daemon=True)
+        self._reload_thread = thread
+        thread.start()
+        if wait:
+            thread.join()
+        return True
+
+    @property
+    def reloading(self) -> bool:
+        return self._reload_thread is not None and self._reload_thread.is_alive()
+
+    def watch(self, interval: float):
+        """Poll the source workbook every `interval` seconds and reload when it changes"""
+        if self._watch_thread is not None:
+            return
+
+        def signature() -> Optional[Tuple[int, int]]:
+            try:
+                stat = self._get_data_path().stat()
+            except (FileNotFoundError, OSError):
+                return None
+            return stat.st_mtime_ns, stat.st_size
+
+        def poll():
+            last = signature()
+            while True:
+                time.sleep(interval)
+                current = signature()
+                if current is not None and current != last:
+                    print("Source workbook changed, reloading...")
+                    last = current
+                    self.reload()
+
+        self._watch_thread = threading.Thread(target=poll, name="data-watch", daemon=True)
+        self._watch_thread.start()
+
+    def readiness(self) -> dict:
+        """Progress of the first load: status is 'ready', 'loading' or 'error'"""
+        if self._snapshot is not None:
+            status = 'ready'
+        elif self._reload_error is not None and not self.reloading:
+            status = 'error'
+        else:
+            status = 'loading'
+        steps = DataSnapshot.LOAD_STEPS
+        step = self._load_step if status == 'loading' else None
+        if status == 'ready':
+            steps_done = len(steps)
+        else:
+            steps_done = steps.index(step) if step else 0
+        return {
+            'status': status,
+            'step': step,
+            'steps_done': steps_done,
+            'steps_total': len(steps),
+            'elapsed_seconds': round(time.time() - self._load_started, 2) if step else None,
+            'error': self._reload_error if status == 'error' else None,
+        }
+
+    def status(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            'ready': snapshot is not None,
+            'data_version': snapshot.data_version if snapshot is not None else None,
+            'loaded_at': snapshot.loaded_at if snapshot is not None else None,
+            'total_leads': len(snapshot.leads) if snapshot is not None else 0,
+            'reloading': self.reloading,
+            'load_step': self._load_step,
+            'last_reload_error': self._reload_error,
+            'watching': self._watch_thread is not None,
+        }
+
+
 # Singleton instance
 data_loader = DataLoader()
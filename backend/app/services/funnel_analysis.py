@@ -1,154 +1,80 @@
-import pandas as pd
-from typing import List, Optional
+import numpy as np
+from typing import Dict, Optional
 from app.models.schemas import FilterParams, FunnelResponse, FunnelStageData, ConversionTrendResponse, ConversionTrendPoint
-from app.services.data_loader import data_loader
+from app.services.data_loader import DataSnapshot, LeadSelection, data_loader
+from app.services.olap_cube import (
+    CUBE_STAGES, N_MASKS, mask_counts_from_bits, sequential_counts, supports_filters
+)
 
 
 class FunnelAnalysisService:
     STAGE_CONFIG = [
         {
             'stage': 'lead',
-            'label': 'Lead',
-            'columns': ['fecha_registro', 'fecha_de_registro', 'registro']
+            'label': 'Lead'
         },
         {
             'stage': 'contacto',
-            'label': 'Contacto',
-            'columns': ['fecha_contacto', 'fecha_de_contacto', 'contacto']
+            'label': 'Contacto'
         },
         {
             'stage': 'cita',
             'label': 'Cita',
-            'columns': ['fecha_cita', 'fecha_de_cita', 'cita'],
             'requires': 'contacto'
         },
         {
             'stage': 'venta_bruta',
             'label': 'Venta Bruta',
-            'columns': ['fecha_venta_bruta', 'fecha_de_venta_bruta', 'venta_bruta', 'venta'],
             'requires': 'cita'
         },
         {
             'stage': 'escrituracion',
             'label': 'Escrituracion',
-            'columns': ['fecha_escrituracion', 'fecha_de_escrituración', 'escrituracion', 'escrituración'],
             'requires': 'venta_bruta'
         }
     ]
 
-    def __init__(self):
-        self.df = data_loader.leads
-        self._stage_columns = {}
-        for config in self.STAGE_CONFIG:
-            col = self._find_column(config['columns'])
-            self._stage_columns[config['stage']] = col
-
-    def _find_column(self, possible_names: List[str]) -> Optional[str]:
-        for name in possible_names:
-            for col in self.df.columns:
-                if name in col.lower():
-                    return col
-        return None
-
-    def _apply_filters(self, df: pd.DataFrame, filters: FilterParams) -> pd.DataFrame:
-        if filters is None:
-            return df
-
-        desarrollo_col = self._find_column(['desarrollo', 'project', 'proyecto'])
-
-        if filters.desarrollos:
-            if desarrollo_col:
-                df = df[df[desarrollo_col].isin(filters.desarrollos)]
-
-        if filters.regiones:
-            # Region is in developments table, need to lookup which desarrollos belong to region
-            developments_df = data_loader.developments
-            region_col = None
-            for col in developments_df.columns:
-                # Handle encoding issues: check for various forms of "region"
-                col_clean = col.lower().replace('ó', 'o').replace('ö', 'o')
-                if 'region' in col_clean or 'regi' in col_clean:
-                    region_col = col
-                    break
-            dev_name_col = None
-            for col in developments_df.columns:
-                if 'desarrollo' in col.lower():
-                    dev_name_col = col
-                    break
-
-            if region_col and dev_name_col and desarrollo_col:
-                # Get desarrollos that match the selected regions
-                matching_desarrollos = developments_df[
-                    developments_df[region_col].isin(filters.regiones)
-                ][dev_name_col].tolist()
-                df = df[df[desarrollo_col].isin(matching_desarrollos)]
-
-        if filters.year:
-            df = df[df['year_iso'] == filters.year]
-
-        if filters.month:
-            date_col = self._find_column(['fecha_registro', 'fecha_de_registro'])
-            if date_col and date_col in df.columns:
-                df = df[df[date_col].dt.month == filters.month]
-
-        if filters.week_iso:
-            df = df[df['week_iso'] == filters.week_iso]
-
-        if filters.date_from or filters.date_to:
-            date_col = self._find_column(['fecha_registro', 'fecha_de_registro'])
-            if date_col and date_col in df.columns:
-                if filters.date_from:
-                    df = df[df[date_col] >= pd.Timestamp(filters.date_from)]
-                if filters.date_to:
-                    df = df[df[date_col] <= pd.Timestamp(filters.date_to)]
-
-        return df
-
-    def calculate_funnel(self, filters: Optional[FilterParams] = None) -> FunnelResponse:
-        df = self._apply_filters(self.df.copy(), filters)
-
-        total_leads = len(df)
+    # Las columnas de cada etapa se resuelven una sola vez en DataLoader;
+    # las rutas reutilizan la instancia `funnel_service` y trabajan sobre
+    # arreglos por lead (mascara de etapas, periodo) indexados por posicion,
+    # sin copiar el DataFrame de leads. Cada calculo toma el snapshot de
+    # datos una sola vez, asi una recarga a mitad del request no mezcla versiones.
+    # Quien calcula varias secciones con los mismos filtros (/dashboard) pasa
+    # una LeadSelection para resolver las filas una sola vez.
+
+    def _sequential_counts_from_rows(self, snapshot: DataSnapshot, rows: Optional[np.ndarray]) -> Dict[str, int]:
+        """Conteo por etapa recorriendo filas (para filtros que el cubo no cubre)"""
+        bits = snapshot.stage_bits if rows is None else snapshot.stage_bits[rows]
+        return sequential_counts(mask_counts_from_bits(bits), snapshot.present_stages)
+
+    def calculate_funnel(self, filters: Optional[FilterParams] = None,
+                         selection: Optional[LeadSelection] = None) -> FunnelResponse:
+        selection = selection or data_loader.snapshot.selection(filters)
+        snapshot = selection.snapshot
+        if supports_filters(filters):
+            # Sumar celdas del cubo pre-agregado
+            counts = snapshot.lead_cube.sequential_counts(filters)
+        else:
+            # Resolver filtros con el indice de bitmaps (sin escanear el DataFrame)
+            counts = self._sequential_counts_from_rows(snapshot, selection.rows)
+
+        total_leads = counts['total']
         if total_leads == 0:
             return FunnelResponse(stages=[], total_leads=0)
 
         stages = []
         previous_count = total_leads
-        cumulative_mask = pd.Series([True] * len(df), index=df.index)
 
         for stage_config in self.STAGE_CONFIG:
             stage = stage_config['stage']
-            label = stage_config['label']
-            col = self._stage_columns.get(stage)
-
-            if stage == 'lead':
-                count = total_leads
-            else:
-                if col and col in df.columns:
-                    # La etapa actual requiere tener fecha no nula
-                    stage_mask = df[col].notna()
-
-                    # Si esta etapa requiere una etapa previa, combinar mascaras
-                    requires = stage_config.get('requires')
-                    if requires:
-                        req_col = self._stage_columns.get(requires)
-                        if req_col and req_col in df.columns:
-                            # Solo contar si tambien tiene la etapa anterior
-                            cumulative_mask = cumulative_mask & df[req_col].notna()
-
-                    # Contar leads que cumplen con la secuencia hasta esta etapa
-                    count = int((stage_mask & cumulative_mask).sum())
-
-                    # Actualizar mascara acumulativa para la siguiente etapa
-                    cumulative_mask = cumulative_mask & stage_mask
-                else:
-                    count = 0
+            count = total_leads if stage == 'lead' else counts[stage]
 
             percentage_of_total = round((count / total_leads * 100), 2) if total_leads > 0 else 0
             conversion_from_previous = round((count / previous_count * 100), 2) if previous_count > 0 else 0
 
             stages.append(FunnelStageData(
                 stage=stage,
-                stage_label=label,
+                stage_label=stage_config['label'],
                 count=count,
                 percentage_of_total=percentage_of_total,
                 conversion_from_previous=conversion_from_previous
@@ -158,79 +84,62 @@ class FunnelAnalysisService:
 
         return FunnelResponse(stages=stages, total_leads=total_leads)
 
-    def calculate_trends(self, filters: Optional[FilterParams] = None) -> ConversionTrendResponse:
+    def calculate_trends(self, filters: Optional[FilterParams] = None,
+                         selection: Optional[LeadSelection] = None) -> ConversionTrendResponse:
         """Calcula tendencia de conversiones por mes"""
-        df = self._apply_filters(self.df.copy(), filters)
-
-        if df.empty:
-            return ConversionTrendResponse(data=[], period_type="monthly")
-
-        # Obtener columna de fecha de registro
-        date_col = self._find_column(['fecha_registro', 'fecha_de_registro'])
-        if not date_col or date_col not in df.columns:
+        selection = selection or data_loader.snapshot.selection(filters)
+        snapshot = selection.snapshot
+        period_codes = snapshot.period_codes
+        if period_codes is None:
             return ConversionTrendResponse(data=[], period_type="monthly")
 
-        # Crear columna de periodo (año-mes)
-        df['period'] = df[date_col].dt.to_period('M').astype(str)
+        bits = snapshot.stage_bits
+        rows = selection.rows
+        if rows is not None:
+            period_codes = period_codes[rows]
+            bits = bits[rows]
 
-        # Agrupar por periodo
-        grouped = df.groupby('period')
+        if len(bits) == 0:
+            return ConversionTrendResponse(data=[], period_type="monthly")
 
-        results = []
-        for period, group in grouped:
-            total = len(group)
-            if total == 0:
+        # Leads por (periodo, mascara de etapas) en una sola pasada
+        labels = snapshot.period_labels
+        counts = np.bincount(
+            period_codes.astype(np.int64) * N_MASKS + bits,
+            minlength=len(labels) * N_MASKS
+        ).reshape(len(labels), N_MASKS)
+        totals = counts.sum(axis=1)
+
+        # Cada etapa cuenta si tiene fecha y tambien la etapa que requiere
+        masks = np.arange(N_MASKS)
+        present = snapshot.present_stages
+        stage_counts = {}
+        for stage_config in self.STAGE_CONFIG[1:]:
+            stage = stage_config['stage']
+            if stage not in present:
+                stage_counts[stage] = np.zeros(len(labels), dtype=np.int64)
                 continue
+            required = 1 << CUBE_STAGES.index(stage)
+            requires = stage_config.get('requires')
+            if requires in present:
+                required |= 1 << CUBE_STAGES.index(requires)
+            stage_counts[stage] = counts[:, (masks & required) == required].sum(axis=1)
 
-            # Calcular conversiones para cada etapa
-            contacto_count = 0
-            cita_count = 0
-            venta_count = 0
-            escrituracion_count = 0
-
-            # Contacto
-            col = self._stage_columns.get('contacto')
-            if col and col in group.columns:
-                contacto_count = group[col].notna().sum()
-
-            # Cita (requiere contacto)
-            col_cita = self._stage_columns.get('cita')
-            col_contacto = self._stage_columns.get('contacto')
-            if col_cita and col_cita in group.columns:
-                if col_contacto and col_contacto in group.columns:
-                    cita_count = (group[col_cita].notna() & group[col_contacto].notna()).sum()
-                else:
-                    cita_count = group[col_cita].notna().sum()
-
-            # Venta (requiere cita)
-            col_venta = self._stage_columns.get('venta_bruta')
-            if col_venta and col_venta in group.columns:
-                if col_cita and col_cita in group.columns:
-                    venta_count = (group[col_venta].notna() & group[col_cita].notna()).sum()
-                else:
-                    venta_count = group[col_venta].notna().sum()
-
-            # Escrituración (requiere venta)
-            col_escr = self._stage_columns.get('escrituracion')
-            if col_escr and col_escr in group.columns:
-                if col_venta and col_venta in group.columns:
-                    escrituracion_count = (group[col_escr].notna() & group[col_venta].notna()).sum()
-                else:
-                    escrituracion_count = group[col_escr].notna().sum()
-
-            results.append(ConversionTrendPoint(
-                period=str(period),
-                leads=total,
-                contacto=round(contacto_count / total * 100, 1) if total > 0 else 0,
-                cita=round(cita_count / total * 100, 1) if total > 0 else 0,
-                venta_bruta=round(venta_count / total * 100, 1) if total > 0 else 0,
-                escrituracion=round(escrituracion_count / total * 100, 1) if total > 0 else 0
+        # Periodos ordenados (las etiquetas ya estan ordenadas)
+        results = []
+        for p in np.flatnonzero(totals):
+            total = totals[p]
+            # Tipos de Python explicitos: se construye sin validar
+            results.append(ConversionTrendPoint.model_construct(
+                period=str(labels[p]),
+                leads=int(total),
+                contacto=float(round(stage_counts['contacto'][p] / total * 100, 1)),
+                cita=float(round(stage_counts['cita'][p] / total * 100, 1)),
+                venta_bruta=float(round(stage_counts['venta_bruta'][p] / total * 100, 1)),
+                escrituracion=float(round(stage_counts['escrituracion'][p] / total * 100, 1))
             ))
 
-        # Ordenar por periodo
-        results.sort(key=lambda x: x.period)
-
-        return ConversionTrendResponse(data=results, period_type="monthly")
+        return ConversionTrendResponse.model_construct(data=results, period_type="monthly")
 
 
 funnel_service = FunnelAnalysisService()
@@ -0,0 +1,39 @@
+"""
+Codificacion JSON de resultados de analitica.
+
+Los resultados cacheados (heatmaps, cohorts, desarrollos) se codifican a bytes
+una sola vez y las rutas los devuelven tal cual, sin pasar de nuevo por la
+validacion de response_model ni por el encoder de la libreria estandar. Con
+orjson la codificacion es varias veces mas rapida; sin orjson se usa json con
+las mismas opciones que JSONResponse, de modo que los bytes son los mismos.
+"""
+
+import json
+from typing import Any
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+if orjson is not None:
+    # Las llaves int de CohortData.conversions se escriben como string, igual que pydantic
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(value: Any) -> bytes:
+    """JSON compacto (UTF-8) de un modelo, lista de modelos o valor plano"""
+    if isinstance(value, BaseModel):
+        value = value.model_dump()
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+    return json.dumps(value, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,227 @@
+"""
+Indice de bitmaps sobre las dimensiones de la tabla de leads.
+
+Para cada valor de desarrollo, region, year_iso, month, week_iso y cohort_week
+se guarda un bitmap empaquetado (np.packbits, 1 bit por lead). Un FilterParams
+se resuelve como OR dentro de cada dimension y AND entre dimensiones, sin
+recorrer ni copiar el DataFrame completo.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.models.schemas import FilterParams
+
+# Numero de bits en 1 para cada byte posible
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class LeadIndex:
+    DIMENSIONS = ('desarrollo', 'region', 'year_iso', 'month', 'week_iso', 'cohort_week')
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+        self._bitmaps: Dict[str, Dict[Any, np.ndarray]] = {}
+        # Fechas de registro ordenadas, para rangos date_from/date_to
+        self._date_order: Optional[np.ndarray] = None
+        self._sorted_dates: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _dimension_values(leads_df: pd.DataFrame, desarrollo_col: Optional[str], date_col: Optional[str],
+                          region_by_desarrollo: Optional[Dict[str, str]]) -> Dict[str, pd.Series]:
+        values = {}
+        if desarrollo_col:
+            values['desarrollo'] = leads_df[desarrollo_col]
+            if region_by_desarrollo is not None:
+                values['region'] = leads_df[desarrollo_col].map(region_by_desarrollo)
+
+        for col in ('year_iso', 'week_iso', 'cohort_week'):
+            if col in leads_df.columns:
+                values[col] = leads_df[col]
+
+        if date_col:
+            values['month'] = pd.to_datetime(leads_df[date_col]).dt.month
+        return values
+
+    @classmethod
+    def build(cls, leads_df: pd.DataFrame, desarrollo_col: Optional[str],
+              date_col: Optional[str], region_by_desarrollo: Optional[Dict[str, str]]) -> 'LeadIndex':
+        index = cls(len(leads_df))
+
+        for name, values in cls._dimension_values(leads_df, desarrollo_col, date_col, region_by_desarrollo).items():
+            index.add_dimension(name, values)
+
+        if date_col:
+            index.set_dates(pd.to_datetime(leads_df[date_col]).to_numpy(dtype='datetime64[ns]'))
+
+        return index
+
+    def with_rows(self, positions: np.ndarray, rows_df: pd.DataFrame, n_rows: int,
+                  desarrollo_col: Optional[str], date_col: Optional[str],
+                  region_by_desarrollo: Optional[Dict[str, str]]) -> 'LeadIndex':
+        """
+        Nuevo indice con las filas de rows_df escritas en `positions`
+        (posiciones existentes se reemplazan, las nuevas se agregan al final).
+        Solo se tocan los bits de esas posiciones; el indice actual no cambia.
+        """
+        index = LeadIndex(n_rows)
+        n_bytes = (n_rows + 7) // 8
+        replaced = positions[positions < self.n_rows]
+        replaced_bytes = replaced >> 3
+        replaced_masks = ~(np.uint8(0x80) >> (replaced & 7).astype(np.uint8))
+
+        for name, dimension in self._bitmaps.items():
+            bitmaps = {}
+            for value, bm in dimension.items():
+                grown = np.zeros(n_bytes, dtype=np.uint8)
+                grown[:len(bm)] = bm
+                np.bitwise_and.at(grown, replaced_bytes, replaced_masks)
+                bitmaps[value] = grown
+            index._bitmaps[name] = bitmaps
+
+        dimension_values = self._dimension_values(rows_df, desarrollo_col, date_col, region_by_desarrollo)
+        for name, values in dimension_values.items():
+            bitmaps = index._bitmaps.setdefault(name, {})
+            codes, uniques = pd.factorize(values, use_na_sentinel=True)
+            for code, value in enumerate(uniques):
+                selected = positions[codes == code]
+                bm = bitmaps.get(value)
+                if bm is None:
+                    bm = bitmaps[value] = np.zeros(n_bytes, dtype=np.uint8)
+                np.bitwise_or.at(bm, selected >> 3, np.uint8(0x80) >> (selected & 7).astype(np.uint8))
+
+        if self._sorted_dates is not None and date_col:
+            # Quitar las filas reemplazadas e insertar las nuevas fechas en orden
+            keep = ~np.isin(self._date_order, replaced)
+            order, sorted_dates = self._date_order[keep], self._sorted_dates[keep]
+            dates = pd.to_datetime(rows_df[date_col]).to_numpy(dtype='datetime64[ns]')
+            valid = np.flatnonzero(~np.isnat(dates))
+            valid = valid[np.argsort(dates[valid], kind='stable')]
+            at = np.searchsorted(sorted_dates, dates[valid], side='right')
+            index._date_order = np.insert(order, at, positions[valid])
+            index._sorted_dates = np.insert(sorted_dates, at, dates[valid])
+
+        return index
+
+    def to_arrays(self) -> Tuple[Dict[str, np.ndarray], dict]:
+        """Arreglos y metadatos (JSON) del indice, para guardarlo junto al snapshot columnar."""
+        arrays, values = {}, {}
+        for name, dimension in self._bitmaps.items():
+            if dimension:
+                arrays[f"bitmaps.{name}"] = np.stack(list(dimension.values()))
+            else:
+                arrays[f"bitmaps.{name}"] = np.zeros((0, (self.n_rows + 7) // 8), dtype=np.uint8)
+            values[name] = [value.item() if isinstance(value, np.generic) else value for value in dimension]
+        if self._sorted_dates is not None:
+            arrays['date_order'] = self._date_order
+            arrays['sorted_dates'] = self._sorted_dates
+        return arrays, {'n_rows': self.n_rows, 'values': values}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], meta: dict) -> 'LeadIndex':
+        """Indice sobre arreglos ya construidos (p.ej. memory-maps de solo lectura)."""
+        index = cls(meta['n_rows'])
+        for name, values in meta['values'].items():
+            matrix = arrays[f"bitmaps.{name}"]
+            index._bitmaps[name] = {value: matrix[i] for i, value in enumerate(values)}
+        index._date_order = arrays.get('date_order')
+        index._sorted_dates = arrays.get('sorted_dates')
+        return index
+
+    def add_dimension(self, name: str, values: pd.Series):
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        self._bitmaps[name] = {
+            value: np.packbits(codes == code) for code, value in enumerate(uniques)
+        }
+
+    def set_dates(self, dates: np.ndarray):
+        valid = np.flatnonzero(~np.isnat(dates))
+        order = valid[np.argsort(dates[valid], kind='stable')]
+        self._date_order = order
+        self._sorted_dates = dates[order]
+
+    def has_dimension(self, name: str) -> bool:
+        return name in self._bitmaps
+
+    def values(self, name: str) -> List[Any]:
+        return list(self._bitmaps.get(name, {}).keys())
+
+    # ---- Operaciones de bitmaps ----
+
+    def empty_bitmap(self) -> np.ndarray:
+        return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+
+    def full_bitmap(self) -> np.ndarray:
+        return np.packbits(np.ones(self.n_rows, dtype=bool))
+
+    def bitmap(self, name: str, values: Iterable[Any]) -> np.ndarray:
+        """OR de los bitmaps de `values` en la dimension `name`."""
+        result = self.empty_bitmap()
+        dimension = self._bitmaps.get(name, {})
+        for value in values:
+            bm = dimension.get(value)
+            if bm is not None:
+                np.bitwise_or(result, bm, out=result)
+        return result
+
+    def date_range_bitmap(self, date_from=None, date_to=None) -> np.ndarray:
+        sorted_dates = self._sorted_dates
+        lo = 0
+        hi = len(sorted_dates)
+        if date_from:
+            lo = np.searchsorted(sorted_dates, np.datetime64(pd.Timestamp(date_from), 'ns'), side='left')
+        if date_to:
+            hi = np.searchsorted(sorted_dates, np.datetime64(pd.Timestamp(date_to), 'ns'), side='right')
+
+        selected = np.zeros(self.n_rows, dtype=bool)
+        selected[self._date_order[lo:hi]] = True
+        return np.packbits(selected)
+
+    @staticmethod
+    def count(bitmap: np.ndarray) -> int:
+        return int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+    def to_rows(self, bitmap: np.ndarray) -> np.ndarray:
+        """Posiciones (ordenadas) de los leads presentes en el bitmap."""
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows))
+
+    # ---- Resolucion de filtros ----
+
+    def filter_bitmap(self, filters: Optional[FilterParams]) -> Optional[np.ndarray]:
+        """
+        Resuelve un FilterParams a un bitmap de leads.
+        Retorna None si no hay ningun filtro aplicable (todas las filas).
+        """
+        if filters is None:
+            return None
+
+        parts = []
+        if filters.desarrollos and self.has_dimension('desarrollo'):
+            parts.append(self.bitmap('desarrollo', filters.desarrollos))
+        if filters.regiones and self.has_dimension('region'):
+            parts.append(self.bitmap('region', filters.regiones))
+        if filters.year and self.has_dimension('year_iso'):
+            parts.append(self.bitmap('year_iso', [filters.year]))
+        if filters.month and self.has_dimension('month'):
+            parts.append(self.bitmap('month', [filters.month]))
+        if filters.week_iso and self.has_dimension('week_iso'):
+            parts.append(self.bitmap('week_iso', [filters.week_iso]))
+        if (filters.date_from or filters.date_to) and self._sorted_dates is not None:
+            parts.append(self.date_range_bitmap(filters.date_from, filters.date_to))
+
+        if not parts:
+            return None
+
+        result = parts[0]
+        for bm in parts[1:]:
+            result = np.bitwise_and(result, bm)
+        return result
+
+    def select(self, filters: Optional[FilterParams]) -> Optional[np.ndarray]:
+        """Posiciones de los leads que cumplen los filtros, o None si son todos."""
+        bitmap = self.filter_bitmap(filters)
+        if bitmap is None:
+            return None
+        return self.to_rows(bitmap)
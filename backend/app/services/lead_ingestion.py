@@ -0,0 +1,58 @@
+"""
+Ingesta incremental de leads.
+
+Recibe un archivo delta (Excel o CSV con las columnas de la hoja de leads),
+construye un nuevo snapshot de datos a partir del actual, actualizando
+indice, cubos, agregados y tensores de cohorts solo con las filas tocadas.
+Los leads cuyo id ya existe reemplazan a la fila anterior; el resto se
+agrega al final. El delta debe traer las columnas de id, fecha de registro y
+desarrollo; las filas sin datos de leads se descartan.
+
+Los cambios viven en memoria: al reiniciar (o recargar el Excel) se vuelve a
+cargar el archivo fuente, por lo que los deltas deben integrarse tambien ahi.
+"""
+
+import hashlib
+import io
+import time
+
+import pandas as pd
+
+from app.services.data_loader import data_loader
+
+DELTA_FORMATS = ('xlsx', 'csv')
+
+
+class LeadIngestionService:
+    def read_delta(self, content: bytes, fmt: str) -> pd.DataFrame:
+        if fmt == 'csv':
+            return pd.read_csv(io.BytesIO(content))
+        with pd.ExcelFile(io.BytesIO(content)) as excel_file:
+            # Un libro con las tres hojas del archivo fuente trae los leads en la tercera
+            sheet = 2 if len(excel_file.sheet_names) >= 3 else 0
+            return excel_file.parse(sheet_name=sheet)
+
+    def ingest(self, content: bytes, fmt: str = 'xlsx') -> dict:
+        if fmt not in DELTA_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt} (usar {', '.join(DELTA_FORMATS)})")
+
+        start = time.perf_counter()
+        try:
+            delta_df = self.read_delta(content, fmt)
+        except Exception as e:
+            raise ValueError(f"No se pudo leer el delta: {e}") from e
+
+        # DataLoader aplica una ingesta (o recarga) a la vez y publica el
+        # snapshot resultante; los requests en curso siguen con el anterior
+        snapshot, delta = data_loader.apply_lead_delta(delta_df, hashlib.sha256(content).hexdigest())
+
+        return {
+            'inserted': delta.inserted,
+            'updated': delta.updated,
+            'total_leads': len(snapshot.leads),
+            'data_version': snapshot.data_version,
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+
+
+ingestion_service = LeadIngestionService()
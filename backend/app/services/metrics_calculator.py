@@ -1,119 +1,87 @@
+import numpy as np
 import pandas as pd
-from typing import List, Optional
+from typing import Dict, Optional
 from app.models.schemas import FilterParams, MetricsResponse
-from app.services.data_loader import data_loader
+from app.services.data_loader import DataSnapshot, LeadSelection, data_loader
+from app.services.olap_cube import mask_counts_from_bits, stage_counts, supports_filters
 
 
 class MetricsCalculatorService:
-    def __init__(self):
-        self.leads_df = data_loader.leads
-        self.investment_df = data_loader.investment
-
-    def _find_column(self, df: pd.DataFrame, possible_names: List[str]) -> Optional[str]:
-        for name in possible_names:
-            for col in df.columns:
-                if name in col.lower():
-                    return col
-        return None
-
-    def _apply_filters_leads(self, df: pd.DataFrame, filters: FilterParams) -> pd.DataFrame:
-        if filters is None:
-            return df
+    # Las columnas de inversion se resuelven una sola vez en DataLoader y se
+    # leen del snapshot de datos del request (cambian si se recargan los datos)
 
-        desarrollo_col = self._find_column(df, ['desarrollo', 'project', 'proyecto'])
+    def _stage_counts_from_rows(self, selection: LeadSelection) -> Dict[str, int]:
+        # Desarrollo, región, año, mes, semana y fechas se resuelven con el indice de bitmaps
+        snapshot, rows = selection.snapshot, selection.rows
+        bits = snapshot.stage_bits if rows is None else snapshot.stage_bits[rows]
+        return stage_counts(mask_counts_from_bits(bits))
 
-        # Filtrar por desarrollo
-        if filters.desarrollos:
-            if desarrollo_col:
-                df = df[df[desarrollo_col].isin(filters.desarrollos)]
-
-        # Filtrar por región (a través de la tabla de desarrollos)
-        if filters.regiones:
-            developments_df = data_loader.developments
-            region_col = None
-            for col in developments_df.columns:
-                col_clean = col.lower().replace('ó', 'o').replace('ö', 'o')
-                if 'region' in col_clean or 'regi' in col_clean:
-                    region_col = col
-                    break
-            dev_name_col = None
-            for col in developments_df.columns:
-                if 'desarrollo' in col.lower():
-                    dev_name_col = col
-                    break
-
-            if region_col and dev_name_col and desarrollo_col:
-                matching_desarrollos = developments_df[
-                    developments_df[region_col].isin(filters.regiones)
-                ][dev_name_col].tolist()
-                df = df[df[desarrollo_col].isin(matching_desarrollos)]
-
-        # Filtrar por año
-        if filters.year and 'year_iso' in df.columns:
-            df = df[df['year_iso'] == filters.year]
-
-        # Filtrar por mes
-        if filters.month:
-            date_col = self._find_column(df, ['fecha_registro', 'fecha_de_registro'])
-            if date_col and date_col in df.columns:
-                df = df[df[date_col].dt.month == filters.month]
-
-        # Filtrar por rango de fechas
-        if filters.date_from or filters.date_to:
-            date_col = self._find_column(df, ['fecha_registro', 'fecha_de_registro'])
-            if date_col and date_col in df.columns:
-                if filters.date_from:
-                    df = df[df[date_col] >= pd.Timestamp(filters.date_from)]
-                if filters.date_to:
-                    df = df[df[date_col] <= pd.Timestamp(filters.date_to)]
-
-        return df
-
-    def _apply_filters_investment(self, df: pd.DataFrame, filters: FilterParams) -> pd.DataFrame:
+    def _investment_mask(self, snapshot: DataSnapshot, filters: Optional[FilterParams]) -> Optional[np.ndarray]:
+        """Mascara de filas de inversion que cumplen los filtros (None = todas)"""
         if filters is None:
-            return df
+            return None
+
+        df = snapshot.investment
+        columns = snapshot.investment_columns
+        mask = np.ones(len(df), dtype=bool)
 
         # Filtrar por desarrollo
-        if filters.desarrollos:
-            desarrollo_col = self._find_column(df, ['desarrollo', 'project', 'proyecto'])
-            if desarrollo_col:
-                df = df[df[desarrollo_col].isin(filters.desarrollos)]
+        if filters.desarrollos and columns['desarrollo']:
+            mask &= df[columns['desarrollo']].isin(filters.desarrollos).to_numpy()
+
+        # Filtrar por región (region del desarrollo de cada fila)
+        if filters.regiones and columns['desarrollo'] and snapshot.region_by_desarrollo is not None:
+            regions = df[columns['desarrollo']].map(snapshot.region_by_desarrollo)
+            mask &= regions.isin(filters.regiones).to_numpy()
 
         # Filtrar por fecha
-        date_col = self._find_column(df, ['fecha', 'date'])
-        if date_col and date_col in df.columns:
+        date_col = columns['fecha']
+        if date_col:
+            dates = df[date_col]
             if filters.year:
-                df = df[df[date_col].dt.year == filters.year]
+                mask &= (dates.dt.year == filters.year).to_numpy()
             if filters.month:
-                df = df[df[date_col].dt.month == filters.month]
+                mask &= (dates.dt.month == filters.month).to_numpy()
             if filters.date_from:
-                df = df[df[date_col] >= pd.Timestamp(filters.date_from)]
+                mask &= (dates >= pd.Timestamp(filters.date_from)).to_numpy()
             if filters.date_to:
-                df = df[df[date_col] <= pd.Timestamp(filters.date_to)]
-
-        return df
-
-    def calculate_metrics(self, filters: Optional[FilterParams] = None) -> MetricsResponse:
-        leads_df = self._apply_filters_leads(self.leads_df.copy(), filters)
-        investment_df = self._apply_filters_investment(self.investment_df.copy(), filters)
+                mask &= (dates <= pd.Timestamp(filters.date_to)).to_numpy()
+
+        return mask
+
+    def _investment_from_rows(self, snapshot: DataSnapshot, filters: Optional[FilterParams]) -> float:
+        amount_col = snapshot.investment_columns['amount']
+        if not amount_col:
+            return 0.0
+        amounts = snapshot.investment[amount_col]
+        mask = self._investment_mask(snapshot, filters)
+        return float(amounts.sum() if mask is None else amounts[mask].sum())
+
+    def calculate_metrics(self, filters: Optional[FilterParams] = None,
+                          selection: Optional[LeadSelection] = None) -> MetricsResponse:
+        if filters is not None and filters.week_iso:
+            # La inversion es mensual: como en la version original, las metricas
+            # ignoran la semana ISO (si no, se dividiria la inversion de todo el
+            # periodo entre los leads de una semana)
+            snapshot = selection.snapshot if selection is not None else data_loader.snapshot
+            filters = filters.model_copy(update={'week_iso': None})
+            selection = snapshot.selection(filters)
+        selection = selection or data_loader.snapshot.selection(filters)
+        snapshot = selection.snapshot
+        if supports_filters(filters):
+            # Sumar celdas de los cubos pre-agregados
+            counts = snapshot.lead_cube.stage_counts(filters)
+            total_investment = snapshot.investment_cube.total(filters)
+        else:
+            counts = self._stage_counts_from_rows(selection)
+            total_investment = self._investment_from_rows(snapshot, filters)
 
         # Conteos
-        total_leads = len(leads_df)
-
-        # Buscar columnas de cada etapa
-        contacto_col = self._find_column(leads_df, ['fecha_contacto', 'fecha_de_contacto'])
-        cita_col = self._find_column(leads_df, ['fecha_cita', 'fecha_de_cita'])
-        venta_col = self._find_column(leads_df, ['fecha_venta_bruta', 'fecha_de_venta_bruta', 'venta'])
-        escritura_col = self._find_column(leads_df, ['fecha_escrituracion', 'fecha_de_escrituración', 'escrituración'])
-
-        total_contacts = int(leads_df[contacto_col].notna().sum()) if contacto_col else 0
-        total_appointments = int(leads_df[cita_col].notna().sum()) if cita_col else 0
-        total_gross_sales = int(leads_df[venta_col].notna().sum()) if venta_col else 0
-        total_closings = int(leads_df[escritura_col].notna().sum()) if escritura_col else 0
-
-        # Inversión total
-        inversion_col = self._find_column(investment_df, ['inversion', 'inversión', 'monto', 'amount'])
-        total_investment = float(investment_df[inversion_col].sum()) if inversion_col else 0.0
+        total_leads = counts['total']
+        total_contacts = counts['contacto']
+        total_appointments = counts['cita']
+        total_gross_sales = counts['venta_bruta']
+        total_closings = counts['escrituracion']
 
         # Costos por conversión
         cost_per_lead = total_investment / total_leads if total_leads > 0 else 0
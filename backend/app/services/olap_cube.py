@@ -0,0 +1,279 @@
+"""
+Cubo pre-agregado de leads e inversion.
+
+LeadCube guarda el numero de leads por celda
+(desarrollo, year_iso, month, week_iso, etapas alcanzadas), donde "etapas
+alcanzadas" es una mascara de bits con una posicion por etapa del funnel
+(contacto, cita, venta_bruta, escrituracion). InvestmentCube guarda la suma
+de inversion por (desarrollo, año, mes).
+
+Cualquier FilterParams sin rango de fechas se responde sumando celdas, de modo
+que el costo depende del numero de celdas y no del numero de leads.
+"""
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.models.schemas import FilterParams
+from app.services.compact_layout import stage_present
+
+# Orden de las etapas en la mascara de bits (bit 0 = contacto, ...)
+CUBE_STAGES = ['contacto', 'cita', 'venta_bruta', 'escrituracion']
+
+N_MASKS = 1 << len(CUBE_STAGES)
+
+_MISSING = -1
+
+
+def _int_codes(values: pd.Series) -> np.ndarray:
+    """Convierte una columna numerica con NaN a int32 con -1 como faltante."""
+    numeric = pd.to_numeric(values, errors='coerce')
+    return numeric.fillna(_MISSING).to_numpy(dtype=np.int32)
+
+
+def _desarrollo_codes(desarrollos: List[str], names: List[str]) -> np.ndarray:
+    lookup = {name: i for i, name in enumerate(names)}
+    return np.array([lookup[d] for d in desarrollos if d in lookup], dtype=np.int32)
+
+
+def stage_bitmask(leads_df: pd.DataFrame, stage_columns: Dict[str, Optional[str]]):
+    """
+    Mascara de etapas alcanzadas por lead (int16, bit i = CUBE_STAGES[i]
+    con fecha no nula) y lista de etapas que tienen columna en los datos.
+    """
+    bits = np.zeros(len(leads_df), dtype=np.int16)
+    present = []
+    for bit, stage in enumerate(CUBE_STAGES):
+        col = stage_columns.get(stage)
+        if col and col in leads_df.columns:
+            bits |= stage_present(leads_df[col]).astype(np.int16) << bit
+            present.append(stage)
+    return bits, present
+
+
+def mask_counts_from_bits(bits: np.ndarray) -> np.ndarray:
+    """Numero de leads por mascara de etapas (longitud N_MASKS)."""
+    return np.bincount(bits, minlength=N_MASKS).astype(np.int64)
+
+
+def stage_counts(mask_counts: np.ndarray) -> Dict[str, int]:
+    """Leads que tienen fecha en cada etapa, sin exigir las anteriores."""
+    masks = np.arange(N_MASKS)
+    result = {'total': int(mask_counts.sum())}
+    for bit, stage in enumerate(CUBE_STAGES):
+        result[stage] = int(mask_counts[(masks & (1 << bit)) != 0].sum())
+    return result
+
+
+def sequential_counts(mask_counts: np.ndarray, present_stages: List[str]) -> Dict[str, int]:
+    """
+    Leads que alcanzaron cada etapa habiendo pasado por todas las
+    anteriores (Lead -> Contacto -> Cita -> Venta -> Escrituracion).
+    Una etapa sin columna cuenta 0 y no se exige a las siguientes.
+    """
+    masks = np.arange(N_MASKS)
+    result = {'total': int(mask_counts.sum())}
+    required = 0
+    for bit, stage in enumerate(CUBE_STAGES):
+        if stage not in present_stages:
+            result[stage] = 0
+            continue
+        required |= 1 << bit
+        result[stage] = int(mask_counts[(masks & required) == required].sum())
+    return result
+
+
+def supports_filters(filters: Optional[FilterParams]) -> bool:
+    """Los rangos de fechas no se pueden expresar con las llaves del cubo."""
+    return filters is None or not (filters.date_from or filters.date_to)
+
+
+class LeadCube:
+    def __init__(self, desarrollos: List[str], region_by_desarrollo: Optional[Dict[str, str]],
+                 cells: Dict[str, np.ndarray], present_stages: List[str], dimensions: List[str]):
+        self.desarrollos = desarrollos
+        self.region_by_desarrollo = region_by_desarrollo
+        self.present_stages = present_stages
+        # Dimensiones con columna en los datos; las ausentes no filtran
+        self.dimensions = set(dimensions)
+        self._desarrollo = cells['desarrollo']
+        self._year = cells['year_iso']
+        self._month = cells['month']
+        self._week = cells['week_iso']
+        self._stages = cells['stages']
+        self._count = cells['count']
+
+    @staticmethod
+    def _cell_keys(leads_df: pd.DataFrame, dev_codes: np.ndarray, date_col: Optional[str],
+                   stage_bits: np.ndarray) -> pd.DataFrame:
+        n = len(leads_df)
+        if date_col:
+            month = _int_codes(pd.to_datetime(leads_df[date_col]).dt.month)
+        else:
+            month = np.full(n, _MISSING, dtype=np.int32)
+
+        return pd.DataFrame({
+            'desarrollo': dev_codes.astype(np.int32),
+            'year_iso': _int_codes(leads_df['year_iso']) if 'year_iso' in leads_df.columns else _MISSING,
+            'month': month,
+            'week_iso': _int_codes(leads_df['week_iso']) if 'week_iso' in leads_df.columns else _MISSING,
+            'stages': stage_bits,
+        })
+
+    @classmethod
+    def build(cls, leads_df: pd.DataFrame, desarrollo_col: Optional[str], date_col: Optional[str],
+              stage_bits: np.ndarray, present_stages: List[str],
+              region_by_desarrollo: Optional[Dict[str, str]]) -> 'LeadCube':
+        n = len(leads_df)
+
+        if desarrollo_col:
+            dev_codes, dev_names = pd.factorize(leads_df[desarrollo_col], use_na_sentinel=True)
+            dev_names = list(dev_names)
+        else:
+            dev_codes, dev_names = np.full(n, _MISSING), []
+
+        keys = cls._cell_keys(leads_df, dev_codes, date_col, stage_bits)
+        grouped = keys.groupby(list(keys.columns), sort=False).size().reset_index(name='count')
+
+        dimensions = [name for name, present_col in [
+            ('desarrollo', desarrollo_col), ('month', date_col),
+            ('year_iso', 'year_iso' in leads_df.columns), ('week_iso', 'week_iso' in leads_df.columns),
+        ] if present_col]
+
+        cells = {col: grouped[col].to_numpy() for col in grouped.columns}
+        return cls(dev_names, region_by_desarrollo, cells, present_stages, dimensions)
+
+    def with_delta(self, removed_df: pd.DataFrame, removed_bits: np.ndarray,
+                   added_df: pd.DataFrame, added_bits: np.ndarray,
+                   desarrollo_col: Optional[str], date_col: Optional[str]) -> 'LeadCube':
+        """
+        Nuevo cubo restando las celdas de removed_df y sumando las de added_df.
+        Solo se reagrupan las celdas existentes, no la tabla de leads.
+        """
+        desarrollos = list(self.desarrollos)
+        positions = {name: code for code, name in enumerate(desarrollos)}
+
+        def codes_for(df: pd.DataFrame) -> np.ndarray:
+            # Codigos sobre self.desarrollos; los desarrollos nuevos se agregan al final
+            if not desarrollo_col:
+                return np.full(len(df), _MISSING)
+            codes, uniques = pd.factorize(df[desarrollo_col], use_na_sentinel=True)
+            for value in uniques:
+                if value not in positions:
+                    positions[value] = len(desarrollos)
+                    desarrollos.append(value)
+            lookup = np.array([positions[value] for value in uniques] + [_MISSING], dtype=np.int64)
+            return lookup[codes]
+
+        current = pd.DataFrame({
+            'desarrollo': self._desarrollo, 'year_iso': self._year, 'month': self._month,
+            'week_iso': self._week, 'stages': self._stages, 'count': self._count,
+        })
+        removed = self._cell_keys(removed_df, codes_for(removed_df), date_col, removed_bits).assign(count=-1)
+        added = self._cell_keys(added_df, codes_for(added_df), date_col, added_bits).assign(count=1)
+
+        keys = ['desarrollo', 'year_iso', 'month', 'week_iso', 'stages']
+        combined = pd.concat([current, removed, added], ignore_index=True)
+        grouped = combined.groupby(keys, sort=False)['count'].sum().reset_index()
+        grouped = grouped[grouped['count'] != 0]
+
+        cells = {col: grouped[col].to_numpy() for col in grouped.columns}
+        return LeadCube(desarrollos, self.region_by_desarrollo, cells, self.present_stages, list(self.dimensions))
+
+    @property
+    def n_cells(self) -> int:
+        return len(self._count)
+
+    def _select(self, filters: Optional[FilterParams]) -> np.ndarray:
+        selected = np.ones(self.n_cells, dtype=bool)
+        if filters is None:
+            return selected
+
+        dims = self.dimensions
+        if filters.desarrollos and 'desarrollo' in dims:
+            selected &= np.isin(self._desarrollo, _desarrollo_codes(filters.desarrollos, self.desarrollos))
+        if filters.regiones and 'desarrollo' in dims and self.region_by_desarrollo is not None:
+            regiones = set(filters.regiones)
+            in_region = [d for d, r in self.region_by_desarrollo.items() if r in regiones]
+            selected &= np.isin(self._desarrollo, _desarrollo_codes(in_region, self.desarrollos))
+        if filters.year and 'year_iso' in dims:
+            selected &= self._year == filters.year
+        if filters.month and 'month' in dims:
+            selected &= self._month == filters.month
+        if filters.week_iso and 'week_iso' in dims:
+            selected &= self._week == filters.week_iso
+        return selected
+
+    def mask_counts(self, filters: Optional[FilterParams]) -> np.ndarray:
+        """Numero de leads por mascara de etapas alcanzadas (longitud N_MASKS)."""
+        selected = self._select(filters)
+        return np.bincount(self._stages[selected], weights=self._count[selected],
+                           minlength=N_MASKS).astype(np.int64)
+
+    def stage_counts(self, filters: Optional[FilterParams]) -> Dict[str, int]:
+        return stage_counts(self.mask_counts(filters))
+
+    def sequential_counts(self, filters: Optional[FilterParams]) -> Dict[str, int]:
+        return sequential_counts(self.mask_counts(filters), self.present_stages)
+
+
+class InvestmentCube:
+    def __init__(self, desarrollos: Optional[List[str]], region_by_desarrollo: Optional[Dict[str, str]],
+                 cells: Dict[str, np.ndarray], has_dates: bool):
+        # desarrollos es None si la tabla no tiene columna de desarrollo
+        self.desarrollos = desarrollos
+        self.region_by_desarrollo = region_by_desarrollo
+        self.has_dates = has_dates
+        self._desarrollo = cells['desarrollo']
+        self._year = cells['year']
+        self._month = cells['month']
+        self._amount = cells['amount']
+
+    @classmethod
+    def build(cls, investment_df: pd.DataFrame, desarrollo_col: Optional[str],
+              date_col: Optional[str], amount_col: Optional[str],
+              region_by_desarrollo: Optional[Dict[str, str]]) -> 'InvestmentCube':
+        n = len(investment_df)
+
+        if desarrollo_col:
+            dev_codes, dev_names = pd.factorize(investment_df[desarrollo_col], use_na_sentinel=True)
+            dev_names = list(dev_names)
+        else:
+            dev_codes, dev_names = np.full(n, _MISSING), None
+
+        if date_col:
+            dates = pd.to_datetime(investment_df[date_col])
+            year, month = _int_codes(dates.dt.year), _int_codes(dates.dt.month)
+        else:
+            year = month = np.full(n, _MISSING, dtype=np.int32)
+
+        amount = investment_df[amount_col] if amount_col else pd.Series(0.0, index=investment_df.index)
+
+        keys = pd.DataFrame({
+            'desarrollo': dev_codes.astype(np.int32),
+            'year': year,
+            'month': month,
+            'amount': pd.to_numeric(amount, errors='coerce').to_numpy(dtype=np.float64),
+        })
+        grouped = keys.groupby(['desarrollo', 'year', 'month'], sort=False)['amount'].sum().reset_index()
+
+        cells = {col: grouped[col].to_numpy() for col in grouped.columns}
+        return cls(dev_names, region_by_desarrollo, cells, has_dates=date_col is not None)
+
+    def total(self, filters: Optional[FilterParams]) -> float:
+        """Inversion total con los mismos criterios que el filtro por filas."""
+        selected = np.ones(len(self._amount), dtype=bool)
+        if filters is not None:
+            if filters.desarrollos and self.desarrollos is not None:
+                selected &= np.isin(self._desarrollo, _desarrollo_codes(filters.desarrollos, self.desarrollos))
+            if filters.regiones and self.desarrollos is not None and self.region_by_desarrollo is not None:
+                regiones = set(filters.regiones)
+                in_region = [d for d, r in self.region_by_desarrollo.items() if r in regiones]
+                selected &= np.isin(self._desarrollo, _desarrollo_codes(in_region, self.desarrollos))
+            if filters.year and self.has_dates:
+                selected &= self._year == filters.year
+            if filters.month and self.has_dates:
+                selected &= self._month == filters.month
+        return float(self._amount[selected].sum())
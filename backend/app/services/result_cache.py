@@ -0,0 +1,210 @@
+"""
+Cache de resultados compartido por las rutas de analitica.
+
+Las llaves se construyen a partir de un FilterParams normalizado (listas
+ordenadas y sin duplicados, fechas en ISO, filtros vacios omitidos), de modo
+que combinaciones equivalentes comparten la misma entrada. El cache es LRU
+con tamaño maximo, TTL opcional y se vacia cuando cambia la version de los
+datos cargados.
+
+Las rutas piden el resultado ya codificado a JSON (encoded=True, un
+EncodedBody): el cuerpo se guarda junto al resultado en la misma entrada, de
+modo que se codifica (y se comprime, ver compression) una sola vez por version
+de datos. El dashboard combinado usa la misma entrada sin codificar. Los
+resultados que ya son bytes (formatos binarios de cohorts) se guardan tal cual.
+
+Configuracion por variables de entorno:
+- RESULT_CACHE_SIZE: numero maximo de entradas (default 256, 0 desactiva)
+- RESULT_CACHE_TTL: segundos de vida de cada entrada (default 0 = sin TTL)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from app.models.schemas import FilterParams
+from app.services.compression import EncodedBody
+from app.services.compute_executor import compute_executor
+from app.services.data_loader import data_loader
+from app.services.json_encoding import dumps
+
+FILTER_FIELDS = ('desarrollos', 'regiones', 'year', 'month', 'week_iso', 'date_from', 'date_to')
+
+
+def canonical_filters(filters: Optional[FilterParams]) -> Tuple:
+    """
+    Forma canonica e inmutable de un FilterParams.
+    None y un FilterParams sin valores producen la misma llave.
+    """
+    if filters is None:
+        return ()
+
+    parts = []
+    for field in FILTER_FIELDS:
+        value = getattr(filters, field)
+        # Los servicios ignoran filtros vacios/cero, la llave tambien
+        if not value:
+            continue
+        if isinstance(value, list):
+            value = tuple(sorted(set(value)))
+        elif hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        parts.append((field, value))
+    return tuple(parts)
+
+
+def _encode(value: Any) -> EncodedBody:
+    return EncodedBody(value if isinstance(value, bytes) else dumps(value))
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 0,
+                 version_provider: Optional[Callable[[], Any]] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._version_provider = version_provider
+        self._version = None
+        # key -> (guardado en, resultado, resultado codificado a JSON o None)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, Optional[EncodedBody]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self):
+        # Llamar con el lock tomado
+        if self._version_provider is None:
+            return
+        version = self._version_provider()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def make_key(self, namespace: str, filters: Optional[FilterParams], *extra: Hashable) -> Tuple:
+        return (namespace, canonical_filters(filters)) + extra
+
+    def get(self, key: Hashable, encoded: bool = False) -> Tuple[bool, Any]:
+        """encoded=True: retorna el resultado codificado a JSON (EncodedBody)"""
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            stored_at, value, body = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if not encoded:
+                return True, value
+            if body is not None:
+                return True, body
+
+        # Entrada guardada sin codificar (p.ej. por el dashboard): codificarla una vez
+        body = _encode(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is value:
+                body.cached = True
+                self._entries[key] = (entry[0], value, body)
+        return True, body
+
+    def put(self, key: Hashable, value: Any, version: Any = None, body: Optional[EncodedBody] = None):
+        """
+        version: version de datos con que se calculo value (None = no verificar)
+        body: value ya codificado a JSON, si se tiene
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._check_version()
+            if version is not None and version != self._version:
+                # Calculado con un snapshot que ya fue reemplazado
+                return
+            if body is not None:
+                body.cached = True
+            self._entries[key] = (time.monotonic(), value, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _store(self, key: Hashable, value: Any, version: Any, encoded: bool) -> Any:
+        body = _encode(value) if encoded else None
+        self.put(key, value, version, body)
+        return body if encoded else value
+
+    def get_or_compute(self, namespace: str, filters: Optional[FilterParams],
+                       compute: Callable[[], Any], *extra: Hashable, encoded: bool = False) -> Any:
+        key = self.make_key(namespace, filters, *extra)
+        # Version leida antes de calcular: si los datos cambian durante el
+        # calculo, el resultado se devuelve pero no se guarda
+        version = self._version_provider() if self._version_provider else None
+        found, value = self.get(key, encoded)
+        if found:
+            return value
+        return self._store(key, compute(), version, encoded)
+
+    async def get_or_compute_async(self, namespace: str, filters: Optional[FilterParams],
+                                   compute: Callable[[], Any], *extra: Hashable, encoded: bool = False) -> Any:
+        """
+        Como get_or_compute, pero en un miss el calculo (y la codificacion)
+        corre en el pool de compute_executor, sin bloquear el event loop, y los
+        requests iguales en vuelo comparten un solo calculo.
+        """
+        key = self.make_key(namespace, filters, *extra)
+        version = self._version_provider() if self._version_provider else None
+        found, value = self.get(key, encoded)
+        if found:
+            return value
+        return await compute_executor.run(
+            (key, version, encoded), lambda: self._store(key, compute(), version, encoded)
+        )
+
+    async def get_or_await(self, namespace: str, filters: Optional[FilterParams],
+                           compute: Callable[[], Awaitable[Any]], *extra: Hashable, encoded: bool = False) -> Any:
+        """Como get_or_compute_async, para calculos que ya son asincronos (compute() retorna un awaitable)"""
+        key = self.make_key(namespace, filters, *extra)
+        version = self._version_provider() if self._version_provider else None
+        found, value = self.get(key, encoded)
+        if found:
+            return value
+
+        async def compute_and_store():
+            value = await compute()
+            if encoded:
+                # Codificar en el pool: un heatmap grande tarda en serializarse
+                return await compute_executor.submit(lambda: self._store(key, value, version, encoded))
+            return self._store(key, value, version, encoded)
+
+        return await compute_executor.run_async((key, version, encoded), compute_and_store)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / total * 100, 2) if total > 0 else 0,
+                'data_version': self._version
+            }
+
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_SIZE', '256')),
+    ttl_seconds=float(os.environ.get('RESULT_CACHE_TTL', '0')),
+    version_provider=lambda: data_loader.data_version
+)
@@ -0,0 +1,249 @@
+"""
+Snapshot columnar en disco de los DataFrames ya procesados por DataLoader.
+
+Cada DataFrame se guarda como un directorio con un archivo .npy por columna
+y un manifest.json que describe tipos y categorias. Los archivos .npy se
+abren con memory-map, de modo que un arranque en caliente no vuelve a
+parsear el Excel ni copia las columnas numericas/fecha a memoria propia.
+
+El snapshot se identifica por el hash del contenido del Excel: si el archivo
+cambia, el hash cambia y el snapshot anterior deja de usarse.
+
+Ademas de los DataFrames, un snapshot puede guardar arreglos derivados por
+lead (write_arrays/read_arrays), de modo que varios procesos que abren el
+mismo snapshot comparten esas paginas en lugar de calcular copias propias.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Incrementar cuando cambie el formato en disco
+SNAPSHOT_FORMAT_VERSION = 1
+
+MANIFEST_NAME = "manifest.json"
+ARRAYS_MANIFEST_NAME = "arrays.json"
+LOCK_NAME = ".build.lock"
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+_JSON_SCALARS = (str, int, float, bool)
+
+
+def file_content_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 del contenido de un archivo, leido por bloques."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_column(directory: Path, file_stem: str, series: pd.Series) -> dict:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.tolist()
+        if all(isinstance(c, _JSON_SCALARS) for c in categories):
+            np.save(directory / f"{file_stem}.npy", series.cat.codes.to_numpy())
+            return {'kind': 'category', 'categories': categories}
+
+    if series.dtype.kind in 'biufmM' and not pd.api.types.is_extension_array_dtype(series.dtype):
+        np.save(directory / f"{file_stem}.npy", series.to_numpy())
+        return {'kind': 'array'}
+
+    # Object/string: codificar como enteros + lista de valores unicos
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    categories = uniques.tolist()
+    if all(isinstance(c, _JSON_SCALARS) for c in categories):
+        np.save(directory / f"{file_stem}.npy", codes.astype(np.int32))
+        return {'kind': 'codes', 'categories': categories}
+
+    # Valores no representables en JSON: guardar como objetos (sin memory-map)
+    np.save(directory / f"{file_stem}.npy", series.to_numpy(dtype=object), allow_pickle=True)
+    return {'kind': 'object'}
+
+
+def _read_column(directory: Path, file_stem: str, spec: dict, mmap: bool):
+    path = directory / f"{file_stem}.npy"
+    kind = spec['kind']
+
+    if kind == 'object':
+        return np.load(path, allow_pickle=True)
+
+    values = np.load(path, mmap_mode='r' if mmap else None)
+    if kind == 'array':
+        return values
+    if kind == 'category':
+        return pd.Categorical.from_codes(np.asarray(values), categories=spec['categories'])
+
+    # 'codes': reconstruir la columna object original (None para faltantes)
+    lookup = np.empty(len(spec['categories']) + 1, dtype=object)
+    lookup[:-1] = spec['categories']
+    lookup[-1] = None
+    return lookup[np.asarray(values)]
+
+
+def write_snapshot(directory: Path, frames: Dict[str, pd.DataFrame], source_hash: str,
+                   schema_version: int = 0) -> None:
+    """
+    Escribe los DataFrames en `directory`.
+
+    Se escribe primero a un directorio temporal y luego se renombra, para que
+    un proceso concurrente nunca lea un snapshot a medio escribir.
+    """
+    directory = Path(directory)
+    tmp_dir = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'schema_version': schema_version,
+        'source_hash': source_hash,
+        'frames': {}
+    }
+
+    try:
+        for name, df in frames.items():
+            frame_dir = tmp_dir / name
+            frame_dir.mkdir()
+            columns = []
+            for i, col in enumerate(df.columns):
+                spec = _write_column(frame_dir, f"c{i}", df[col])
+                spec['name'] = col
+                columns.append(spec)
+            manifest['frames'][name] = {'rows': len(df), 'columns': columns}
+
+        with open(tmp_dir / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def read_snapshot(directory: Path, source_hash: str, schema_version: int = 0,
+                  mmap: bool = True) -> Optional[Dict[str, pd.DataFrame]]:
+    """
+    Lee un snapshot si existe y corresponde al hash/esquema esperado.
+    Retorna None si no hay snapshot valido.
+    """
+    directory = Path(directory)
+    manifest_path = directory / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if (manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION or
+            manifest.get('schema_version') != schema_version or
+            manifest.get('source_hash') != source_hash):
+        return None
+
+    frames = {}
+    for name, frame_spec in manifest['frames'].items():
+        frame_dir = directory / name
+        data = {}
+        for i, spec in enumerate(frame_spec['columns']):
+            data[spec['name']] = _read_column(frame_dir, f"c{i}", spec, mmap)
+        # copy=False mantiene las columnas respaldadas por el memory-map
+        frames[name] = pd.DataFrame(data, copy=False)
+    return frames
+
+
+def write_arrays(directory: Path, arrays: Dict[str, np.ndarray], meta: dict) -> None:
+    """
+    Escribe arreglos numpy (un .npy por arreglo) y metadatos JSON en `directory`,
+    con el mismo esquema de directorio temporal + rename que write_snapshot.
+    """
+    directory = Path(directory)
+    tmp_dir = directory.with_name(f"{directory.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    try:
+        names = []
+        for i, (name, values) in enumerate(arrays.items()):
+            np.save(tmp_dir / f"a{i}.npy", np.asarray(values))
+            names.append(name)
+        with open(tmp_dir / ARRAYS_MANIFEST_NAME, 'w', encoding='utf-8') as f:
+            json.dump({'format_version': SNAPSHOT_FORMAT_VERSION, 'arrays': names, 'meta': meta},
+                      f, ensure_ascii=False)
+
+        if directory.exists():
+            shutil.rmtree(directory)
+        os.replace(tmp_dir, directory)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def read_arrays(directory: Path, mmap: bool = True) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """
+    Lee los arreglos escritos con write_arrays (memory-map de solo lectura).
+    Retorna (arreglos, metadatos) o None si no existen.
+    """
+    directory = Path(directory)
+    try:
+        with open(directory / ARRAYS_MANIFEST_NAME, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        return None
+
+    arrays = {
+        name: np.load(directory / f"a{i}.npy", mmap_mode='r' if mmap else None)
+        for i, name in enumerate(manifest['arrays'])
+    }
+    return arrays, manifest['meta']
+
+
+@contextmanager
+def build_lock(base_dir: Path):
+    """
+    Lock exclusivo entre procesos sobre `base_dir`, para que un solo proceso
+    construya un snapshot mientras los demas esperan a leerlo.
+    """
+    base_dir = Path(base_dir)
+    base_dir.mkdir(parents=True, exist_ok=True)
+    with open(base_dir / LOCK_NAME, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def prune_snapshots(base_dir: Path, keep: str) -> None:
+    """
+    Elimina snapshots de versiones anteriores del Excel. `keep` es el hash del
+    Excel actual: se conservan todas sus representaciones (`<hash>`,
+    `<hash>-compact`).
+    """
+    base_dir = Path(base_dir)
+    if not base_dir.exists():
+        return
+    for entry in base_dir.iterdir():
+        if entry.is_dir() and not entry.name.startswith(keep):
+            shutil.rmtree(entry, ignore_errors=True)
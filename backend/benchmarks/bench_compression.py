@@ -0,0 +1,90 @@
+"""
+Benchmark de compresion de respuestas: bytes en el cable y CPU por request.
+
+Envia requests a la app ASGI en proceso con distintos Accept-Encoding y
+reporta, por endpoint, el tamaño sin comprimir, el tamaño en el cable y el
+CPU del proceso por request (incluye al cliente, que descomprime en el mismo
+proceso). Con el cache de resultados activo (default) las respuestas salen
+precomprimidas; con --no-cache se comprimen en streaming.
+
+Uso (desde backend/):
+    python benchmarks/bench_compression.py --leads 100000
+    python benchmarks/bench_compression.py --leads 100000 --no-cache
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+REQUESTS = [
+    ("cohorts", "POST", "/api/v1/cohorts/", None),
+    ("cohorts (mes 3)", "POST", "/api/v1/cohorts/", {"month": 3}),
+    ("heatmap", "GET", "/api/v1/cohorts/heatmap?stage=contacto", None),
+    ("heatmap (Norte)", "POST", "/api/v1/cohorts/heatmap?stage=cita", {"regiones": ["Norte"]}),
+    ("trends", "GET", "/api/v1/funnel/trends", None),
+    ("dashboard", "POST", "/api/v1/dashboard/", {}),
+]
+
+
+async def run(args):
+    import httpx
+    import main
+    from app.services.compression import ENCODINGS, compression_stats
+    from app.services.data_loader import data_loader
+
+    data_loader.load()
+    encodings = ["identity"] + list(ENCODINGS)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"\n{'request':<18} {'encoding':<9} {'raw KB':>8} {'wire KB':>8} {'ratio':>6} {'CPU ms/req':>11}")
+        print("-" * 66)
+        for label, method, url, body in REQUESTS:
+            for encoding in encodings:
+                headers = {"Accept-Encoding": encoding}
+                # Primer request: calcula y (en cache) genera la version comprimida
+                await client.request(method, url, json=body, headers=headers)
+
+                compression_stats.reset()
+                start = time.process_time()
+                for _ in range(args.repeat):
+                    response = await client.request(method, url, json=body, headers=headers)
+                cpu_ms = (time.process_time() - start) / args.repeat * 1000
+                stats = compression_stats.snapshot()
+                raw = stats['raw_bytes'] / max(stats['responses'], 1)
+                wire = stats['wire_bytes'] / max(stats['responses'], 1)
+                print(f"{label:<18} {response.headers.get('content-encoding', 'identity'):<9} "
+                      f"{raw / 1024:>8.1f} {wire / 1024:>8.1f} {wire / raw if raw else 1:>6.2f} {cpu_ms:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=None,
+                        help="Genera un Excel sintetico con N leads en lugar de usar el configurado")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Desactiva el cache de resultados (compresion en streaming)")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+
+    if args.leads:
+        from synthetic_data import write_synthetic_workbook
+        workbook = Path(tempfile.gettempdir()) / f"cohorts_bench_{args.leads}" / "Datos_prueba_v3.xlsx"
+        if not workbook.exists():
+            print(f"Generando Excel sintetico con {args.leads:,} leads...")
+            write_synthetic_workbook(workbook, args.leads)
+        os.environ['DATA_FILE'] = str(workbook)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark de latencia con carga mixta: requests pesados de cohorts junto a
+requests livianos (/health) en el mismo worker.
+
+Envia los requests a la app ASGI en proceso (sin red), con el cache de
+resultados desactivado. Mide la latencia de /health mientras corren cohorts
+filtrados por rango de fechas, y cuantos calculos dispara una rafaga de
+requests identicos (single-flight).
+
+Uso (desde backend/):
+    python benchmarks/bench_mixed_latency.py --threads 0                 # calculo en el event loop
+    python benchmarks/bench_mixed_latency.py --threads 4 --leads 100000  # pool de 4 threads
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Medir el calculo, no el cache de resultados
+os.environ['RESULT_CACHE_SIZE'] = '0'
+
+HEAVY_FILTERS = [
+    {"date_from": "2023-01-01", "date_to": "2024-12-31"},
+    {"date_from": "2023-06-01", "date_to": "2025-03-31", "desarrollos": ["Desarrollo 3"]},
+    {"month": 3},
+    {"month": 7, "regiones": ["Norte"]},
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def heavy_client(client, filters, latencies, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.post("/api/v1/cohorts/", json=filters)
+        latencies.append(time.perf_counter() - start)
+        # En proceso no hay I/O de red: ceder el loop como lo haria un socket
+        await asyncio.sleep(0)
+
+
+async def health_client(client, latencies, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def run(args):
+    import httpx
+    import main
+    from app.services.compute_executor import compute_executor
+    from app.services.data_loader import data_loader
+
+    data_loader.load()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/api/v1/cohorts/", json=HEAVY_FILTERS[0])  # calentamiento
+
+        stop = asyncio.Event()
+        heavy, health = [], []
+        tasks = [asyncio.create_task(heavy_client(client, HEAVY_FILTERS[i % len(HEAVY_FILTERS)], heavy, stop))
+                 for i in range(args.heavy)]
+        tasks.append(asyncio.create_task(health_client(client, health, stop)))
+        await asyncio.sleep(args.seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+        executed_before = compute_executor.executed
+        start = time.perf_counter()
+        await asyncio.gather(*[client.post("/api/v1/cohorts/", json=HEAVY_FILTERS[0]) for _ in range(args.burst)])
+        burst_elapsed = time.perf_counter() - start
+        burst_computations = compute_executor.executed - executed_before
+
+    print(f"\nCOMPUTE_THREADS={compute_executor.max_workers}, {args.heavy} clientes pesados, {args.seconds}s")
+    print(f"{'request':<22} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    print("-" * 58)
+    for label, values in (("/health", health), ("/cohorts (filtrado)", heavy)):
+        if values:
+            print(f"{label:<22} {len(values):>6} {percentile(values, 50) * 1000:>9.1f} "
+                  f"{percentile(values, 95) * 1000:>9.1f} {max(values) * 1000:>9.1f}")
+    print(f"\nRafaga de {args.burst} requests identicos: {burst_computations} calculo(s), "
+          f"{burst_elapsed * 1000:.1f} ms en total")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=None,
+                        help="Genera un Excel sintetico con N leads en lugar de usar el configurado")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Threads del pool de calculo (0 = en el event loop); default COMPUTE_THREADS")
+    parser.add_argument("--heavy", type=int, default=4, help="Clientes concurrentes con cohorts filtrados")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--burst", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        os.environ['COMPUTE_THREADS'] = str(args.threads)
+
+    if args.leads:
+        from synthetic_data import write_synthetic_workbook
+        workbook = Path(tempfile.gettempdir()) / f"cohorts_bench_{args.leads}" / "Datos_prueba_v3.xlsx"
+        if not workbook.exists():
+            print(f"Generando Excel sintetico con {args.leads:,} leads...")
+            write_synthetic_workbook(workbook, args.leads)
+        os.environ['DATA_FILE'] = str(workbook)
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark de memoria asignada por request en /funnel, /funnel/trends y /metrics.
+
+Llama directamente a los handlers de las rutas (el cache de resultados se
+desactiva) y mide con tracemalloc el pico de memoria asignada durante cada
+request, ademas del tiempo promedio.
+
+Uso (desde backend/):
+    python benchmarks/bench_request_alloc.py                 # Excel configurado
+    python benchmarks/bench_request_alloc.py --leads 100000  # Excel sintetico
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+sys.path.insert(0, str(Path(__file__).parent))
+
+# Medir el calculo, no el cache de resultados
+os.environ['RESULT_CACHE_SIZE'] = '0'
+
+ROUTE_PARAMS = dict(desarrollos=None, regiones=None, year=None, month=None,
+                    week_iso=None, date_from=None, date_to=None)
+
+SCENARIOS = [
+    ("sin filtros", {}),
+    ("1 desarrollo", {"desarrollos": "Desarrollo 3"}),
+    ("region + año", {"regiones": "Norte", "year": 2024}),
+    ("mes", {"month": 3}),
+    ("rango de fechas", {"date_from": "2024-01-01", "date_to": "2024-06-30"}),
+]
+
+
+def measure(handler, params, repeat):
+    kwargs = dict(ROUTE_PARAMS, **params)
+    asyncio.run(handler(**kwargs))  # calentamiento
+
+    peaks = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        asyncio.run(handler(**kwargs))
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    return sum(peaks) / len(peaks), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=None,
+                        help="Genera un Excel sintetico con N leads en lugar de usar el configurado")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.leads:
+        from synthetic_data import write_synthetic_workbook
+        workbook = Path(tempfile.gettempdir()) / f"cohorts_bench_{args.leads}" / "Datos_prueba_v3.xlsx"
+        if not workbook.exists():
+            print(f"Generando Excel sintetico con {args.leads:,} leads...")
+            write_synthetic_workbook(workbook, args.leads)
+        os.environ['DATA_FILE'] = str(workbook)
+
+    from app.api.routes import funnel, metrics
+    from app.services.data_loader import data_loader
+    data_loader.load()
+
+    handlers = [
+        ("/funnel", funnel.get_funnel),
+        ("/funnel/trends", funnel.get_funnel_trends),
+        ("/metrics", metrics.get_metrics),
+    ]
+
+    tracemalloc.start()
+    print(f"\n{'endpoint':<16} {'escenario':<18} {'pico MB/req':>12} {'ms/req':>9}")
+    print("-" * 58)
+    for name, handler in handlers:
+        for label, params in SCENARIOS:
+            peak, elapsed = measure(handler, params, args.repeat)
+            print(f"{name:<16} {label:<18} {peak / 1e6:>12.2f} {elapsed * 1000:>9.2f}")
+    tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Genera un Excel sintetico con la misma estructura que Datos_prueba_v3.xlsx
+(hojas de inversion, desarrollos y leads) para correr benchmarks sin los
+datos reales.
+
+Uso:
+    python benchmarks/synthetic_data.py salida.xlsx --leads 100000
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CITIES = [
+    ("Ciudad de México", "Centro"), ("Toluca", "Centro"), ("Puebla", "Centro"),
+    ("Monterrey", "Norte"), ("Chihuahua", "Norte"), ("Torreón", "Norte"),
+    ("León", "Centro"), ("Oaxaca", "Sur"), ("Mérida", "Sur"),
+    ("Villahermosa", "Sur"), ("Querétaro", "Centro"), ("Aguascalientes", "Centro"),
+    ("Guadalajara", "Centro"), ("Tijuana", "Norte"), ("Cancún", "Sur"),
+]
+
+STAGE_COLUMNS = ["Fecha Contacto", "Fecha Cita", "Fecha Venta Bruta", "Fecha Escrituracion"]
+
+
+def build_synthetic_frames(n_leads: int, seed: int = 0, start: str = "2022-12-26", days: int = 900):
+    """Retorna (inversion, desarrollos, leads) como DataFrames crudos del Excel."""
+    rng = np.random.default_rng(seed)
+    desarrollos = [f"Desarrollo {i + 1}" for i in range(len(CITIES))]
+
+    developments_df = pd.DataFrame({
+        "Desarrollo": desarrollos,
+        "Ciudad": [city for city, _ in CITIES],
+        "Región": [region for _, region in CITIES],
+    })
+
+    registro = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 86400, n_leads), unit="s")
+    leads_df = pd.DataFrame({
+        "ID Lead": np.arange(1, n_leads + 1),
+        "Desarrollo": rng.choice(desarrollos, n_leads),
+        "Fecha Registro": registro,
+    })
+    for col in STAGE_COLUMNS:
+        offset = pd.to_timedelta(rng.integers(-2 * 86400, 60 * 86400, n_leads), unit="s")
+        leads_df[col] = pd.Series(registro + offset).where(rng.random(n_leads) < 0.8)
+
+    months = pd.date_range(registro.min().normalize().replace(day=1), registro.max(), freq="MS")
+    investment_df = pd.DataFrame(
+        [(month, dev, float(rng.integers(10_000, 300_000))) for month in months for dev in desarrollos],
+        columns=["Fecha", "Desarrollo", "Inversion"]
+    )
+
+    return investment_df, developments_df, leads_df
+
+
+def write_synthetic_workbook(path: Path, n_leads: int, seed: int = 0) -> Path:
+    investment_df, developments_df, leads_df = build_synthetic_frames(n_leads, seed)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with pd.ExcelWriter(path) as writer:
+        investment_df.to_excel(writer, sheet_name="Inversion", index=False)
+        developments_df.to_excel(writer, sheet_name="Desarrollos", index=False)
+        leads_df.to_excel(writer, sheet_name="Leads", index=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", type=Path)
+    parser.add_argument("--leads", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_synthetic_workbook(args.output, args.leads, args.seed)
+    print(f"Escrito {args.output} con {args.leads:,} leads")
@@ -3,17 +3,54 @@ Script para generar datos estaticos pre-calculados para GitHub Pages.
 
 Este script procesa el archivo Excel y genera archivos JSON con todos los datos
 necesarios para el dashboard, eliminando la necesidad de un backend en tiempo real.
+
+Uso (desde backend/):
+    python generate_static_data.py
+    python generate_static_data.py --jobs 4
+    python generate_static_data.py --full
+    python generate_static_data.py --layout sharded --gzip
+
+Con --jobs las secciones, y las dimensiones de metricas, funnel y
+tendencias, se calculan en un pool de procesos creado con fork despues de
+cargar los datos una sola vez.
+
+La generacion es incremental: backend/.static_manifest.json (fuera del
+directorio publicado, no se versiona) guarda la huella de las filas de entrada de cada slice (p.ej.
+funnel/by_week/2024-W12) y el hash de cada archivo. Solo se recalculan los
+slices cuyas filas cambiaron, los archivos sin cambios no se reescriben, y al
+final se reporta que slices se regeneraron y por que. --full ignora el
+manifiesto.
+
+Con --layout sharded cada slice va en su propio archivo JSON compacto
+(metrics/all.json, funnel/by_desarrollo/<slug>.json, ...) e index.json indica
+el slug de cada valor, asi el cliente estatico descarga solo el slice que
+muestra. --gzip agrega una copia .gz de cada archivo para servidores que
+sirven versiones precomprimidas. Los archivos que una corrida anterior
+genero y ya no corresponden (slices que desaparecieron, el otro formato) se
+borran. Al final se reportan los bytes del primer render en ambos formatos.
 """
 
 import pandas as pd
+import numpy as np
+import argparse
+import gzip
+import hashlib
 import json
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
+import os
 import sys
+import time
 
 # Agregar el directorio actual al path para importar modulos
 sys.path.insert(0, str(Path(__file__).parent))
 
+# El generador lee las columnas de leads directamente: usar el formato original
+os.environ['COMPACT_LEADS'] = '0'
+
 from app.services.data_loader import DataLoader
 
 # Coordenadas de ciudades de Mexico
@@ -41,16 +78,547 @@ CITY_COORDINATES = {
     "Cancun": (21.1619, -86.8515),
 }
 
-def generate_static_data():
-    """Genera todos los archivos JSON estaticos necesarios."""
+# Archivos de salida y sus partes (llaves del JSON) que se calculan como
+# tareas separadas; None = el archivo completo es una sola tarea
+SECTIONS = {
+    "filter-options.json": None,
+    "metrics.json": ("all", "by_region", "by_desarrollo", "by_year", "by_week"),
+    "funnel.json": ("all", "by_region", "by_desarrollo", "by_year", "by_week"),
+    "trends.json": ("all", "by_region", "by_desarrollo", "by_year"),
+    "developments.json": None,
+}
+
+# Manifiesto con la huella de los datos de entrada de cada slice y el hash de
+# cada archivo: una corrida posterior solo recalcula los slices cuyas filas
+# cambiaron y no toca los archivos que quedan igual. Va junto al script y no
+# en frontend/public/data, para que no se publique con el sitio
+MANIFEST_PATH = Path(__file__).parent / ".static_manifest.json"
+MANIFEST_VERSION = 2
+# Versiones anteriores lo escribian en el directorio de salida
+LEGACY_MANIFEST_FILE = "manifest.json"
+
+# Formatos de salida: un archivo por seccion con indent=2 ("files", el de
+# siempre) o un archivo compacto por slice mas un indice ("sharded")
+LAYOUTS = ("files", "sharded")
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+
+# Archivos que el dashboard pide al abrir, sin filtros, en cada formato
+FIRST_PAINT_FILES = {
+    "files": ["filter-options.json", "metrics.json", "funnel.json", "trends.json", "developments.json"],
+    "sharded": [INDEX_FILE, "filter-options.json", "metrics/all.json", "funnel/all.json", "trends/all.json",
+                "developments.json"],
+}
+
+# Slice ids listados por motivo en el reporte
+REPORT_MAX_SLICES = 10
+
+# Datos cargados (leads, inversion, desarrollos) que usa build_part. Con
+# --jobs el pool se crea con fork despues de cargar: los procesos heredan los
+# DataFrames en memoria, sin copiarlos ni serializarlos
+_DATA = None
+
+
+def build_part(section, part, values=None):
+    """
+    Calcula una parte de una seccion, limitada a `values` de esa dimension si
+    se indican; regresa (seccion, parte, datos, segundos).
+    """
+    leads_df, investment_df, developments_df = _DATA
+    start = time.perf_counter()
+    parts = None if part is None else (part,)
+    only = None if values is None else {part: set(values)}
+    if section == "filter-options.json":
+        data = generate_filter_options(leads_df, developments_df)
+    elif section == "metrics.json":
+        data = generate_metrics(leads_df, investment_df, parts, only)
+    elif section == "funnel.json":
+        data = generate_funnel_data(leads_df, parts, only)
+    elif section == "trends.json":
+        data = generate_conversion_trends(leads_df, parts, only)
+    else:
+        data = generate_developments_data(developments_df, leads_df, investment_df)
+    return section, part, data, time.perf_counter() - start
+
+
+def row_hashes(df):
+    """Hash (uint64) de cada fila, sobre los valores de todas sus columnas."""
+    if len(df) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _fingerprint(count, total, xor):
+    return f"{int(count)}:{int(total):016x}{int(xor):016x}"
+
+
+def fingerprint(hashes):
+    """Huella de un conjunto de filas: cuantas son, suma y xor de sus hashes (no depende del orden)."""
+    return _fingerprint(len(hashes), np.add.reduce(hashes, dtype=np.uint64), np.bitwise_xor.reduce(hashes))
+
+
+def fingerprints_by(hashes, keys):
+    """fingerprint de las filas de cada valor de keys, en una sola pasada."""
+    codes, uniques = pd.factorize(keys)
+    valid = codes >= 0
+    codes, hashes = codes[valid], hashes[valid]
+    totals = np.zeros(len(uniques), dtype=np.uint64)
+    np.add.at(totals, codes, hashes)
+    xors = np.zeros(len(uniques), dtype=np.uint64)
+    np.bitwise_xor.at(xors, codes, hashes)
+    counts = np.bincount(codes, minlength=len(uniques))
+    return {value: _fingerprint(counts[i], totals[i], xors[i]) for i, value in enumerate(uniques)}
+
+
+def combine(*fingerprints):
+    return hashlib.sha1("|".join(fingerprints).encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    """sha256 del archivo (None si no existe)."""
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def json_key_text(key):
+    """Llave como queda en el archivo JSON (json convierte las llaves no string)."""
+    return key if isinstance(key, str) else json.dumps(key)
+
+
+def slice_id(section, part=None, json_key=None):
+    """Identificador de un slice, p.ej. funnel/by_week/2024-W12 o metrics/all."""
+    slice_path = [section[:-len(".json")]]
+    if part is not None:
+        slice_path.append(part)
+    if json_key is not None:
+        slice_path.append(json_key_text(json_key))
+    return "/".join(slice_path)
+
+
+def generation_context(leads_df, investment_df, developments_df, layout="files"):
+    """Huella del codigo del generador, las columnas de entrada y el formato de salida: si cambia se regenera todo."""
+    columns = json.dumps([[str(col) for col in df.columns] for df in (leads_df, investment_df, developments_df)])
+    return combine(hashlib.sha256(Path(__file__).read_bytes()).hexdigest(), columns, layout)
+
+
+def slugify(text):
+    """Nombre de archivo para un valor: minusculas ASCII, digitos y guiones."""
+    return re.sub(r"[^a-z0-9]+", "-", normalize_string(text)).strip("-") or "slice"
+
+
+def slice_slugs(plan):
+    """
+    Slug de cada valor por dimension ({parte: {llave JSON: slug}}), el mismo
+    en todas las secciones. Los valores cuyo slug coincide llevan ademas un
+    hash de su llave, asi un archivo nunca pasa de un valor a otro.
+    """
+    keys = {}
+    for slices in plan.values():
+        for part, _, json_key, _ in slices.values():
+            if json_key is not None:
+                keys.setdefault(part, {}).setdefault(json_key_text(json_key), None)
+
+    slugs = {}
+    for part, texts in keys.items():
+        by_slug = {}
+        for text in texts:
+            by_slug.setdefault(slugify(text), []).append(text)
+        slugs[part] = {}
+        for slug, colliding in by_slug.items():
+            for text in colliding:
+                unique = slug if len(colliding) == 1 else f"{slug}-{hashlib.sha1(text.encode('utf-8')).hexdigest()[:8]}"
+                slugs[part][text] = unique
+    return slugs
+
+
+class StaticOutput:
+    """
+    Donde y como se escribe cada slice: en el archivo de su seccion (layout
+    "files") o en su propio archivo compacto (layout "sharded"), con una
+    copia .gz si gzip_copy.
+    """
+
+    def __init__(self, output_dir, layout="files", gzip_copy=False, plan=None):
+        self.dir = output_dir
+        self.layout = layout
+        self.gzip_copy = gzip_copy
+        self.slugs = slice_slugs(plan) if layout == "sharded" else {}
+
+    @property
+    def sharded(self):
+        return self.layout == "sharded"
+
+    def slice_path(self, section, part=None, json_key=None):
+        """Ruta (relativa al directorio de salida) del archivo con ese slice."""
+        if not self.sharded or part is None:
+            return section
+        stem = section[:-len(".json")]
+        if part == "all":
+            return f"{stem}/all.json"
+        return f"{stem}/{part}/{self.slugs[part][json_key_text(json_key)]}.json"
+
+    def with_copies(self, path):
+        """El archivo y su copia .gz, si se generan."""
+        return [path, path + ".gz"] if self.gzip_copy else [path]
+
+    def files(self, plan):
+        """Todos los archivos que genera esta corrida (sin el manifiesto)."""
+        paths = set(self.with_copies(INDEX_FILE)) if self.sharded else set()
+        for section, slices in plan.items():
+            for part, _, json_key, _ in slices.values():
+                paths.update(self.with_copies(self.slice_path(section, part, json_key)))
+        return sorted(paths)
+
+    def save(self, path, data, verbose=True):
+        return save_json(self.dir / path, data, compact=self.sharded, gzip_copy=self.gzip_copy, verbose=verbose)
+
+    def read(self, path):
+        return json.loads((self.dir / path).read_text(encoding="utf-8"))
+
+
+def plan_slices(leads_df, investment_df, developments_df):
+    """
+    Slices de cada seccion, en el orden de salida, con la huella de sus datos
+    de entrada: {seccion: {slice_id: (parte, valor, llave JSON, huella)}}.
+    La huella de un slice cambia solo si cambian sus filas (y, para las
+    metricas, la inversion que usa).
+    """
+    desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
+    inv_desarrollo_col = find_column(investment_df, ['desarrollo', 'project'])
+
+    lead_hashes = row_hashes(leads_df)
+    investment_hashes = row_hashes(investment_df)
+    all_leads = fingerprint(lead_hashes)
+    all_investment = fingerprint(investment_hashes)
+    everything = combine(all_leads, all_investment, fingerprint(row_hashes(developments_df)))
+
+    # Inversion por region/desarrollo, como en generate_metrics (sin columna de desarrollo se usa la total)
+    investment_by = {}
+    if inv_desarrollo_col:
+        investment_by["by_region"] = fingerprints_by(investment_hashes, investment_df['_region'])
+        investment_by["by_desarrollo"] = fingerprints_by(investment_hashes, investment_df[inv_desarrollo_col])
+
+    leads_by = {}
+    plan = {}
+    for section, parts in SECTIONS.items():
+        if parts is None:
+            plan[section] = {slice_id(section): (None, None, None, everything)}
+            continue
+
+        slices = {}
+        dimensions = slice_dimensions(leads_df, desarrollo_col, include_weeks="by_week" in parts)
+        for part in parts:
+            if part == "all":
+                inputs = (all_leads, all_investment) if section == "metrics.json" else (all_leads,)
+                slices[slice_id(section, part)] = (part, None, None, combine(*inputs))
+                continue
+
+            key_col, values, json_key = dimensions[part]
+            if len(values) == 0:
+                continue
+            if part not in leads_by:
+                leads_by[part] = fingerprints_by(lead_hashes, leads_df[key_col])
+            for value in values:
+                inputs = (leads_by[part][value],)
+                if section == "metrics.json":
+                    investment = investment_by.get(part)
+                    inputs += (investment.get(value, "-") if investment is not None else all_investment,)
+                slices[slice_id(section, part, json_key(value))] = (part, value, json_key(value), combine(*inputs))
+        plan[section] = slices
+    return plan
+
+
+def load_manifest():
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def plan_changes(plan, manifest, context, output):
+    """
+    Slices a regenerar por seccion con su motivo ({seccion: {slice_id:
+    motivo}}) y slices del manifiesto que ya no existen ({seccion: [slice_id]}).
+    """
+    if manifest is None:
+        everything = "sin manifiesto previo"
+    elif manifest.get("version") != MANIFEST_VERSION or manifest.get("context") != context:
+        everything = "cambio el generador, las columnas de entrada o el formato de salida"
+    else:
+        everything = None
+
+    if everything is not None:
+        return ({section: {sid: everything for sid in slices} for section, slices in plan.items()},
+                {section: [] for section in plan})
+
+    # Archivo de cada slice (y su copia .gz) igual al que quedo registrado
+    recorded = manifest.get("files", {})
+    intact = {}
+
+    def is_intact(path):
+        if path not in intact:
+            intact[path] = all(recorded.get(copy) is not None and recorded[copy] == file_hash(output.dir / copy)
+                               for copy in output.with_copies(path))
+        return intact[path]
+
+    changes, removed = {}, {}
+    for section, slices in plan.items():
+        previous = manifest.get("slices", {}).get(section, {})
+        changes[section] = {}
+        for sid, (part, _, json_key, input_hash) in slices.items():
+            if not is_intact(output.slice_path(section, part, json_key)):
+                changes[section][sid] = "archivo ausente o modificado"
+            elif sid not in previous:
+                changes[section][sid] = "slice nuevo"
+            elif previous[sid] != input_hash:
+                changes[section][sid] = "cambiaron sus filas de entrada"
+        removed[section] = [sid for sid in previous if sid not in slices]
+    return changes, removed
+
+
+def section_tasks(plan, changes):
+    """
+    Tareas (seccion, parte, valores) para recalcular los slices que cambiaron;
+    valores None = la parte completa.
+    """
+    tasks = []
+    for section, changed in changes.items():
+        if not changed:
+            continue
+        if SECTIONS[section] is None:
+            tasks.append((section, None, None))
+            continue
+        changed_values, total = {}, {}
+        for sid, (part, value, _, _) in plan[section].items():
+            total[part] = total.get(part, 0) + 1
+            if sid in changed:
+                changed_values.setdefault(part, []).append(value)
+        for part in SECTIONS[section]:
+            if part in changed_values:
+                values = changed_values[part]
+                tasks.append((section, part, None if part == "all" or len(values) == total[part] else values))
+    return tasks
+
+
+def fresh_slice(computed, part, json_key):
+    """Datos recalculados de un slice (None si no se recalculo)."""
+    fresh = computed.get(part)
+    if part is None or fresh is None:
+        return fresh
+    if part == "all":
+        return fresh[part]
+    return fresh[part].get(json_key)
+
+
+def assemble_section(section, computed, slices, output):
+    """
+    Junta los slices recalculados con los que no cambiaron (leidos de los
+    archivos actuales), en el orden de una generacion completa.
+    """
+    if SECTIONS[section] is None:
+        return computed[None] if None in computed else output.read(section)
+
+    previous = {}
+    data = {part: {} for part in SECTIONS[section]}
+    for part, value, json_key, _ in slices.values():
+        slice_data = fresh_slice(computed, part, json_key)
+        if slice_data is None:
+            path = output.slice_path(section, part, json_key)
+            if path not in previous:
+                previous[path] = output.read(path)
+            slice_data = previous[path]
+            if not output.sharded:
+                slice_data = slice_data[part] if part == "all" else slice_data[part][json_key_text(json_key)]
+        if part == "all":
+            data[part] = slice_data
+        else:
+            data[part][json_key] = slice_data
+    return data
+
+
+def write_slices(section, computed, slices, output):
+    """Layout sharded: escribe el archivo de cada slice recalculado (los demas no cambian)."""
+    saved = unchanged = 0
+    for part, _, json_key, _ in slices.values():
+        slice_data = fresh_slice(computed, part, json_key)
+        if slice_data is None:
+            continue
+        if output.save(output.slice_path(section, part, json_key), slice_data, verbose=False):
+            saved += 1
+        else:
+            unchanged += 1
+    print(f"    -> {section[:-len('.json')]}: {saved} archivos guardados, {unchanged} sin cambios")
+
+
+def generate_sections(output, plan, changes, removed, jobs=1):
+    """
+    Recalcula los slices que cambiaron (en un pool de `jobs` procesos si
+    jobs > 1) y reescribe cada archivo afectado en cuanto sus partes estan
+    listas. Regresa, por seccion recalculada, el tiempo de calculo de sus
+    partes y el momento en que se escribio (segundos desde el inicio).
+    """
+    tasks = section_tasks(plan, changes)
+    pending = {section: 0 for section in SECTIONS}
+    for section, _, _ in tasks:
+        pending[section] += 1
+    results = {section: {} for section in SECTIONS}
+    timings = {}
+    start = time.perf_counter()
+
+    def write(section):
+        if output.sharded:
+            write_slices(section, results.pop(section), plan[section], output)
+        else:
+            output.save(section, assemble_section(section, results.pop(section), plan[section], output))
+        timings.setdefault(section, {"compute": 0.0})["written"] = time.perf_counter() - start
+
+    def collect(section, part, data, seconds):
+        results[section][part] = data
+        timings.setdefault(section, {"compute": 0.0})["compute"] += seconds
+        pending[section] -= 1
+        if not pending[section]:
+            write(section)
+
+    # Secciones donde solo desaparecieron slices: se reescriben sin recalcular
+    # (en el layout sharded basta con borrar sus archivos, ver remove_stale_files)
+    for section in SECTIONS:
+        if removed[section] and not pending[section] and not output.sharded:
+            write(section)
+
+    if jobs > 1 and len(tasks) > 1:
+        sys.stdout.flush()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+            futures = [pool.submit(build_part, *task) for task in tasks]
+            for future in as_completed(futures):
+                collect(*future.result())
+    else:
+        for task in tasks:
+            collect(*build_part(*task))
+
+    return timings
+
+
+def build_index(plan, slugs):
+    """
+    Indice del layout sharded: partes de cada seccion y slug de cada valor.
+    El archivo de un slice es <seccion>/<parte>/<slug>.json (<seccion>/all.json
+    sin filtros); un valor sin slug no tiene datos y se usa all.
+    """
+    return {
+        "version": INDEX_VERSION,
+        "sections": {section[:-len(".json")]: list(parts) for section, parts in SECTIONS.items() if parts},
+        "slugs": slugs,
+    }
+
+
+def remove_stale_files(output, recorded, current):
+    """
+    Borra los archivos que registro la corrida anterior y esta ya no genera
+    (slices que desaparecieron, archivos del otro layout) y los directorios
+    que quedan vacios. Regresa cuantos archivos borro.
+    """
+    current = set(current)
+    removed = 0
+    for path in recorded:
+        relative = Path(path)
+        if path in current or relative.is_absolute() or ".." in relative.parts:
+            continue
+        target = output.dir / relative
+        if target.is_file():
+            target.unlink()
+            removed += 1
+        for parent in relative.parents:
+            if parent == Path("."):
+                break
+            try:
+                (output.dir / parent).rmdir()
+            except OSError:
+                break
+    return removed
+
+
+def encoded_size(data, compact):
+    """Bytes del JSON como lo escribe save_json, sin comprimir y con gzip."""
+    raw = encode_json(data, compact).encode("utf-8")
+    return len(raw), len(gzip.compress(raw, compresslevel=9, mtime=0))
+
+
+def first_paint_report(output, plan):
+    """
+    Bytes que descarga el dashboard al abrir (sin filtros) con cada layout, y
+    lo que agrega cada filtro con el layout sharded (con "files" ya se
+    descargo todo). Se calcula con los datos generados, en cualquier layout.
+    """
+    sections = {section: assemble_section(section, {}, slices, output) for section, slices in plan.items()}
+    slugs = output.slugs or slice_slugs(plan)
+
+    def slice_data(path):
+        if path == INDEX_FILE:
+            return build_index(plan, slugs)
+        if path in sections:
+            return sections[path]
+        stem, part = path.split("/")[:2]
+        return sections[f"{stem}.json"][part[:-len(".json")]]
+
+    print("\nPrimer render (dashboard sin filtros):")
+    print(f"  {'layout':<8} {'archivos':>8} {'KB':>9} {'KB gzip':>9}")
+    for layout, paths in FIRST_PAINT_FILES.items():
+        sizes = [encoded_size(slice_data(path), layout == "sharded") for path in paths]
+        marker = " <- actual" if layout == output.layout else ""
+        print(f"  {layout:<8} {len(paths):>8} {sum(raw for raw, _ in sizes) / 1024:>9.1f} "
+              f"{sum(packed for _, packed in sizes) / 1024:>9.1f}{marker}")
+
+    # Un filtro con layout sharded: un slice de metricas, funnel y tendencias
+    sizes = [encoded_size(data, True) for section in ("metrics.json", "funnel.json", "trends.json")
+             for part, values in sections[section].items() if part != "all" for data in values.values()]
+    if sizes:
+        print(f"  Cada filtro con sharded agrega ~3 archivos de {sum(raw for raw, _ in sizes) / len(sizes) / 1024:.1f} KB "
+              f"({sum(packed for _, packed in sizes) / len(sizes) / 1024:.1f} KB gzip) en promedio")
+
+
+def print_changes(plan, changes, removed):
+    """Reporta que slices se regeneraron y por que."""
+    print("\nSlices regenerados:")
+    for section, slices in plan.items():
+        changed, gone = changes[section], removed[section]
+        if not changed and not gone:
+            print(f"  - {section}: sin cambios ({len(slices)} slices)")
+            continue
+        print(f"  - {section}: {len(changed)} de {len(slices)} slices")
+        by_reason = {}
+        for sid, reason in changed.items():
+            by_reason.setdefault(reason, []).append(sid)
+        if gone:
+            by_reason["ya no existe en los datos"] = gone
+        for reason, ids in by_reason.items():
+            listed = ", ".join(ids[:REPORT_MAX_SLICES])
+            more = f" (+{len(ids) - REPORT_MAX_SLICES} mas)" if len(ids) > REPORT_MAX_SLICES else ""
+            print(f"      {reason}: {listed}{more}")
+
+
+def generate_static_data(jobs=1, full=False, layout="files", gzip_copy=False):
+    """
+    Genera los archivos JSON estaticos necesarios. Solo recalcula los slices
+    cuyos datos cambiaron desde la corrida anterior (todos con full=True).
+    `layout` y `gzip_copy` eligen el formato de salida (ver StaticOutput).
+    """
+    global _DATA
 
     print("=" * 60)
     print("GENERADOR DE DATOS ESTATICOS PARA GITHUB PAGES")
     print("=" * 60)
 
+    if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        print("\n    ! fork no esta disponible en esta plataforma: se usa un solo proceso")
+        jobs = 1
+
     # Cargar datos
-    print("\n[1/6] Cargando datos desde Excel...")
+    print("\n[1/4] Cargando datos desde Excel...")
     data_loader = DataLoader()
+    data_loader.load()
 
     leads_df = data_loader.leads
     investment_df = data_loader.investment
@@ -60,44 +628,71 @@ def generate_static_data():
     print(f"    - Registros de inversion: {len(investment_df):,}")
     print(f"    - Desarrollos: {len(developments_df)}")
 
+    # Region de cada lead y registro de inversion: un solo map con el mapeo
+    # desarrollo -> region que el loader resuelve al cargar
+    region_by_desarrollo = data_loader.region_by_desarrollo
+    add_region_column(leads_df, find_column(leads_df, ['desarrollo', 'project']), region_by_desarrollo)
+    add_region_column(investment_df, find_column(investment_df, ['desarrollo', 'project']), region_by_desarrollo)
+    _DATA = (leads_df, investment_df, developments_df)
+
     # Crear directorio de salida
     output_dir = Path(__file__).parent.parent / "frontend" / "public" / "data"
     output_dir.mkdir(parents=True, exist_ok=True)
-    print(f"\n[2/6] Directorio de salida: {output_dir}")
-
-    # 1. Generar opciones de filtros
-    print("\n[3/6] Generando opciones de filtros...")
-    filter_options = generate_filter_options(leads_df, developments_df)
-    save_json(output_dir / "filter-options.json", filter_options)
-
-    # 2. Generar metricas globales y por filtro
-    print("\n[4/6] Generando metricas...")
-    metrics_data = generate_metrics(leads_df, investment_df, developments_df)
-    save_json(output_dir / "metrics.json", metrics_data)
-
-    # 3. Generar datos del funnel
-    print("\n[5/6] Generando datos del funnel...")
-    funnel_data = generate_funnel_data(leads_df, developments_df)
-    save_json(output_dir / "funnel.json", funnel_data)
-
-    # 4. Generar tendencias de conversion
-    print("\n[6/6] Generando tendencias de conversion...")
-    trends_data = generate_conversion_trends(leads_df, developments_df)
-    save_json(output_dir / "trends.json", trends_data)
-
-    # 5. Generar datos de desarrollos para el mapa
-    print("\n[6/6] Generando datos de desarrollos...")
-    developments_data = generate_developments_data(developments_df, leads_df, investment_df)
-    save_json(output_dir / "developments.json", developments_data)
+    print(f"\n[2/4] Directorio de salida: {output_dir}")
+
+    # Comparar la huella de cada slice con el manifiesto de la corrida anterior
+    print("\n[3/4] Buscando slices con cambios...")
+    plan = plan_slices(leads_df, investment_df, developments_df)
+    output = StaticOutput(output_dir, layout, gzip_copy, plan)
+    context = generation_context(leads_df, investment_df, developments_df, layout)
+    # Con --full el manifiesto solo se usa para borrar los archivos que ya no se generan
+    manifest = load_manifest()
+    changes, removed = plan_changes(plan, None if full else manifest, context, output)
+    if full:
+        changes = {section: {sid: "regeneracion completa (--full)" for sid in slices} for section, slices in plan.items()}
+
+    # Opciones de filtros, metricas, funnel, tendencias y desarrollos
+    print(f"\n[4/4] Generando slices con cambios ({jobs} {'proceso' if jobs == 1 else 'procesos'}, layout {layout})...")
+    timings = generate_sections(output, plan, changes, removed, jobs)
+    if output.sharded:
+        output.save(INDEX_FILE, build_index(plan, output.slugs))
+
+    files = output.files(plan)
+    stale = remove_stale_files(output, (manifest or {}).get("files", {}), files)
+    (output_dir / LEGACY_MANIFEST_FILE).unlink(missing_ok=True)
+    save_json(MANIFEST_PATH, {
+        "version": MANIFEST_VERSION,
+        "context": context,
+        "layout": layout,
+        "files": {path: file_hash(output_dir / path) for path in files},
+        "slices": {section: {sid: entry[3] for sid, entry in slices.items()} for section, slices in plan.items()},
+    })
 
     print("\n" + "=" * 60)
     print("GENERACION COMPLETADA")
     print("=" * 60)
     print(f"\nArchivos generados en: {output_dir}")
+    print_changes(plan, changes, removed)
+    print("\nTiempo por seccion (calculo de sus partes / escrito a los):")
+    for section in SECTIONS:
+        timing = timings.get(section)
+        if timing is None:
+            print(f"  - {section:<20} sin cambios")
+        else:
+            print(f"  - {section:<20} {timing['compute']:>7.2f} s / {timing['written']:>7.2f} s")
+    if stale:
+        print(f"\nArchivos que ya no se generan, borrados: {stale}")
     print("\nArchivos creados:")
     for f in output_dir.glob("*.json"):
         size = f.stat().st_size / 1024
         print(f"  - {f.name} ({size:.1f} KB)")
+    if output.sharded:
+        for section, parts in SECTIONS.items():
+            if parts:
+                shards = [path for path in files if path.startswith(section[:-len(".json")] + "/") and path.endswith(".json")]
+                size = sum((output_dir / path).stat().st_size for path in shards) / 1024
+                print(f"  - {section[:-len('.json')]}/ ({len(shards)} archivos, {size:.1f} KB)")
+    first_paint_report(output, plan)
 
 
 def normalize_string(s):
@@ -122,21 +717,12 @@ def find_column(df, possible_names):
     return None
 
 
-def get_region_for_desarrollo(developments_df, desarrollo):
-    """Obtiene la region para un desarrollo dado."""
-    dev_name_col = find_column(developments_df, ['desarrollo'])
-    region_col = None
-    for col in developments_df.columns:
-        col_clean = col.lower().replace('ó', 'o').replace('ö', 'o')
-        if 'region' in col_clean:
-            region_col = col
-            break
-
-    if dev_name_col and region_col:
-        match = developments_df[developments_df[dev_name_col] == desarrollo]
-        if len(match) > 0:
-            return match[region_col].iloc[0]
-    return None
+def add_region_column(df, desarrollo_col, region_by_desarrollo):
+    """Agrega `_region` (region del desarrollo de cada fila) con un solo map vectorizado."""
+    if desarrollo_col and region_by_desarrollo is not None:
+        df['_region'] = df[desarrollo_col].map(region_by_desarrollo)
+    else:
+        df['_region'] = None
 
 
 def generate_filter_options(leads_df, developments_df):
@@ -171,46 +757,111 @@ def generate_filter_options(leads_df, developments_df):
     }
 
 
-def calculate_metrics_for_filter(leads_df, investment_df, filter_key, filter_value):
-    """Calcula metricas para un filtro especifico."""
+# Nombres posibles de las columnas de fecha de cada etapa
+STAGE_COLUMN_NAMES = {
+    "contacto": ['fecha_contacto', 'fecha_de_contacto'],
+    "cita": ['fecha_cita', 'fecha_de_cita'],
+    "venta_bruta": ['fecha_venta_bruta', 'fecha_de_venta_bruta'],
+    "escrituracion": ['fecha_escrituracion', 'fecha_de_escrituración'],
+}
 
-    filtered_leads = leads_df.copy()
-    filtered_investment = investment_df.copy()
+# Las metricas tambien aceptan una columna 'venta' como venta bruta
+METRICS_STAGE_COLUMN_NAMES = dict(
+    STAGE_COLUMN_NAMES, venta_bruta=['fecha_venta_bruta', 'fecha_de_venta_bruta', 'venta']
+)
 
-    desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
-    inv_desarrollo_col = find_column(investment_df, ['desarrollo', 'project'])
 
-    if filter_key == "all":
-        pass  # Sin filtro
-    elif filter_key == "desarrollo" and desarrollo_col:
-        filtered_leads = filtered_leads[filtered_leads[desarrollo_col] == filter_value]
-        if inv_desarrollo_col:
-            filtered_investment = filtered_investment[filtered_investment[inv_desarrollo_col] == filter_value]
-    elif filter_key == "region" and desarrollo_col:
-        filtered_leads = filtered_leads[filtered_leads['_region'] == filter_value]
-        if inv_desarrollo_col:
-            filtered_investment = filtered_investment[filtered_investment['_region'] == filter_value]
-    elif filter_key == "year" and 'year_iso' in leads_df.columns:
-        filtered_leads = filtered_leads[filtered_leads['year_iso'] == filter_value]
-    elif filter_key == "week" and 'cohort_week' in leads_df.columns:
-        filtered_leads = filtered_leads[filtered_leads['cohort_week'] == filter_value]
-
-    # Calcular metricas
-    total_leads = len(filtered_leads)
-
-    contacto_col = find_column(filtered_leads, ['fecha_contacto', 'fecha_de_contacto'])
-    cita_col = find_column(filtered_leads, ['fecha_cita', 'fecha_de_cita'])
-    venta_col = find_column(filtered_leads, ['fecha_venta_bruta', 'fecha_de_venta_bruta', 'venta'])
-    escritura_col = find_column(filtered_leads, ['fecha_escrituracion', 'fecha_de_escrituración'])
-
-    total_contacts = int(filtered_leads[contacto_col].notna().sum()) if contacto_col else 0
-    total_appointments = int(filtered_leads[cita_col].notna().sum()) if cita_col else 0
-    total_gross_sales = int(filtered_leads[venta_col].notna().sum()) if venta_col else 0
-    total_closings = int(filtered_leads[escritura_col].notna().sum()) if escritura_col else 0
-
-    # Inversion
-    inversion_col = find_column(filtered_investment, ['inversion', 'inversión', 'monto'])
-    total_investment = float(filtered_investment[inversion_col].sum()) if inversion_col else 0.0
+def find_stage_columns(leads_df, column_names=STAGE_COLUMN_NAMES):
+    """Columna de fecha de cada etapa (None si no existe), resuelta una sola vez."""
+    return {stage: find_column(leads_df, names) for stage, names in column_names.items()}
+
+
+def stage_flags(leads_df, stage_columns):
+    """Un indicador por etapa: el lead tiene fecha en esa etapa."""
+    return pd.DataFrame({
+        stage: leads_df[col].notna() if col else False
+        for stage, col in stage_columns.items()
+    }, index=leads_df.index)
+
+
+def wants(parts, name):
+    """La parte `name` se incluye en la salida (parts=None: todas)."""
+    return parts is None or name in parts
+
+
+# Texto de cada dimension en los mensajes de progreso
+DIMENSION_LABELS = {
+    "by_region": "por region",
+    "by_desarrollo": "por desarrollo",
+    "by_year": "por ano",
+    "by_week": "por semana ISO",
+}
+
+
+def slice_dimensions(leads_df, desarrollo_col, include_weeks=True):
+    """
+    Dimensiones de los slices: nombre -> (columna de agrupacion, valores en el
+    orden de salida, llave JSON de cada valor). Una dimension sin columna
+    queda sin valores.
+    """
+    dimensions = {
+        "by_region": ('_region', leads_df['_region'].dropna().unique(), lambda value: value),
+        "by_desarrollo": (desarrollo_col, [], lambda value: value),
+        "by_year": ('year_iso', [], lambda value: str(int(value))),
+    }
+    if desarrollo_col:
+        dimensions["by_desarrollo"] = (desarrollo_col, leads_df[desarrollo_col].dropna().unique(), lambda value: value)
+    if 'year_iso' in leads_df.columns:
+        dimensions["by_year"] = ('year_iso', leads_df['year_iso'].dropna().unique(), lambda value: str(int(value)))
+    if include_weeks:
+        dimensions["by_week"] = ('cohort_week', [], lambda value: value)
+        if 'cohort_week' in leads_df.columns:
+            weeks = sorted(leads_df['cohort_week'].dropna().unique().tolist())
+            dimensions["by_week"] = ('cohort_week', weeks, lambda value: value)
+    return dimensions
+
+
+def restrict_values(leads_df, key_col, values, only):
+    """
+    Valores de una dimension limitados a `only` (None = todos) y mascara de
+    las filas con esos valores (None = todas), para recalcular solo esos slices.
+    """
+    if only is None:
+        return values, None
+    values = [value for value in values if value in only]
+    return values, leads_df[key_col].isin(values).to_numpy()
+
+
+def count_by(leads_df, flags, key_col, rows=None):
+    """Leads e indicadores sumados por valor de key_col, en una sola pasada (groupby)."""
+    if rows is not None:
+        leads_df, flags = leads_df[rows], flags[rows]
+    grouped = flags.groupby(leads_df[key_col], sort=False)
+    counts = grouped.sum()
+    counts['leads'] = grouped.size()
+    return counts.to_dict('index')
+
+
+def total_counts(leads_df, flags):
+    """Como count_by, sin agrupar."""
+    counts = {stage: int(count) for stage, count in flags.sum().items()}
+    counts['leads'] = len(leads_df)
+    return counts
+
+
+def sum_by(df, key_col, value_col):
+    """Suma de value_col por valor de key_col (misma suma que filtrando cada valor)."""
+    return {key: float(group.sum()) for key, group in df.groupby(key_col, sort=False)[value_col]}
+
+
+def metrics_from_counts(counts, total_investment):
+    """Metricas de un slice a partir de sus conteos por etapa y su inversion."""
+
+    total_leads = int(counts['leads'])
+    total_contacts = int(counts['contacto'])
+    total_appointments = int(counts['cita'])
+    total_gross_sales = int(counts['venta_bruta'])
+    total_closings = int(counts['escrituracion'])
 
     # Costos
     cost_per_lead = total_investment / total_leads if total_leads > 0 else 0
@@ -246,113 +897,72 @@ def calculate_metrics_for_filter(leads_df, investment_df, filter_key, filter_val
     }
 
 
-def generate_metrics(leads_df, investment_df, developments_df):
-    """Genera metricas pre-calculadas para todas las combinaciones de filtros."""
+def generate_metrics(leads_df, investment_df, parts=None, only=None):
+    """
+    Genera metricas pre-calculadas para todas las combinaciones de filtros
+    (requiere `_region`). `parts` limita la salida a esas llaves (ver SECTIONS)
+    y `only` ({dimension: valores}) a esos valores de una dimension.
+    """
 
-    # Agregar columna de region a leads e investment
     desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
     inv_desarrollo_col = find_column(investment_df, ['desarrollo', 'project'])
 
-    leads_df['_region'] = leads_df[desarrollo_col].apply(
-        lambda x: get_region_for_desarrollo(developments_df, x)
-    ) if desarrollo_col else None
+    flags = stage_flags(leads_df, find_stage_columns(leads_df, METRICS_STAGE_COLUMN_NAMES))
 
-    if inv_desarrollo_col:
-        investment_df['_region'] = investment_df[inv_desarrollo_col].apply(
-            lambda x: get_region_for_desarrollo(developments_df, x)
-        )
+    # Inversion total y por region/desarrollo (los slices por ano y semana usan la total)
+    inversion_col = find_column(investment_df, ['inversion', 'inversión', 'monto'])
+    total_investment = float(investment_df[inversion_col].sum()) if inversion_col else 0.0
+    investment_by = {}
+    if inversion_col and inv_desarrollo_col:
+        investment_by["by_region"] = sum_by(investment_df, '_region', inversion_col)
+        investment_by["by_desarrollo"] = sum_by(investment_df, inv_desarrollo_col, inversion_col)
 
     metrics = {}
 
     # Metricas globales
-    print("    - Calculando metricas globales...")
-    metrics["all"] = calculate_metrics_for_filter(leads_df, investment_df, "all", None)
-
-    # Por region
-    print("    - Calculando metricas por region...")
-    metrics["by_region"] = {}
-    for region in leads_df['_region'].dropna().unique():
-        metrics["by_region"][region] = calculate_metrics_for_filter(
-            leads_df, investment_df, "region", region
-        )
-
-    # Por desarrollo
-    print("    - Calculando metricas por desarrollo...")
-    metrics["by_desarrollo"] = {}
-    if desarrollo_col:
-        for desarrollo in leads_df[desarrollo_col].dropna().unique():
-            metrics["by_desarrollo"][desarrollo] = calculate_metrics_for_filter(
-                leads_df, investment_df, "desarrollo", desarrollo
-            )
-
-    # Por ano
-    print("    - Calculando metricas por ano...")
-    metrics["by_year"] = {}
-    if 'year_iso' in leads_df.columns:
-        for year in leads_df['year_iso'].dropna().unique():
-            metrics["by_year"][str(int(year))] = calculate_metrics_for_filter(
-                leads_df, investment_df, "year", year
-            )
-
-    # Por semana ISO
-    print("    - Calculando metricas por semana ISO...")
-    metrics["by_week"] = {}
-    if 'cohort_week' in leads_df.columns:
-        weeks = sorted(leads_df['cohort_week'].dropna().unique().tolist())
-        for week in weeks:
-            metrics["by_week"][week] = calculate_metrics_for_filter(
-                leads_df, investment_df, "week", week
-            )
+    if wants(parts, "all"):
+        print("    - Calculando metricas globales...")
+        metrics["all"] = metrics_from_counts(total_counts(leads_df, flags), total_investment)
+
+    # Por region, desarrollo, ano y semana ISO: un groupby por dimension
+    for name, (key_col, values, json_key) in slice_dimensions(leads_df, desarrollo_col).items():
+        if not wants(parts, name):
+            continue
+        print(f"    - Calculando metricas {DIMENSION_LABELS[name]}...")
+        metrics[name] = {}
+        values, rows = restrict_values(leads_df, key_col, values, (only or {}).get(name))
+        if len(values) == 0:
+            continue
+        counts = count_by(leads_df, flags, key_col, rows)
+        investment = investment_by.get(name)
+        for value in values:
+            slice_investment = investment.get(value, 0.0) if investment is not None else total_investment
+            metrics[name][json_key(value)] = metrics_from_counts(counts[value], slice_investment)
 
     return metrics
 
 
-def calculate_funnel_for_filter(leads_df, filter_key, filter_value):
-    """Calcula datos del funnel para un filtro (acumulativo - cada etapa requiere las anteriores)."""
-
-    filtered = leads_df.copy()
-    desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
-
-    if filter_key == "region":
-        filtered = filtered[filtered['_region'] == filter_value]
-    elif filter_key == "desarrollo" and desarrollo_col:
-        filtered = filtered[filtered[desarrollo_col] == filter_value]
-    elif filter_key == "year" and 'year_iso' in leads_df.columns:
-        filtered = filtered[filtered['year_iso'] == filter_value]
-    elif filter_key == "week" and 'cohort_week' in leads_df.columns:
-        filtered = filtered[filtered['cohort_week'] == filter_value]
-
-    total_leads = len(filtered)
-
-    contacto_col = find_column(filtered, ['fecha_contacto', 'fecha_de_contacto'])
-    cita_col = find_column(filtered, ['fecha_cita', 'fecha_de_cita'])
-    venta_col = find_column(filtered, ['fecha_venta_bruta', 'fecha_de_venta_bruta'])
-    escritura_col = find_column(filtered, ['fecha_escrituracion', 'fecha_de_escrituración'])
+def funnel_flags(leads_df, stage_columns):
+    """Indicadores acumulativos del funnel: cada etapa requiere las anteriores."""
+    reached = leads_df[stage_columns['contacto']].notna() if stage_columns['contacto'] else False
+    flags = {"contacto": reached}
+    for stage in ("cita", "venta_bruta", "escrituracion"):
+        col = stage_columns[stage]
+        reached = reached & leads_df[col].notna() if col else False
+        flags[stage] = reached
+    return pd.DataFrame(flags, index=leads_df.index)
 
-    # Calcular de forma ACUMULATIVA - cada etapa requiere las anteriores
-    # Contacto: tiene fecha de contacto
-    has_contacto = filtered[contacto_col].notna() if contacto_col else pd.Series([False] * len(filtered))
 
-    # Cita: tiene contacto Y cita
-    has_cita = has_contacto & (filtered[cita_col].notna() if cita_col else False)
-
-    # Venta: tiene contacto Y cita Y venta
-    has_venta = has_cita & (filtered[venta_col].notna() if venta_col else False)
-
-    # Escrituracion: tiene todo el proceso completo
-    has_escritura = has_venta & (filtered[escritura_col].notna() if escritura_col else False)
-
-    count_contacto = int(has_contacto.sum())
-    count_cita = int(has_cita.sum())
-    count_venta = int(has_venta.sum())
-    count_escritura = int(has_escritura.sum())
+def funnel_from_counts(counts):
+    """Datos del funnel de un slice a partir de sus conteos acumulativos."""
 
+    total_leads = int(counts['leads'])
     stages = [
         {"stage": "lead", "stage_label": "Lead", "count": total_leads},
-        {"stage": "contacto", "stage_label": "Contacto", "count": count_contacto},
-        {"stage": "cita", "stage_label": "Cita", "count": count_cita},
-        {"stage": "venta_bruta", "stage_label": "Venta Bruta", "count": count_venta},
-        {"stage": "escrituracion", "stage_label": "Escrituracion", "count": count_escritura},
+        {"stage": "contacto", "stage_label": "Contacto", "count": int(counts['contacto'])},
+        {"stage": "cita", "stage_label": "Cita", "count": int(counts['cita'])},
+        {"stage": "venta_bruta", "stage_label": "Venta Bruta", "count": int(counts['venta_bruta'])},
+        {"stage": "escrituracion", "stage_label": "Escrituracion", "count": int(counts['escrituracion'])},
     ]
 
     # Calcular porcentajes
@@ -371,131 +981,120 @@ def calculate_funnel_for_filter(leads_df, filter_key, filter_value):
     return {"stages": stages, "total_leads": total_leads}
 
 
-def generate_funnel_data(leads_df, developments_df):
-    """Genera datos del funnel para todas las combinaciones."""
+def generate_funnel_data(leads_df, parts=None, only=None):
+    """
+    Genera datos del funnel para todas las combinaciones (requiere `_region`).
+    `parts` y `only` limitan la salida como en generate_metrics.
+    """
 
     desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
-    leads_df['_region'] = leads_df[desarrollo_col].apply(
-        lambda x: get_region_for_desarrollo(developments_df, x)
-    ) if desarrollo_col else None
+
+    flags = funnel_flags(leads_df, find_stage_columns(leads_df))
 
     funnel = {}
 
     # Global
-    funnel["all"] = calculate_funnel_for_filter(leads_df, "all", None)
-
-    # Por region
-    funnel["by_region"] = {}
-    for region in leads_df['_region'].dropna().unique():
-        funnel["by_region"][region] = calculate_funnel_for_filter(leads_df, "region", region)
-
-    # Por desarrollo
-    funnel["by_desarrollo"] = {}
-    if desarrollo_col:
-        for desarrollo in leads_df[desarrollo_col].dropna().unique():
-            funnel["by_desarrollo"][desarrollo] = calculate_funnel_for_filter(
-                leads_df, "desarrollo", desarrollo
-            )
-
-    # Por ano
-    funnel["by_year"] = {}
-    if 'year_iso' in leads_df.columns:
-        for year in leads_df['year_iso'].dropna().unique():
-            funnel["by_year"][str(int(year))] = calculate_funnel_for_filter(
-                leads_df, "year", year
-            )
-
-    # Por semana ISO
-    print("    - Calculando funnel por semana ISO...")
-    funnel["by_week"] = {}
-    if 'cohort_week' in leads_df.columns:
-        weeks = sorted(leads_df['cohort_week'].dropna().unique().tolist())
-        for week in weeks:
-            funnel["by_week"][week] = calculate_funnel_for_filter(
-                leads_df, "week", week
-            )
+    if wants(parts, "all"):
+        funnel["all"] = funnel_from_counts(total_counts(leads_df, flags))
+
+    # Por region, desarrollo, ano y semana ISO: un groupby por dimension
+    for name, (key_col, values, json_key) in slice_dimensions(leads_df, desarrollo_col).items():
+        if not wants(parts, name):
+            continue
+        print(f"    - Calculando funnel {DIMENSION_LABELS[name]}...")
+        funnel[name] = {}
+        values, rows = restrict_values(leads_df, key_col, values, (only or {}).get(name))
+        if len(values) == 0:
+            continue
+        counts = count_by(leads_df, flags, key_col, rows)
+        for value in values:
+            funnel[name][json_key(value)] = funnel_from_counts(counts[value])
 
     return funnel
 
 
-def calculate_trends_for_filter(leads_df, filter_key=None, filter_value=None):
-    """Calcula tendencias de conversion por mes."""
+def trends_by_period(flags, period, keys=None):
+    """
+    Leads y conversiones por mes de registro, en una sola pasada. Con `keys`
+    agrupa ademas por ese valor: {valor: [(mes, conteos)]}; sin `keys` regresa
+    [(mes, conteos)]. Los meses quedan en orden.
+    """
+    by = [period] if keys is None else [keys, period]
+    grouped = flags.groupby(by, sort=False)
+    counts = grouped.sum()
+    counts['leads'] = grouped.size()
 
-    filtered = leads_df.copy()
-    desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
-
-    if filter_key == "region":
-        filtered = filtered[filtered['_region'] == filter_value]
-    elif filter_key == "desarrollo" and desarrollo_col:
-        filtered = filtered[filtered[desarrollo_col] == filter_value]
-    elif filter_key == "year" and 'year_iso' in leads_df.columns:
-        filtered = filtered[filtered['year_iso'] == filter_value]
-
-    date_col = find_column(filtered, ['fecha_registro', 'fecha_de_registro'])
-    if not date_col:
-        return {"data": [], "period_type": "month"}
+    periods = {}
+    for index, row in counts.to_dict('index').items():
+        key, month = (None, index) if keys is None else index
+        periods.setdefault(key, []).append((month, row))
+    for rows in periods.values():
+        rows.sort(key=lambda item: item[0])
+    return periods.get(None, []) if keys is None else periods
 
-    filtered['_period'] = filtered[date_col].dt.to_period('M').astype(str)
 
-    contacto_col = find_column(filtered, ['fecha_contacto', 'fecha_de_contacto'])
-    cita_col = find_column(filtered, ['fecha_cita', 'fecha_de_cita'])
-    venta_col = find_column(filtered, ['fecha_venta_bruta', 'fecha_de_venta_bruta'])
-    escritura_col = find_column(filtered, ['fecha_escrituracion', 'fecha_de_escrituración'])
+def trends_from_counts(periods):
+    """Tendencias de conversion de un slice a partir de sus conteos por mes."""
 
     trends = []
-    for period in sorted(filtered['_period'].unique()):
-        period_df = filtered[filtered['_period'] == period]
-        total = len(period_df)
-
-        if total > 0:
-            contacto = int(period_df[contacto_col].notna().sum()) if contacto_col else 0
-            cita = int(period_df[cita_col].notna().sum()) if cita_col else 0
-            venta = int(period_df[venta_col].notna().sum()) if venta_col else 0
-            escritura = int(period_df[escritura_col].notna().sum()) if escritura_col else 0
-
-            trends.append({
-                "period": period,
-                "leads": total,
-                "contacto": round(contacto / total * 100, 2),
-                "cita": round(cita / total * 100, 2),
-                "venta_bruta": round(venta / total * 100, 2),
-                "escrituracion": round(escritura / total * 100, 2)
-            })
+    for period, counts in periods:
+        total = int(counts['leads'])
+        trends.append({
+            "period": period,
+            "leads": total,
+            "contacto": round(int(counts['contacto']) / total * 100, 2),
+            "cita": round(int(counts['cita']) / total * 100, 2),
+            "venta_bruta": round(int(counts['venta_bruta']) / total * 100, 2),
+            "escrituracion": round(int(counts['escrituracion']) / total * 100, 2)
+        })
 
     return {"data": trends, "period_type": "month"}
 
 
-def generate_conversion_trends(leads_df, developments_df):
-    """Genera tendencias para todas las combinaciones."""
+def generate_conversion_trends(leads_df, parts=None, only=None):
+    """
+    Genera tendencias para todas las combinaciones (requiere `_region`).
+    `parts` y `only` limitan la salida como en generate_metrics.
+    """
 
     desarrollo_col = find_column(leads_df, ['desarrollo', 'project'])
-    leads_df['_region'] = leads_df[desarrollo_col].apply(
-        lambda x: get_region_for_desarrollo(developments_df, x)
-    ) if desarrollo_col else None
 
-    trends = {}
+    dimensions = {}
+    for name, (key_col, values, json_key) in slice_dimensions(leads_df, desarrollo_col, include_weeks=False).items():
+        if wants(parts, name):
+            values, rows = restrict_values(leads_df, key_col, values, (only or {}).get(name))
+            dimensions[name] = (key_col, values, json_key, rows)
 
-    # Global
-    trends["all"] = calculate_trends_for_filter(leads_df)
+    date_col = find_column(leads_df, ['fecha_registro', 'fecha_de_registro'])
+    if not date_col:
+        empty = {"data": [], "period_type": "month"}
+        trends = {"all": empty} if wants(parts, "all") else {}
+        for name, (_, values, json_key, _) in dimensions.items():
+            trends[name] = {json_key(value): empty for value in values}
+        return trends
 
-    # Por region
-    trends["by_region"] = {}
-    for region in leads_df['_region'].dropna().unique():
-        trends["by_region"][region] = calculate_trends_for_filter(leads_df, "region", region)
+    # Mes de registro de cada lead (una sola vez para todos los slices)
+    period = leads_df[date_col].dt.to_period('M').astype(str)
+    flags = stage_flags(leads_df, find_stage_columns(leads_df))
 
-    # Por desarrollo
-    print("    - Calculando tendencias por desarrollo...")
-    trends["by_desarrollo"] = {}
-    if desarrollo_col:
-        for desarrollo in leads_df[desarrollo_col].dropna().unique():
-            trends["by_desarrollo"][desarrollo] = calculate_trends_for_filter(leads_df, "desarrollo", desarrollo)
+    trends = {}
 
-    # Por ano
-    print("    - Calculando tendencias por ano...")
-    trends["by_year"] = {}
-    if 'year_iso' in leads_df.columns:
-        for year in leads_df['year_iso'].dropna().unique():
-            trends["by_year"][str(int(year))] = calculate_trends_for_filter(leads_df, "year", year)
+    # Global
+    if wants(parts, "all"):
+        trends["all"] = trends_from_counts(trends_by_period(flags, period))
+
+    # Por region, desarrollo y ano: un groupby por dimension (y mes)
+    for name, (key_col, values, json_key, rows) in dimensions.items():
+        print(f"    - Calculando tendencias {DIMENSION_LABELS[name]}...")
+        trends[name] = {}
+        if len(values) == 0:
+            continue
+        if rows is None:
+            periods = trends_by_period(flags, period, leads_df[key_col])
+        else:
+            periods = trends_by_period(flags[rows], period[rows], leads_df[key_col][rows])
+        for value in values:
+            trends[name][json_key(value)] = trends_from_counts(periods[value])
 
     return trends
 
@@ -591,12 +1190,48 @@ def generate_developments_data(developments_df, leads_df, investment_df):
     return developments
 
 
-def save_json(filepath, data):
-    """Guarda datos en formato JSON."""
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"    -> Guardado: {filepath.name}")
+def encode_json(data, compact=False):
+    """JSON con indent=2, o sin espacios si compact."""
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+def save_json(filepath, data, compact=False, gzip_copy=False, verbose=True):
+    """
+    Guarda datos en formato JSON (y una copia .gz si gzip_copy); los archivos
+    que ya tienen ese contenido no se reescriben. Regresa si cambio el JSON.
+    """
+    content = encode_json(data, compact)
+    changed = not (filepath.exists() and filepath.read_text(encoding='utf-8') == content)
+    if changed:
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+    if gzip_copy:
+        # mtime=0: la misma entrada da el mismo .gz
+        packed = gzip.compress(content.encode('utf-8'), compresslevel=9, mtime=0)
+        gz_path = filepath.with_name(filepath.name + ".gz")
+        if not gz_path.exists() or gz_path.read_bytes() != packed:
+            gz_path.write_bytes(packed)
+    if verbose:
+        print(f"    -> {'Guardado' if changed else 'Sin cambios'}: {filepath.name}")
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Procesos para calcular las secciones en paralelo (default 1)")
+    parser.add_argument("--full", action="store_true",
+                        help="Regenera todos los slices sin consultar el manifiesto")
+    parser.add_argument("--layout", choices=LAYOUTS, default="files",
+                        help="files: un JSON por seccion (default); sharded: un JSON compacto por slice e index.json")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Escribe ademas una copia .gz de cada archivo")
+    args = parser.parse_args()
+    generate_static_data(jobs=max(args.jobs, 1), full=args.full, layout=args.layout, gzip_copy=args.gzip)
 
 
 if __name__ == "__main__":
-    generate_static_data()
+    main()
@@ -0,0 +1,53 @@
+"""
+Envia un archivo delta de leads al backend en ejecucion.
+
+El servidor aplica los leads nuevos o actualizados en memoria y actualiza
+funnel, metricas, desarrollos y cohorts sin reiniciar (POST /api/v1/ingest/leads).
+
+El endpoint requiere el token de administracion del servidor (ADMIN_TOKEN),
+que se toma de --token o de la variable de entorno ADMIN_TOKEN.
+
+Uso:
+    python ingest_leads.py nuevos_leads.xlsx
+    python ingest_leads.py nuevos_leads.csv --url http://localhost:8000 --token $ADMIN_TOKEN
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("delta", type=Path, help="Excel o CSV con las columnas de la hoja de leads")
+    parser.add_argument("--url", default="http://localhost:8000", help="URL base del backend")
+    parser.add_argument("--token", default=os.environ.get("ADMIN_TOKEN", ""),
+                        help="Token de administracion (default: variable ADMIN_TOKEN)")
+    args = parser.parse_args()
+
+    fmt = "csv" if args.delta.suffix.lower() == ".csv" else "xlsx"
+    request = urllib.request.Request(
+        f"{args.url.rstrip('/')}/api/v1/ingest/leads?format={fmt}",
+        data=args.delta.read_bytes(),
+        headers={"Content-Type": "application/octet-stream", "X-Admin-Token": args.token},
+        method="POST",
+    )
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            result = json.load(response)
+    except urllib.error.HTTPError as e:
+        print(f"Error {e.code}: {e.read().decode(errors='replace')}")
+        sys.exit(1)
+
+    print(f"Insertados: {result['inserted']}, actualizados: {result['updated']}, "
+          f"total: {result['total_leads']} leads ({result['elapsed_ms']} ms)")
+    print(f"Version de datos: {result['data_version']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,28 @@
-# Force reload data - Fixed funnel sequence logic v2
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+
+from app.api.routes import cohorts, funnel, metrics, developments, filters, cache, ingest, admin, dashboard
+from app.models.schemas import ReadinessStatus
+from app.services.cohort_pool import CohortPoolSaturated, CohortPoolTimeout, cohort_pool
+from app.services.data_loader import DataNotReady, data_loader
+
+# Segundos que se sugiere esperar (Retry-After) mientras cargan los datos
+WARMUP_RETRY_AFTER = 5
 
-# Reset DataLoader singleton to force recalculation with new logic
-from app.services.data_loader import DataLoader
-DataLoader._instance = None
-DataLoader._data_loaded = False
 
-from app.api.routes import cohorts, funnel, metrics, developments, filters
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los datos se cargan en segundo plano: el servidor acepta conexiones
+    # (y responde /health) mientras se procesa el Excel
+    data_loader.start()
+    # COHORT_PROCESSES=N: procesos para cohorts filtrados pesados (cargan sus datos al arrancar)
+    cohort_pool.start()
+    yield
+    cohort_pool.stop()
+
 
 app = FastAPI(
     title="Cohort & Funnel Analysis API",
@@ -23,7 +38,8 @@ app = FastAPI(
     * **Desarrollos**: Ubicación geográfica y métricas por desarrollo
     * **Filtros**: Por desarrollo, región, año, mes, semana ISO
     """,
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS para permitir peticiones desde el frontend
@@ -41,6 +57,10 @@ app.include_router(funnel.router, prefix="/api/v1")
 app.include_router(metrics.router, prefix="/api/v1")
 app.include_router(developments.router, prefix="/api/v1")
 app.include_router(filters.router, prefix="/api/v1")
+app.include_router(cache.router, prefix="/api/v1")
+app.include_router(ingest.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
+app.include_router(dashboard.router, prefix="/api/v1")
 
 
 @app.get("/")
@@ -52,13 +72,47 @@ async def root():
     }
 
 
+@app.exception_handler(DataNotReady)
+async def data_not_ready_handler(request: Request, exc: DataNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Los datos se estan cargando (warming up)", **data_loader.readiness()},
+        headers={"Retry-After": str(WARMUP_RETRY_AFTER)}
+    )
+
+
+@app.exception_handler(CohortPoolSaturated)
+async def cohort_pool_saturated_handler(request: Request, exc: CohortPoolSaturated):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Demasiados calculos de cohorts en curso, reintentar mas tarde",
+                 "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(CohortPoolTimeout)
+async def cohort_pool_timeout_handler(request: Request, exc: CohortPoolTimeout):
+    return JSONResponse(status_code=504, content={"detail": str(exc), "timeout_seconds": exc.timeout})
+
+
 @app.get("/health")
 async def health_check():
+    """Liveness: el proceso responde, aunque los datos sigan cargando"""
     return {"status": "healthy"}
 
 
+@app.get("/ready", response_model=ReadinessStatus)
+async def readiness_check():
+    """Readiness: 200 cuando los datos estan cargados, 503 mientras cargan (con progreso)"""
+    readiness = data_loader.readiness()
+    if readiness['status'] != 'ready':
+        return JSONResponse(status_code=503, content=readiness,
+                            headers={"Retry-After": str(WARMUP_RETRY_AFTER)})
+    return readiness
+
+
 @app.get("/api/v1/columns")
 async def get_columns():
     """Debug endpoint para ver los nombres de columnas del Excel"""
-    from app.services.data_loader import data_loader
     return data_loader.get_column_names()
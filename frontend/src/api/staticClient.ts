@@ -4,7 +4,11 @@
  * Este cliente lee datos pre-calculados desde archivos JSON estaticos,
  * eliminando la necesidad de un backend en tiempo real.
  *
- * Los datos son generados por el script generate_static_data.py
+ * Los datos son generados por el script generate_static_data.py. Con
+ * `--layout sharded` cada slice (p.ej. funnel/by_desarrollo/<slug>.json) es un
+ * archivo aparte e index.json indica el slug de cada valor: el cliente descarga
+ * solo el slice que muestra. Sin index.json se usan los archivos completos
+ * (metrics.json, funnel.json, trends.json).
  */
 
 import type {
@@ -19,6 +23,17 @@ import type {
 // Cache para evitar cargar los mismos datos multiples veces
 const dataCache: Record<string, any> = {};
 
+/**
+ * Indice del layout sharded: partes de cada seccion y slug de cada valor
+ */
+interface StaticIndex {
+  version: number;
+  sections: Record<string, string[]>;
+  slugs: Record<string, Record<string, string>>;
+}
+
+let indexPromise: Promise<StaticIndex | null> | null = null;
+
 /**
  * Carga un archivo JSON con cache
  */
@@ -37,6 +52,20 @@ async function loadJSON<T>(filename: string): Promise<T> {
   return data as T;
 }
 
+/**
+ * Carga index.json una sola vez (null si los datos no estan en layout sharded)
+ */
+function loadIndex(): Promise<StaticIndex | null> {
+  if (!indexPromise) {
+    indexPromise = fetch(`${import.meta.env.BASE_URL}data/index.json`)
+      .then((response) => (response.ok ? response.json() : null))
+      // Un servidor que responde index.html en lugar de 404 tampoco da un indice valido
+      .catch(() => null)
+      .then((index) => (index && index.sections && index.slugs ? (index as StaticIndex) : null));
+  }
+  return indexPromise;
+}
+
 /**
  * Genera una clave de filtro basada en el estado actual
  */
@@ -76,6 +105,27 @@ function getFilteredData<T>(data: any, filters: FilterState, defaultKey: string
   return data[defaultKey];
 }
 
+/**
+ * Datos de una seccion (metrics, funnel, trends) para los filtros: con index.json
+ * descarga solo el archivo del slice, si no el archivo completo de la seccion
+ */
+async function loadSection<T>(section: string, filters: FilterState): Promise<T> {
+  const index = await loadIndex();
+  if (!index) {
+    const allData = await loadJSON<any>(`${section}.json`);
+    return getFilteredData<T>(allData, filters);
+  }
+
+  const filterKey = getFilterKey(filters);
+  const parts = index.sections[section] || [];
+  const slug = filterKey && parts.includes(filterKey.type)
+    ? index.slugs[filterKey.type]?.[filterKey.value]
+    : undefined;
+
+  // Fallback a datos globales si no hay datos para el filtro
+  return loadJSON<T>(filterKey && slug ? `${section}/${filterKey.type}/${slug}.json` : `${section}/all.json`);
+}
+
 // ============================================================================
 // API PUBLICA
 // ============================================================================
@@ -94,16 +144,14 @@ export const fetchMetrics = async (
   filters: FilterState,
   _signal?: AbortSignal
 ): Promise<MetricsResponse> => {
-  const allMetrics = await loadJSON<any>('metrics.json');
-  return getFilteredData<MetricsResponse>(allMetrics, filters);
+  return loadSection<MetricsResponse>('metrics', filters);
 };
 
 /**
  * Obtiene datos del funnel filtrados
  */
 export const fetchFunnel = async (filters: FilterState): Promise<FunnelResponse> => {
-  const allFunnel = await loadJSON<any>('funnel.json');
-  return getFilteredData<FunnelResponse>(allFunnel, filters);
+  return loadSection<FunnelResponse>('funnel', filters);
 };
 
 /**
@@ -112,8 +160,7 @@ export const fetchFunnel = async (filters: FilterState): Promise<FunnelResponse>
 export const fetchConversionTrends = async (
   filters: FilterState
 ): Promise<ConversionTrendResponse> => {
-  const allTrends = await loadJSON<any>('trends.json');
-  return getFilteredData<ConversionTrendResponse>(allTrends, filters);
+  return loadSection<ConversionTrendResponse>('trends', filters);
 };
 
 /**